@@ -0,0 +1,106 @@
+"""
+Filtering ads in the browser vs. in SQL.
+
+"before": GET /ads returns the whole catalog and the AdFilters criteria are
+applied to the JSON, as MapBeerSheva.jsx does. "after": the same criteria
+are sent as /ads query parameters, with and without the ads indexes.
+
+Run from the backend folder:
+    python -m benchmarks.bench_ad_filters --ads 50000
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import temp_database, fill_ads, client_for
+import models
+
+CASES = {
+    "sale 1-1.5M, 4+ rooms": {"ad_type": "מכירה", "min_price": 1_000_000, "max_price": 1_500_000, "min_rooms": 4},
+    "rent <= 4000, parking": {"ad_type": "השכרה", "max_price": 4000, "features": ["has_parking"]},
+    "houses with garden": {"property_type": "house", "features": ["has_garden"]},
+}
+
+
+def browser_filter(ads, params):
+    """The filter from MapBeerSheva.jsx, on the full /ads payload"""
+    def keep(ad):
+        if params.get("min_price") and ad["price"] < params["min_price"]:
+            return False
+        if params.get("max_price") and ad["price"] > params["max_price"]:
+            return False
+        if params.get("ad_type") and ad["ad_type"] != params["ad_type"]:
+            return False
+        if params.get("min_rooms") and ad["rooms"] < params["min_rooms"]:
+            return False
+        if params.get("property_type") and ad["property_type"] != params["property_type"]:
+            return False
+        return all(ad[f] for f in params.get("features", []))
+    return [ad for ad in ads if keep(ad)]
+
+
+def sql_only(session_factory, params):
+    """Time of the filtered query alone, without serialization"""
+    from main import apply_ad_filters
+    filters = dict.fromkeys(("min_price", "max_price", "ad_type", "property_type", "min_rooms",
+                             "max_rooms", "max_size", "start_date", "end_date"))
+    filters["features"] = []
+    filters.update(params)
+    db = session_factory()
+    try:
+        return len(apply_ad_filters(db.query(models.Ad), filters).all())
+    finally:
+        db.close()
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ads", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine, session_factory = temp_database()
+    fill_ads(session_factory, args.ads)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    client = client_for(session_factory)
+
+    print(f"ads: {args.ads}\n")
+    print(f"{'case':26} {'mode':16} {'ms':>9} {'query ms':>9} {'bytes':>12} {'rows':>7}")
+    for name, params in CASES.items():
+        def before():
+            resp = client.get("/ads")
+            return len(resp.content), browser_filter(resp.json(), params)
+        t, (size, rows) = timed(before, args.repeat)
+        q, _ = timed(lambda: len(session_factory().query(models.Ad).all()), args.repeat)
+        print(f"{name:26} {'browser filter':16} {t * 1000:9.1f} {q * 1000:9.1f} {size:12,} {len(rows):7}")
+
+        with engine.begin() as conn:
+            for index in models.Ad.__table__.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        t, resp = timed(lambda: client.get("/ads", params=params), args.repeat)
+        q, _ = timed(lambda: sql_only(session_factory, params), args.repeat)
+        print(f"{'':26} {'SQL, no index':16} {t * 1000:9.1f} {q * 1000:9.1f} {len(resp.content):12,} {len(resp.json()):7}")
+
+        for index in models.Ad.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        t, resp = timed(lambda: client.get("/ads", params=params), args.repeat)
+        q, _ = timed(lambda: sql_only(session_factory, params), args.repeat)
+        print(f"{'':26} {'SQL + indexes':16} {t * 1000:9.1f} {q * 1000:9.1f} {len(resp.content):12,} {len(resp.json()):7}")
+        assert sorted(a["id"] for a in resp.json()) == sorted(a["id"] for a in rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Per-keystroke latency of the /autocomplete prefix index
+(utils.autocomplete.PrefixIndex) on synthetic POI names and ad addresses.
+
+Every query is typed one character at a time, as the search box sends
+it, right after the index is built and again after a round of
+incremental inserts and deletes.
+
+Run from the backend folder:
+    python -m benchmarks.bench_autocomplete
+    python -m benchmarks.bench_autocomplete --pois 100000 --ads 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.autocomplete import Entry, PrefixIndex, ad_entry
+
+PREFIXES = ["בית ספר", "גן ילדים", "פארק", "קניון", "בית כנסת", "מרפאת", "סופרמרקט", "קפה", "מסעדת", "ספריית"]
+STREETS = ["הרצל", "ויצמן", "רגר", "טוביהו", "יהודה הלוי", "בן גוריון", "הנשיא", "אלון", "השקמה", "הדקל"]
+QUERIES = ["בית ספר הרצל", "קניון הנגב", "הרצל 12", "רגר", "ספריית השקמה", "קפה"]
+
+
+def entries(pois, ads, seed=0):
+    rng = random.Random(seed)
+    for i in range(pois):
+        name = f"{rng.choice(PREFIXES)} {rng.choice(STREETS)} {rng.randrange(1, 200)}"
+        yield ("poi", i), Entry(name, "school", 31.25, 34.79, None, "poi", 1)
+    for i in range(ads):
+        address = f"{rng.choice(STREETS)} {rng.randrange(1, 120)}, באר שבע"
+        yield ("ad", f"{address} {i}"), ad_entry(address, 31.25, 34.79, rng.randrange(1, 5))
+
+
+def keystroke_ms(index):
+    timings = []
+    for q in QUERIES:
+        for end in range(1, len(q) + 1):
+            start = time.perf_counter()
+            index.search(q[:end], 10)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pois", type=int, default=500_000)
+    parser.add_argument("--ads", type=int, default=50_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = PrefixIndex(entries(args.pois, args.ads))
+    print(f"{len(index.entries)} entries, {len(index.keys)} keys, built in {time.perf_counter() - start:.1f} s\n")
+
+    print(f"{'keystrokes':16} {'median ms':>10} {'p95 ms':>8} {'max ms':>8}")
+    report("after build", keystroke_ms(index))
+
+    timings = {"insert": [], "delete": []}
+    for i in range(200):
+        start = time.perf_counter()
+        index.put(("poi", -i - 1), Entry(f"קניון חדש {i}", "shopping", 31.25, 34.79, None, "poi", 1))
+        timings["insert"].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        index.remove(("poi", i * 7))
+        timings["delete"].append((time.perf_counter() - start) * 1000)
+    report("after changes", keystroke_ms(index))
+    print()
+    for name, values in timings.items():
+        report(name, values)
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    print(f"{name:16} {statistics.median(timings):10.3f} {timings[int(len(timings) * 0.95)]:8.3f} {timings[-1]:8.3f}")
+
+if __name__ == "__main__":
+    main()
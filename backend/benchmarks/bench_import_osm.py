@@ -0,0 +1,72 @@
+"""
+Throughput and peak memory of import_osm.py on a synthetic extract:
+mostly untagged nodes, some ways, and a few percent of them POIs.
+
+Pass --extract to import a real file (e.g. israel-latest.osm.pbf from
+Geofabrik) into a temporary SQLite database instead.
+
+Run from the backend folder:
+    python -m benchmarks.bench_import_osm
+    python -m benchmarks.bench_import_osm --nodes 5000000
+    python -m benchmarks.bench_import_osm --extract israel-latest.osm.pbf
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+from benchmarks.common import temp_database
+from import_osm import import_osm_data
+
+POI_TAGS = [("amenity", "school"), ("amenity", "pharmacy"), ("highway", "bus_stop"), ("amenity", "cafe"),
+            ("shop", "supermarket"), ("amenity", "bank")]
+STREETS = ["הרצל", "רגר", "טוביהו", "יהודה הלוי", "בן גוריון"]
+
+
+def write_extract(path, nodes, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(1, nodes + 1):
+            lat, lon = rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.9)
+            if rng.random() < 0.03:
+                key, value = rng.choice(POI_TAGS)
+                f.write(f'<node id="{i}" lat="{lat:.7f}" lon="{lon:.7f}"><tag k="{key}" v="{value}"/>'
+                        f'<tag k="name" v="{rng.choice(STREETS)} {i}"/></node>\n')
+            else:
+                f.write(f'<node id="{i}" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+        for w in range(1, nodes // 10 + 1):
+            start = rng.randrange(1, nodes - 5)
+            refs = "".join(f'<nd ref="{ref}"/>' for ref in range(start, start + 5))
+            tag = '<tag k="leisure" v="park"/>' if rng.random() < 0.02 else '<tag k="building" v="yes"/>'
+            f.write(f'<way id="{w}">{refs}{tag}</way>\n')
+        f.write("</osm>\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=1_000_000)
+    parser.add_argument("--extract")
+    args = parser.parse_args()
+
+    path = args.extract
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(prefix="smartestate-osm-"), "synthetic.osm")
+        write_extract(path, args.nodes)
+    print(f"{path}: {os.path.getsize(path) / 1e6:.0f} MB")
+
+    _, Session = temp_database()
+    db = Session()
+    start = time.perf_counter()
+    count = import_osm_data(path, db)
+    seconds = time.perf_counter() - start
+    db.close()
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\n{count} POIs in {seconds:.1f}s, peak RSS {peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
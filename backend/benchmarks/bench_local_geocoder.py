@@ -0,0 +1,79 @@
+"""
+Per-lookup latency of the offline geocoder (utils.local_geocoder) on
+synthetic address points, roughly Israel-sized by default.
+
+Pass --index to measure an index built from a real extract instead.
+
+Run from the backend folder:
+    python -m benchmarks.bench_local_geocoder
+    python -m benchmarks.bench_local_geocoder --index addresses.npz
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.local_geocoder import AddressIndex
+
+CITIES = ["באר שבע", "תל אביב", "ירושלים", "חיפה", "אשדוד", "נתניה", "אופקים", "דימונה", "ערד", "אילת"]
+WORDS = ["הרצל", "ויצמן", "רגר", "טוביהו", "יהודה", "הלוי", "בן", "גוריון", "הנשיא", "אלון", "השקמה",
+         "הדקל", "הגפן", "התאנה", "הזית", "הרימון", "רמב\"ם", "ז'בוטינסקי", "שדרות", "דרך", "סמטת", "כיכר"]
+LOOKUPS = 2000
+
+
+def synthetic_rows(streets_per_city, numbers_per_street, seed=0):
+    rng = random.Random(seed)
+    for city in CITIES:
+        lat0, lon0 = rng.uniform(29.6, 33.0), rng.uniform(34.3, 35.5)
+        for s in range(streets_per_city):
+            street = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {s}"
+            lat, lon = lat0 + rng.uniform(-0.05, 0.05), lon0 + rng.uniform(-0.05, 0.05)
+            for n in range(1, numbers_per_street + 1):
+                yield lat + n * 1e-5, lon + n * 1e-5, street, str(n), city
+
+
+def per_lookup_us(run, queries):
+    start = time.perf_counter()
+    for query in queries:
+        run(query)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index")
+    parser.add_argument("--streets-per-city", type=int, default=2000)
+    parser.add_argument("--numbers-per-street", type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.index:
+        index = AddressIndex.load(args.index)
+    else:
+        index = AddressIndex.from_rows(synthetic_rows(args.streets_per_city, args.numbers_per_street))
+    print(f"{len(index.latitudes)} addresses, {len(index.street_names)} streets, "
+          f"index ready in {time.perf_counter() - start:.1f} s\n")
+
+    rng = random.Random(1)
+    picks = [rng.randrange(len(index.latitudes)) for _ in range(LOOKUPS)]
+
+    def full(i):
+        street = index.streets[i]
+        return f"{index.street_names[street]} {index.housenumbers[i]}, {index.cities[index.street_cities[street]]}"
+
+    cases = {
+        "forward, street + number + city": [full(i) for i in picks],
+        "forward, street prefix": [index.street_names[index.streets[i]][:6] for i in picks],
+        "forward, misspelled street": [index.street_names[index.streets[i]].replace("ה", "", 1) + " 3" for i in picks],
+    }
+    print(f"{'lookup':34} {'us/lookup':>10}")
+    for name, queries in cases.items():
+        print(f"{name:34} {per_lookup_us(index.search, queries):10.1f}")
+    points = [(float(index.latitudes[i]) + 1e-5, float(index.longitudes[i])) for i in picks]
+    print(f"{'reverse':34} {per_lookup_us(lambda p: index.nearest(*p), points):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
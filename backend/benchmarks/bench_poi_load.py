@@ -0,0 +1,80 @@
+"""
+Writing POIs: one ORM object and db.add per element (what fetch_pois.py
+did) against utils.poi_loader's batched executemany / COPY.
+
+The elements are synthetic Overpass answers turned into rows by
+fetch_pois.element_row. The ORM path runs on the first --orm-rows only
+and its total is extrapolated. Pass --database-url to write to a real
+database (COPY on PostgreSQL); rows are rolled back afterwards.
+
+Run from the backend folder:
+    python -m benchmarks.bench_poi_load
+    python -m benchmarks.bench_poi_load --rows 2000000 --database-url postgresql://...
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import temp_database
+from fetch_pois import POI_TYPES, element_row
+from models import POI
+from utils import poi_loader
+
+STREETS = ["הרצל", "רגר", "טוביהו", "יהודה הלוי", "בן גוריון", "הנשיא", "ויצמן"]
+
+
+def elements(count, seed=0):
+    rng = random.Random(seed)
+    types = list(POI_TYPES)
+    for i in range(count):
+        poi_type = rng.choice(types)
+        tags = {"amenity": poi_type, "addr:street": rng.choice(STREETS)}
+        if rng.random() < 0.6:
+            tags["name"] = f"{POI_TYPES[poi_type]['name']} {rng.choice(STREETS)} {rng.randrange(1, 50)}"
+        yield poi_type, {"type": "node", "id": i, "lat": rng.uniform(29.5, 33.3), "lon": rng.uniform(34.2, 35.9),
+                         "tags": tags}
+
+
+def rows(count):
+    for poi_type, element in elements(count):
+        yield element_row(element, poi_type, POI_TYPES[poi_type])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--orm-rows", type=int, default=50_000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    if args.database_url:
+        Session = sessionmaker(bind=create_engine(args.database_url))
+    else:
+        _, Session = temp_database()
+
+    db = Session()
+    orm_rows = list(rows(args.orm_rows))
+    start = time.perf_counter()
+    for name, poi_type, lat, lon, address, tags, osm_type, osm_id in orm_rows:
+        db.add(POI(name=name, type=poi_type, latitude=lat, longitude=lon, address=address, tags=tags,
+                   osm_type=osm_type, osm_id=osm_id))
+    db.flush()
+    orm_seconds = time.perf_counter() - start
+    db.rollback()
+
+    all_rows = list(rows(args.rows))
+    count, seconds = poi_loader.load(db, all_rows)
+    db.rollback()
+    db.close()
+
+    orm_rate = len(orm_rows) / orm_seconds
+    print(f"{'path':22} {'rows/s':>10} {f'{args.rows} rows':>14}")
+    print(f"{'ORM db.add':22} {orm_rate:10,.0f} {args.rows / orm_rate:13.1f}s (extrapolated)")
+    print(f"{'poi_loader.load':22} {count / seconds:10,.0f} {seconds:13.1f}s")
+
+
+if __name__ == "__main__":
+    main()
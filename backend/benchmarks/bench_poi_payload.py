@@ -0,0 +1,80 @@
+"""
+/map/pois response size with and without the fields / include_tags
+projection, for all layers.
+
+By default the POIs are synthetic, with tag sets modelled on the OSM tags
+fetch_pois.py stores for Beer Sheva. Pass --database-url to measure a real
+pois table instead (e.g. the production database after fetch_pois.py).
+
+Run from the backend folder:
+    python -m benchmarks.bench_poi_payload
+    python -m benchmarks.bench_poi_payload --database-url postgresql://...
+"""
+import argparse
+import gzip
+import json
+import random
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import temp_database, client_for
+from fetch_pois import POI_TYPES
+import models
+
+# What POIMarkers.jsx reads, and the tags a popup would add
+CASES = {
+    "everything": {},
+    "markers (id, name, amenity)": {"fields": ["id", "name", "amenity"]},
+    "markers + 3 tags": {"fields": ["id", "name", "amenity", "tags"],
+                         "include_tags": ["name", "opening_hours", "wheelchair"]},
+}
+
+COMMON_TAGS = {
+    "addr:city": "באר שבע", "addr:street": "שדרות רגר", "addr:housenumber": "12",
+    "source": "survey", "check_date": "2023-05-01",
+}
+OPTIONAL_TAGS = {
+    "opening_hours": "Su-Th 08:00-16:00", "wheelchair": "yes", "phone": "+972-8-6000000",
+    "website": "https://example.org", "operator": "עיריית באר שבע", "name:en": "Example",
+    "name:ar": "مثال", "building": "yes", "wikidata": "Q123456", "isced:level": "1",
+}
+
+
+def synthetic_pois(count_per_type, seed=0):
+    rng = random.Random(seed)
+    for poi_type in POI_TYPES:
+        for i in range(count_per_type):
+            tags = {"amenity": poi_type, "name": f"{POI_TYPES[poi_type]['name']} {i}", **COMMON_TAGS}
+            tags.update(rng.sample(sorted(OPTIONAL_TAGS.items()), rng.randrange(0, len(OPTIONAL_TAGS))))
+            yield {"name": tags["name"], "type": poi_type, "latitude": rng.uniform(31.2, 31.3),
+                   "longitude": rng.uniform(34.7, 34.9), "tags": json.dumps(tags, ensure_ascii=False)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url")
+    parser.add_argument("--pois-per-type", type=int, default=150)
+    args = parser.parse_args()
+
+    if args.database_url:
+        session_factory = sessionmaker(bind=create_engine(args.database_url))
+    else:
+        _, session_factory = temp_database()
+        db = session_factory()
+        db.execute(models.POI.__table__.insert(), list(synthetic_pois(args.pois_per_type)))
+        db.commit()
+        db.close()
+
+    client = client_for(session_factory)
+    layers = list(POI_TYPES)
+    baseline = None
+    print(f"{'payload':30} {'bytes':>11} {'gzip':>10} {'vs all':>7}")
+    for name, projection in CASES.items():
+        body = client.post("/map/pois", json={"layers": layers, **projection}).content
+        baseline = baseline or len(body)
+        print(f"{name:30} {len(body):11} {len(gzip.compress(body)):10} {len(body) / baseline:7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+POI name search: the old `name ILIKE '%q%'` scan against the trigram
+index behind /search (utils.poi_search), on synthetic Hebrew POI names.
+
+Prints the index build time once, then per query the median latency and
+hit count of each. ILIKE has no ranking and misses spelling variants, so
+its hit counts are only a reference.
+
+Run from the backend folder:
+    python -m benchmarks.bench_poi_search
+    python -m benchmarks.bench_poi_search --pois 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import temp_database
+from utils import poi_search
+from utils.hebrew import normalize
+import models
+
+PREFIXES = ["בית ספר", "גן ילדים", "פארק", "קניון", "בית כנסת", "מרפאת", "סופרמרקט", "קפה", "מסעדת", "ספריית"]
+WORDS = ["רמות", "נווה", "אשל", "הנגב", "יעלים", "הדקל", "רגר", "טוביהו", "אלון", "שקמה", "הרצל", "ויצמן",
+         "בן גוריון", "רינה", "צ׳יפס", "השלום", "החלוצים", "קק״ל", "יהודה", "אברהם"]
+QUERIES = ["בית ספר רמות", "קניון הנגב", "נגב", "בית כנסת", "קפה", "צ'יפס", "ביה\"ס", "רמות 17"]
+REPEATS = 5
+
+
+def synthetic_pois(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        name = f"{rng.choice(PREFIXES)} {rng.choice(WORDS)} {rng.randrange(1, 200)}"
+        yield {"name": name, "name_normalized": normalize(name), "type": "school",
+               "latitude": rng.uniform(31.2, 31.3), "longitude": rng.uniform(34.7, 34.9)}
+
+
+def median_ms(run):
+    timings, result = [], None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pois", type=int, default=500_000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    _, session_factory = temp_database()
+    db = session_factory()
+    rows = list(synthetic_pois(args.pois))
+    for start in range(0, len(rows), 50_000):
+        db.execute(insert(models.POI), rows[start:start + 50_000])
+    db.commit()
+
+    start = time.perf_counter()
+    poi_search.get_index(db)
+    print(f"{args.pois} POIs, index built in {time.perf_counter() - start:.1f} s\n")
+
+    print(f"{'query':16} {'ilike ms':>9} {'hits':>7} {'trigram ms':>11} {'hits':>5}")
+    for q in QUERIES:
+        ilike_ms, ilike = median_ms(lambda: db.query(models.POI).filter(models.POI.name.ilike(f"%{q}%")).all())
+        trigram_ms, ranked = median_ms(lambda: poi_search.search(db, q, args.limit))
+        print(f"{q:16} {ilike_ms:9.1f} {len(ilike):7} {trigram_ms:11.1f} {len(ranked):5}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
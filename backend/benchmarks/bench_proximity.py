@@ -0,0 +1,78 @@
+"""
+Proximity scoring over every POI layer: per-type KD-trees against a
+brute-force haversine scan of all ad/POI pairs.
+
+Run from the backend folder:
+    python -m benchmarks.bench_proximity --ads 50000 --pois-per-layer 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_pois import POI_TYPES
+from utils.poi_index import EARTH_RADIUS_M, PROXIMITY_MAX, PROXIMITY_POINTS, POIIndex
+
+
+def brute_force_scores(pois, layers, lats, lons, chunk=2000):
+    scores = np.zeros(len(lats), dtype=np.int64)
+    lat1, lon1 = np.radians(lats)[:, None], np.radians(lons)[:, None]
+    for layer in layers:
+        points = np.array([(p[2], p[3]) for p in pois if p[1] == layer])
+        lat2, lon2 = np.radians(points[:, 0])[None, :], np.radians(points[:, 1])[None, :]
+        nearest = np.empty(len(lats))
+        for start in range(0, len(lats), chunk):
+            a, b = lat1[start:start + chunk], lon1[start:start + chunk]
+            h = np.sin((lat2 - a) / 2) ** 2 + np.cos(a) * np.cos(lat2) * np.sin((lon2 - b) / 2) ** 2
+            nearest[start:start + chunk] = (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h))).min(axis=1)
+        points = np.zeros(len(lats), dtype=np.int64)
+        for radius, value in reversed(PROXIMITY_POINTS):
+            points[nearest <= radius] = value
+        scores += points
+    return np.minimum(scores, PROXIMITY_MAX)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ads", type=int, default=50_000)
+    parser.add_argument("--pois-per-layer", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    layers = list(POI_TYPES)
+    pois = [
+        (i, layers[i % len(layers)], rng.uniform(31.2, 31.3), rng.uniform(34.7, 34.9))
+        for i in range(args.pois_per_layer * len(layers))
+    ]
+    lats = rng.uniform(31.2, 31.3, args.ads)
+    lons = rng.uniform(34.7, 34.9, args.ads)
+
+    start = time.perf_counter()
+    expected = brute_force_scores(pois, layers, lats, lons)
+    brute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = POIIndex(pois)
+    build_time = time.perf_counter() - start
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        scores = index.proximity_scores(layers, lats, lons)
+        best = min(best, time.perf_counter() - start)
+
+    assert scores.tolist() == expected.tolist()
+
+    print(f"ads x layers x POIs:     {args.ads} x {len(layers)} x {len(pois)}")
+    print(f"brute-force haversine:   {brute_time * 1000:9.1f} ms")
+    print(f"KD-tree build (once):    {build_time * 1000:9.1f} ms")
+    print(f"KD-tree proximity:       {best * 1000:9.1f} ms")
+    print(f"speedup:                 {brute_time / best:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
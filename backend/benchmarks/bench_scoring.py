@@ -0,0 +1,85 @@
+"""
+Compare the per-ad score_apartment loop with the vectorized AdCatalog.
+
+Run from the backend folder:
+    python -m benchmarks.bench_scoring --ads 50000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ranking import score_apartment, calculate_star_rating
+from utils.batch_ranking import AdCatalog, star_ratings
+
+PROPERTY_TYPES = ["house", "apartment", "penthouse", "garden_apartment"]
+
+
+def make_ads(count, rng):
+    return [
+        SimpleNamespace(
+            property_type=rng.choice(PROPERTY_TYPES),
+            price=rng.randrange(2000, 3_000_000, 500),
+            rooms=rng.choice([1, 2, 2.5, 3, 3.5, 4, 5]),
+            has_parking=rng.random() < 0.5,
+            has_elevator=rng.random() < 0.5,
+            has_balcony=rng.random() < 0.5,
+            has_garden=rng.random() < 0.3,
+            pets_allowed=rng.random() < 0.4,
+            accessibility=rng.random() < 0.2,
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ads", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    ads = make_ads(args.ads, rng)
+    prefs = SimpleNamespace(
+        house_type="apartment",
+        budget_min=3000,
+        budget_max=1_500_000,
+        rooms="3",
+        features='["parking", "elevator", "balcony"]',
+    )
+
+    # score_apartment prints a trace per ad; send it to a buffer so the
+    # comparison measures scoring and not terminal I/O
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [score_apartment(ad, prefs) for ad in ads]
+    expected_stars = [calculate_star_rating(s) for s in expected]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    catalog = AdCatalog(ads)
+    build_time = time.perf_counter() - start
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        scores = catalog.score(prefs)
+        stars = star_ratings(scores)
+        best = min(best, time.perf_counter() - start)
+
+    assert scores.tolist() == expected and stars == expected_stars
+
+    print(f"ads:                     {args.ads}")
+    print(f"per-ad loop:             {loop_time * 1000:9.1f} ms")
+    print(f"catalog build (once):    {build_time * 1000:9.1f} ms")
+    print(f"vectorized score+stars:  {best * 1000:9.1f} ms")
+    print(f"speedup (scoring only):  {loop_time / best:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Peak memory and latency of the streamed list endpoints against building
+the whole list and letting FastAPI encode it (the previous behaviour).
+
+The client reads each response chunk by chunk and throws the bytes away,
+so the peak measured with tracemalloc is the server's. Streaming should
+stay flat as the row count grows.
+
+Run from the backend folder:
+    python -m benchmarks.bench_streaming --rows 100000
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import tracemalloc
+
+import httpx
+import uvicorn
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from benchmarks.common import temp_database, fill_ads
+import models
+
+
+def fill_pois(session_factory, count, seed=0):
+    rng = random.Random(seed)
+    db = session_factory()
+    db.execute(models.POI.__table__.insert(), [
+        {"name": f"גן {i}", "type": "park", "latitude": rng.uniform(31.2, 31.3),
+         "longitude": rng.uniform(34.7, 34.9), "tags": json.dumps({"leisure": "park"}, ensure_ascii=False)}
+        for i in range(count)
+    ])
+    db.commit()
+    db.close()
+
+
+def add_list_routes(app):
+    """The endpoints as they were: full list in memory, default encoder"""
+    from main import ad_to_dict, get_db
+    from utils.geojson import poi_to_feature
+
+    @app.get("/bench/list/ads")
+    def list_ads(db: Session = Depends(get_db)):
+        return [ad_to_dict(ad) for ad in db.query(models.Ad).all()]
+
+    @app.post("/bench/list/pois")
+    def list_pois(db: Session = Depends(get_db)):
+        return {"type": "FeatureCollection",
+                "features": [poi_to_feature(poi) for poi in db.query(models.POI).all()]}
+
+
+def serve(app):
+    """Run the app with uvicorn in a background thread; returns its base URL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def read(client, method, path, **kwargs):
+    """(first byte s, total s, body bytes), reading the body chunk by chunk"""
+    start = time.perf_counter()
+    first_byte, size = None, 0
+    with client.stream(method, path, **kwargs) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+
+def measure(client, method, path, **kwargs):
+    """(first byte ms, total ms, peak MB, body bytes); tracemalloc slows
+    everything down, so the timings come from a separate untraced run"""
+    first_byte, total, size = read(client, method, path, **kwargs)
+    tracemalloc.start()
+    read(client, method, path, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_byte * 1000, total * 1000, peak / 2**20, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    from main import app, get_db
+    add_list_routes(app)
+    client = httpx.Client(base_url=serve(app), timeout=None)
+
+    print(f"{'endpoint':10} {'rows':>7} {'mode':9} {'first byte ms':>14} {'total ms':>9} {'peak MB':>8} {'bytes':>11}")
+    for rows in sorted({args.rows // 10, args.rows // 2, args.rows}):
+        _, session_factory = temp_database()
+        fill_ads(session_factory, rows)
+        fill_pois(session_factory, rows)
+
+        def override_get_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+        app.dependency_overrides[get_db] = override_get_db
+
+        for name, method, path, kwargs in (
+            ("/ads", "GET", "/ads", {}),
+            ("/map/pois", "POST", "/map/pois", {"json": {"layers": ["park"]}}),
+        ):
+            for mode, url in (("list", "/bench/list" + path[path.rindex("/"):]), ("streamed", path)):
+                first, total, peak, size = measure(client, method, url, **kwargs)
+                print(f"{name:10} {rows:7} {mode:9} {first:14.1f} {total:9.1f} {peak:8.1f} {size:11}")
+
+if __name__ == "__main__":
+    main()
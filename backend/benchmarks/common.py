@@ -0,0 +1,84 @@
+"""Shared setup for the benchmarks that go through the FastAPI app."""
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Keep main.py away from the project's own database
+os.environ.setdefault("TESTING", "1")
+os.environ.setdefault("USE_SQLITE_FOR_TESTS", "1")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base
+
+PROPERTY_TYPES = ["apartment", "house", "penthouse", "garden_apartment", "studio"]
+AD_TYPES = ["מכירה", "השכרה"]
+
+
+def temp_database():
+    """A fresh SQLite file with the full schema; returns (engine, session factory)"""
+    path = os.path.join(tempfile.mkdtemp(prefix="smartestate-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def ad_rows(count, seed=0):
+    """Synthetic ads spread over the Beer Sheva bounding box, as insert dicts"""
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    for i in range(count):
+        ad_type = rng.choice(AD_TYPES)
+        yield {
+            "user_id": 1,
+            "publisher_name": f"מפרסם {i}",
+            "contact_phone": "050-0000000",
+            "ad_type": ad_type,
+            "property_type": rng.choice(PROPERTY_TYPES),
+            "address": f"רחוב {rng.randrange(1, 400)} {rng.randrange(1, 80)}, באר שבע",
+            "latitude": rng.uniform(31.2, 31.3),
+            "longitude": rng.uniform(34.7, 34.9),
+            "rooms": rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 6]),
+            "size": rng.randrange(25, 250),
+            "price": rng.randrange(400_000, 4_000_000, 1000) if ad_type == "מכירה" else rng.randrange(1500, 12_000, 50),
+            "floor": rng.randrange(0, 15),
+            "has_elevator": rng.random() < 0.5,
+            "has_parking": rng.random() < 0.5,
+            "has_balcony": rng.random() < 0.6,
+            "has_garden": rng.random() < 0.15,
+            "pets_allowed": rng.random() < 0.3,
+            "accessibility": rng.random() < 0.2,
+            "publish_date": start + timedelta(days=rng.randrange(0, 600)),
+            "description": "דירה מרווחת ומוארת " * rng.randrange(1, 6),
+        }
+
+
+def fill_ads(session_factory, count, seed=0):
+    db = session_factory()
+    db.add(models.Users(email="bench@example.com", first_name="Bench", last_name="User",
+                        password="bench", is_admin=True))
+    db.commit()
+    db.execute(models.Ad.__table__.insert(), list(ad_rows(count, seed)))
+    db.commit()
+    db.close()
+
+
+def client_for(session_factory):
+    """TestClient for main.app reading from the given session factory"""
+    from fastapi.testclient import TestClient
+    from main import app, get_db
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
@@ -1,10 +1,25 @@
 import requests
 import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from database import SessionLocal
-from models import POI
+from utils import poi_dedupe, poi_distances, poi_layers, poi_loader, poi_refresh, versions
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+# השרת הציבורי נותן שני slots לכל כתובת IP, שאילתות נוספות מקבלות 429
+OVERPASS_WORKERS = int(os.getenv("OVERPASS_WORKERS", "2"))
+OVERPASS_RETRIES = int(os.getenv("OVERPASS_RETRIES", "4"))
+OVERPASS_BACKOFF_SECONDS = float(os.getenv("OVERPASS_BACKOFF", "2"))
+OVERPASS_TIMEOUT_SECONDS = 60
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# תיבת הגבולות של באר שבע, הקואורדינטות נלקחו מ-OpenStreetMap
+BBOX = "31.2,34.7,31.3,34.9"  # min_lat,min_lon,max_lat,max_lon
+
 # הגדרת סוגי המקומות שאנחנו רוצים למשוך
 POI_TYPES = {
     'school': {
@@ -109,83 +124,139 @@ POI_TYPES = {
     }
 }
 
-def fetch_pois_from_osm():
-    db = SessionLocal()
+def build_query(tags, bbox):
+    """One Overpass query for all of a type's tags: the union of node/way/relation per tag"""
+    parts = "\n".join(
+        f"    {kind}{tag}({bbox});" for tag in tags for kind in ("node", "way", "relation")
+    )
+    return f"[out:json][timeout:{OVERPASS_TIMEOUT_SECONDS}];\n(\n{parts}\n);\nout body center qt;"
+
+
+def post_query(url, query, retries=OVERPASS_RETRIES, backoff=OVERPASS_BACKOFF_SECONDS):
+    """
+    Send one Overpass query and return its elements.
+
+    Busy answers (429, 502-504) and connection errors are retried up to
+    `retries` times, waiting backoff * 2**attempt seconds with jitter, or
+    as long as the server's Retry-After asks.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = requests.post(url, data={"data": query}, timeout=OVERPASS_TIMEOUT_SECONDS + 10)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json().get("elements", [])
+            error = requests.HTTPError(f"{response.status_code} from Overpass", response=response)
+            retry_after = response.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error, retry_after = e, None
+        if attempt == retries:
+            raise error
+        if retry_after and retry_after.isdigit():
+            wait = float(retry_after)
+        else:
+            wait = backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+        time.sleep(wait)
+
+
+def element_row(element, poi_type, config):
+    """An Overpass element as a utils.poi_loader row, None without coordinates"""
+    if element['type'] == 'node':
+        lat = element.get('lat')
+        lon = element.get('lon')
+    else:  # way or relation
+        lat = element.get('center', {}).get('lat')
+        lon = element.get('center', {}).get('lon')
+    if not (lat and lon):
+        return None
+    tags = element.get('tags', {})
+    name = tags.get('name:he') or tags.get('name') or config['name'] + poi_dedupe.UNNAMED_SUFFIX
+    return (name, poi_type, lat, lon, tags.get('addr:street'), json.dumps(tags, ensure_ascii=False),
+            element['type'], element['id'])
+
+
+def fetch_all(url=OVERPASS_URL, bbox=BBOX, workers=OVERPASS_WORKERS, poi_types=None):
+    """
+    {poi type: elements, or the exception that ended its query}, one
+    query per type, at most `workers` queries in flight at once.
+    """
+    poi_types = POI_TYPES if poi_types is None else poi_types
+
+    def fetch(item):
+        poi_type, config = item
+        started = time.monotonic()
+        try:
+            elements = post_query(url, build_query(config['tags'], bbox))
+        except Exception as e:
+            print(f"  Error fetching {poi_type}: {str(e)}")
+            return poi_type, e
+        print(f"  {poi_type}: {len(elements)} elements in {time.monotonic() - started:.1f}s")
+        return poi_type, elements
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overpass") as pool:
+        return dict(pool.map(fetch, poi_types.items()))
+
+
+def store_pois(db, poi_rows, keep_types=()):
+    """
+    Stage poi_rows (utils.poi_loader tuples) without duplicates, apply them
+    to pois, and refresh what depends on the changed layers. Returns the
+    number of rows staged.
+    """
+    # אותו אלמנט או אותו שם במרחק של כמה מטרים: נשמר פעם אחת בכל סוג
+    deduper = poi_dedupe.Deduper()
+    staged, seconds = poi_refresh.stage(db, poi_dedupe.dedupe(poi_rows, deduper))
+    print(f"Staged {poi_loader.rate(staged, seconds)}")
+    for poi_type, dropped in deduper.dropped.most_common():
+        print(f"  {poi_type}: merged {dropped} duplicates")
+    counts, changed_types = poi_refresh.apply(db, keep_types=keep_types)
+    print(f"Applied: {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted")
+
+    if changed_types:
+        # הגרסה החדשה גורמת לכל worker של השרת לבנות מחדש את אינדקס ה-POI
+        versions.bump(db, "pois", *(poi_layers.version_name(layer) for layer in changed_types))
+        # מרחקים מכל מודעה לכל סוג POI, לפי הטבלה החדשה
+        rows = poi_distances.refresh_all(db)
+        print(f"Refreshed {rows} ad-to-POI distance rows")
+    return staged
+
+
+def fetch_pois_from_osm(db=None, url=OVERPASS_URL, bbox=BBOX, workers=OVERPASS_WORKERS):
+    """
+    Refresh the pois table from Overpass (see utils/poi_refresh.py). The
+    table only changes once everything is fetched, in one transaction,
+    and the rows of a type whose query failed are kept.
+    """
+    own_session = db is None
+    db = SessionLocal() if own_session else db
+    total_added = 0
     try:
-        # מחיקת כל הנתונים הקיימים
-        db.query(POI).delete()
-        db.commit()
-        print("Cleared existing POIs from database")
-        
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        total_added = 0
-        
-        # הגדרת תיבת הגבולות של באר שבע
-        # הקואורדינטות נלקחו מ-OpenStreetMap של באר שבע
-        bbox = "31.2,34.7,31.3,34.9"  # min_lat,min_lon,max_lat,max_lon
-        
-        for poi_type, config in POI_TYPES.items():
-            print(f"\nFetching {poi_type}...")
-            for tag in config['tags']:
-                # בניית שאילתת Overpass
-                query = f"""
-                [out:json][timeout:25];
-                (
-                    node{tag}({bbox});
-                    way{tag}({bbox});
-                    relation{tag}({bbox});
-                );
-                out body center qt;
-                """
-                
-                try:
-                    print(f"  Sending request for {tag}...")
-                    response = requests.post(overpass_url, data={"data": query})
-                    response.raise_for_status()
-                    data = response.json()
-                    elements_count = len(data.get('elements', []))
-                    print(f"  Received {elements_count} elements")
-                    
-                    added_count = 0
-                    for element in data.get('elements', []):
-                        if element['type'] == 'node':
-                            lat = element['lat']
-                            lon = element['lon']
-                        else:  # way or relation
-                            lat = element.get('center', {}).get('lat')
-                            lon = element.get('center', {}).get('lon')
-                        
-                        if lat and lon:
-                            name = (element.get('tags', {}).get('name:he') or 
-                                  element.get('tags', {}).get('name') or 
-                                  f"{config['name']} ללא שם")
-                            
-                            # יצירת רשומה חדשה
-                            poi = POI(
-                                name=name,
-                                type=poi_type,
-                                latitude=lat,
-                                longitude=lon,
-                                address=element.get('tags', {}).get('addr:street'),
-                                tags=json.dumps(element.get('tags', {}), ensure_ascii=False)
-                            )
-                            db.add(poi)
-                            added_count += 1
-                    
-                    db.commit()
-                    print(f"  Added {added_count} POIs to database")
-                    total_added += added_count
-                
-                except Exception as e:
-                    print(f"  Error fetching {poi_type} with tag {tag}: {str(e)}")
-                    print(f"  Query was: {query}")
-    
+        poi_refresh.ensure_osm_columns(db.get_bind())
+
+        print(f"Fetching {len(POI_TYPES)} POI types, {workers} at a time...")
+        started = time.monotonic()
+        results = fetch_all(url, bbox, workers)
+        failed = [poi_type for poi_type, result in results.items() if isinstance(result, Exception)]
+        print(f"Fetched in {time.monotonic() - started:.1f}s")
+
+        # סוגים שהשאילתה שלהם נכשלה נשארים כמו שהם
+        for poi_type in failed:
+            print(f"  Keeping existing {poi_type} POIs")
+        poi_rows = (
+            row
+            for poi_type, elements in results.items() if poi_type not in failed
+            for row in (element_row(e, poi_type, POI_TYPES[poi_type]) for e in elements) if row
+        )
+        total_added = store_pois(db, poi_rows, keep_types=failed)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         db.rollback()
     finally:
-        db.close()
-        print(f"\nTotal POIs added to database: {total_added}")
+        if own_session:
+            db.close()
+        print(f"\nTotal POIs fetched: {total_added}")
+    return total_added
 
 if __name__ == "__main__":
     print("Starting POI fetch from OpenStreetMap...")
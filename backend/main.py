@@ -1,18 +1,29 @@
-from fastapi import FastAPI, HTTPException, Depends, Request ,Query
+from fastapi import FastAPI, HTTPException, Depends, Request ,Query, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
-from typing import List, Annotated, Optional
+from typing import List, Annotated, Literal, Optional
 import models
 from database import engine, SessionLocal
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from geopy.geocoders import Nominatim
+import asyncio
 import json
 import requests
 from datetime import date
 import os
+from sqlalchemy import or_, and_, literal
 from sqlalchemy import JSON  # הוסף למעלה אם יש לך SQLAlchemy 1.3+ (אחרת נשתמש ב-Text)
-from utils.ranking import score_apartment, calculate_star_rating  
+from utils.ranking import FEATURE_TO_AD_FIELD
+from utils import autocomplete, clusters, geocode_cache, poi_distances, poi_layers, poi_refresh, poi_search, profile_cache, score_store, search_merge, tiles, versions
+from utils.pagination import encode_cursor, decode_cursor
+from utils.spatial import ensure_spatial_index, within_bbox
+from utils.streaming import stream_query
+from utils.conditional import make_etag, matches, not_modified
+from utils.geojson import feature_collection
+from utils.geocoder import Geocoder
+from utils.local_geocoder import LocalGeocoder
 
 
 
@@ -36,6 +47,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Search-Partial"],
 )
 
 
@@ -51,8 +63,22 @@ db_dependency = Annotated[Session, Depends(get_db)]
 # Only create tables if we're not in a test environment
 if not os.environ.get("TESTING"):
     models.Base.metadata.create_all(bind = engine)
-
-geolocator = Nominatim(user_agent="smartestate-app")
+    poi_refresh.ensure_osm_columns(engine)
+    # create_all skips tables that already exist, so add newer indexes explicitly
+    for index in (*models.Ad.__table__.indexes, *models.POI.__table__.indexes):
+        index.create(bind = engine, checkfirst = True)
+    ensure_spatial_index(engine)
+    poi_search.ensure_search_index(engine)
+    poi_search.warm(engine)
+    autocomplete.warm(engine)
+
+# Offline address index from utils/local_geocoder.py if configured, otherwise the public Nominatim
+if os.environ.get("LOCAL_GEOCODER_PATH"):
+    geolocator = LocalGeocoder.load(os.environ["LOCAL_GEOCODER_PATH"])
+else:
+    geolocator = Nominatim(user_agent="smartestate-app")
+
+geocoder = Geocoder(geolocator)
 
 class UserBase(BaseModel):
     email:EmailStr
@@ -89,6 +115,8 @@ class UserPreferencesRequest(BaseModel):
 class MapLayerRequest(BaseModel):
     layers: List[str]  # List of amenity types to show (e.g., ['school', 'kindergarten'])
     bbox: Optional[str] = None  # Optional bounding box for filtering
+    fields: Optional[List[Literal["id", "name", "amenity", "tags"]]] = None  # feature properties to send, default all
+    include_tags: Optional[List[str]] = None  # OSM tag keys to send (e.g. ['opening_hours']), default all
 
 class POIResponse(BaseModel):
     id: int
@@ -311,14 +339,17 @@ def change_password(request: Request, change_password_data: changePasswordReques
 
 
 @app.get("/reverse_geocode/")
-async def reverse_geocode(lat: float = Query(...), lon: float = Query(...)):
+async def reverse_geocode(db: db_dependency, lat: float = Query(...), lon: float = Query(...)):
     """
     Receives latitude & longitude and returns a textual address (reverse geocoding).
     """
-    location = geolocator.reverse((lat, lon), exactly_one=True, language="he")
-    if not location:
+    try:
+        address = await geocode_cache.reverse(db, lat, lon, geocoder)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Geocoding timed out")
+    if not address:
         raise HTTPException(status_code=404, detail="Address not found")
-    return {"address": location.address}
+    return {"address": address}
 @app.put("/update-profile/")
 def update_profile(request: Request, update_profile_data: UpdateProfileRequest, db: db_dependency):
     user = db.query(models.Users).filter(models.Users.email == update_profile_data.email).first()
@@ -328,6 +359,7 @@ def update_profile(request: Request, update_profile_data: UpdateProfileRequest,
     user.first_name = update_profile_data.first_name
     user.last_name = update_profile_data.last_name
     db.commit()
+    versions.bump(db, "users")
     db.refresh(user)
     return {
         "first_name": user.first_name,
@@ -358,8 +390,9 @@ async def save_user_preferences(request: Request, preferences: UserPreferencesRe
         existing_preferences.budget_min = preferences.budgetMin
         existing_preferences.budget_max = preferences.budgetMax
         existing_preferences.rooms = preferences.rooms
+        db_preferences = existing_preferences
     else:
-        new_preferences = models.UserPreferences(
+        db_preferences = models.UserPreferences(
             user_id=db_user.ID,
             who=preferences.who,
             house_type=preferences.houseType,
@@ -370,9 +403,13 @@ async def save_user_preferences(request: Request, preferences: UserPreferencesRe
             budget_max=preferences.budgetMax,
             rooms=preferences.rooms,
         )
-        db.add(new_preferences)
+        db.add(db_preferences)
 
     db.commit()
+    profile = profile_cache.compile_profile(db_preferences, db_user.ID)
+    score_store.rescore_user(db, profile)
+    versions.bump(db, "user_preferences")
+    profile_cache.store(db, db_user.email, profile)
     return {"message": "Preferences saved successfully"}
 
 @app.get("/user-preferences/")
@@ -462,38 +499,44 @@ async def get_map_layers(request: Request, db: db_dependency):
 @app.post("/map/pois")
 async def get_points_of_interest(request: Request, layer_request: MapLayerRequest, db: db_dependency):
     """Get points of interest for selected layers"""
-    if not layer_request.layers:
-        return {"features": []}
+    layers = list(dict.fromkeys(layer_request.layers or []))
+    layer_versions = poi_layers.layer_versions(db, layers)
+    fields, include_tags = poi_layers.projection(layer_request.fields, layer_request.include_tags)
+    etag = make_etag("map/pois", layers, layer_versions, fields, include_tags)
+    if matches(request, etag):
+        return not_modified(etag)
+
+    if not layers:
+        return JSONResponse({"features": []}, headers={"ETag": etag})
+
+    # Each layer is encoded once and cached, so this is just a concatenation
+    body = feature_collection(
+        poi_layers.layer_fragment(db, layer, version, fields, include_tags)
+        for layer, version in zip(layers, layer_versions)
+    )
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
-    # Query POIs from database based on requested layers
-    query = db.query(models.POI)
-    if layer_request.layers:
-        query = query.filter(models.POI.type.in_(layer_request.layers))
-    
-    pois = query.all()
-    
-    # Convert to GeoJSON
-    features = []
-    for poi in pois:
-        feature = {
-            "type": "Feature",
-            "properties": {
-                "id": str(poi.id),
-                "name": poi.name,
-                "amenity": poi.type,  # Using the POI type as amenity for frontend compatibility
-                "tags": json.loads(poi.tags) if poi.tags else {}
-            },
-            "geometry": {
-                "type": "Point",
-                "coordinates": [poi.longitude, poi.latitude]
-            }
-        }
-        features.append(feature)
-    
-    return {
-        "type": "FeatureCollection",
-        "features": features
-    }
+@app.get("/map/tiles/{z}/{x}/{y}")
+def get_poi_tile(
+    z: int, x: int, y: int, request: Request, db: db_dependency,
+    layers: str = Query(..., description="Comma-separated POI types"),
+):
+    """POIs of the requested layers inside one web-mercator tile, as GeoJSON"""
+    if not 0 <= z <= tiles.MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile")
+    requested = sorted({layer for layer in layers.split(",") if layer})
+
+    layer_versions = poi_layers.layer_versions(db, requested)
+    etag = make_etag("tile", z, x, y, requested, layer_versions)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if matches(request, etag):
+        return not_modified(etag, headers)
+
+    body = feature_collection(
+        tiles.layer_fragment(db, layer, z, x, y, version)
+        for layer, version in zip(requested, layer_versions)
+    )
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.get("/pois", response_model=List[POIResponse])
 def get_pois(db: db_dependency, type: Optional[str] = None):
@@ -523,6 +566,11 @@ def create_poi(poi: POIResponse, db: db_dependency):
     db_poi = models.POI(**poi.dict())
     db.add(db_poi)
     db.commit()
+    # The new version makes every worker rebuild its POI index
+    versions.bump(db, "pois", poi_layers.version_name(db_poi.type))
+    poi_distances.refresh_poi(db, db_poi.id, db_poi.type, (db_poi.latitude, db_poi.longitude))
+    autocomplete.poi_saved(db, db_poi)
+    poi_search.poi_saved(db, db_poi)
     db.refresh(db_poi)
     return db_poi
 
@@ -533,10 +581,20 @@ def update_poi(poi_id: int, poi: POIResponse, db: db_dependency):
     if not db_poi:
         raise HTTPException(status_code=404, detail="POI not found")
     
+    old_type, old_point = db_poi.type, (db_poi.latitude, db_poi.longitude)
     for key, value in poi.dict(exclude_unset=True).items():
         setattr(db_poi, key, value)
     
     db.commit()
+    versions.bump(db, "pois", *(poi_layers.version_name(t) for t in {old_type, db_poi.type}))
+    new_point = (db_poi.latitude, db_poi.longitude)
+    if old_type == db_poi.type:
+        poi_distances.refresh_poi(db, poi_id, old_type, old_point, new_point)
+    else:
+        poi_distances.refresh_poi(db, poi_id, old_type, old_point)
+        poi_distances.refresh_poi(db, poi_id, db_poi.type, new_point)
+    autocomplete.poi_saved(db, db_poi)
+    poi_search.poi_saved(db, db_poi)
     db.refresh(db_poi)
     return db_poi
 
@@ -547,59 +605,93 @@ def delete_poi(poi_id: int, db: db_dependency):
     if not db_poi:
         raise HTTPException(status_code=404, detail="POI not found")
     
+    poi_type, point = db_poi.type, (db_poi.latitude, db_poi.longitude)
     db.delete(db_poi)
     db.commit()
+    versions.bump(db, "pois", poi_layers.version_name(poi_type))
+    poi_distances.refresh_poi(db, poi_id, poi_type, point)
+    autocomplete.poi_deleted(db, poi_id)
+    poi_search.poi_deleted(db, poi_id)
     return {"message": "POI deleted successfully"}
 
-@app.get("/search")
-async def search_pois(q: str, db: db_dependency):
-    """Search POIs and addresses"""
-    results = []
-    
-    # חיפוש ב-POIs
-    query = db.query(models.POI).filter(
-        models.POI.name.ilike(f"%{q}%")
-    )
-    poi_results = query.all()
-    
-    # המרת תוצאות ה-POIs לפורמט אחיד
-    results.extend([{
-        "name": poi.name,
-        "type": poi.type,
-        "latitude": poi.latitude,
-        "longitude": poi.longitude,
-        "address": poi.address,
-        "source": "poi"
-    } for poi in poi_results])
-    
-    # חיפוש כתובת באמצעות geocoding
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "1.5"))
+
+
+def poi_search_results(bind, q, limit):
+    """POI hits for /search; runs in a worker thread, so with a session of its own"""
+    db = Session(bind=bind)
     try:
-        # הוספת "באר שבע" לחיפוש אם לא צוין
-        search_query = q if "באר שבע" in q.lower() else f"{q}, באר שבע"
-        locations = geolocator.geocode(
-            search_query,
-            exactly_one=False,
-            language="he",
-            country_codes=["il"],
-            limit=5
-        )
-        
-        if locations:
-            for location in locations:
-                # בדיקה שהמיקום אכן בבאר שבע
-                if "באר שבע" in location.address:
-                    results.append({
-                        "name": location.address,
-                        "type": "address",
-                        "latitude": location.latitude,
-                        "longitude": location.longitude,
-                        "address": location.address,
-                        "source": "geocoding"
-                    })
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-    
-    return results
+        # המרת תוצאות ה-POIs לפורמט אחיד
+        return [{
+            "name": poi.name,
+            "type": poi.type,
+            "latitude": poi.latitude,
+            "longitude": poi.longitude,
+            "address": poi.address,
+            "source": "poi"
+        } for poi in poi_search.search(db, q, limit)]
+    finally:
+        db.close()
+
+
+async def address_search_results(db, q):
+    """Geocoded addresses in Beer Sheva for /search"""
+    # הוספת "באר שבע" לחיפוש אם לא צוין
+    search_query = q if "באר שבע" in q.lower() else f"{q}, באר שבע"
+    locations = await geocode_cache.forward(db, search_query, geocoder)
+    # בדיקה שהמיקום אכן בבאר שבע
+    return [{
+        "name": location["address"],
+        "type": "address",
+        "latitude": location["latitude"],
+        "longitude": location["longitude"],
+        "address": location["address"],
+        "source": "geocoding"
+    } for location in locations if "באר שבע" in location["address"]]
+
+
+@app.get("/search")
+async def search_pois(q: str, db: db_dependency, response: Response, limit: int = Query(20, ge=1, le=100)):
+    """
+    Search POIs and addresses. Both sources are queried at once; whatever
+    has arrived after SEARCH_DEADLINE_SECONDS is returned, and the
+    X-Search-Partial header says whether a source is missing (timed out
+    or failed). A geocoder answer that lands after the deadline is still
+    cached for the next search.
+    """
+    # חיפוש ב-POIs, מהתאמה הטובה ביותר, ובמקביל חיפוש כתובת באמצעות geocoding
+    sources = {
+        "pois": asyncio.ensure_future(asyncio.to_thread(poi_search_results, db.get_bind(), q, limit)),
+        "geocoding": asyncio.ensure_future(address_search_results(db, q)),
+    }
+    await asyncio.wait(sources.values(), timeout=SEARCH_DEADLINE_SECONDS)
+
+    results, partial = [], False
+    for name, task in sources.items():
+        if not task.done():
+            task.cancel()
+            print(f"Search: {name} missed the {SEARCH_DEADLINE_SECONDS}s deadline")
+            partial = True
+        elif task.exception() is not None:
+            print(f"Search: {name} error: {task.exception()}")
+            partial = True
+        else:
+            results.extend(task.result())
+
+    response.headers["X-Search-Partial"] = "true" if partial else "false"
+    return search_merge.dedupe(results)
+
+@app.get("/autocomplete")
+def autocomplete_search(q: str, db: db_dependency, limit: int = Query(10, ge=1, le=autocomplete.MAX_LIMIT)):
+    """Suggestions for every keystroke: POI names, ad addresses and addresses the geocoder returned before"""
+    return [{
+        "name": entry.name,
+        "type": entry.type,
+        "latitude": entry.latitude,
+        "longitude": entry.longitude,
+        "address": entry.address,
+        "source": entry.source
+    } for entry in autocomplete.search(db, q, limit)]
 
 @app.get("/admin/users/{user_id}")
 async def get_user_by_id(user_id: int, request: Request, db: Session = Depends(get_db)):
@@ -678,6 +770,16 @@ def delete_user(
               .delete(synchronize_session=False)
         )
 
+        # ------------------------------------------------------------------
+        # שלב 2.5: מחיקת ציונים ומרחקים מחושבים של המשתמש ושל המודעות שלו
+        # ------------------------------------------------------------------
+        score_store.purge_user(db, user_id)
+        poi_distances.purge_user_ads(db, user_id)
+        user_ads = db.query(models.Ad).filter(models.Ad.user_id == user_id).all()
+        user_ad_ids = {ad.id for ad in user_ads}
+        for ad in user_ads:
+            clusters.remove_ad(db, ad, removing=user_ad_ids)
+
         # ------------------------------------------------------------------
         # שלב 3: מחיקת ביקורות, העדפות ומודעות
         # ------------------------------------------------------------------
@@ -700,12 +802,15 @@ def delete_user(
         # ------------------------------------------------------------------
         # שלב 4: מחיקת המשתמש עצמו
         # ------------------------------------------------------------------
+        deleted_email = user.email
         db.delete(user)
 
         # ------------------------------------------------------------------
         # קומיט וסיום
         # ------------------------------------------------------------------
         db.commit()
+        profile_cache.invalidate(deleted_email)
+        versions.bump(db, "ads", "users", "reviews", "user_preferences")
         return {"detail": f"User {user_id} deleted successfully"}
 
     except Exception as e:
@@ -770,39 +875,43 @@ def create_ad(request: Request, ad_data: AdCreateSchema, db: db_dependency):
     db.add(new_ad)
     db.commit()
     db.refresh(new_ad)
+    score_store.score_new_ad(db, new_ad)
+    poi_distances.refresh_ad(db, new_ad)
+    clusters.add_ad(db, new_ad)
+    versions.bump(db, "ads")
+    autocomplete.ad_saved(db, new_ad.address, new_ad.latitude, new_ad.longitude)
+    db.refresh(new_ad)
     return new_ad
 
+def admin_ad_to_dict(ad):
+    return {
+        "id": ad.id,
+        "user_id": ad.user_id,
+        "ad_type": ad.ad_type,
+        "property_type": ad.property_type,
+        "address": ad.address,
+        "rooms": ad.rooms,
+        "size": ad.size,
+        "price": ad.price,
+        "floor": ad.floor,
+        "has_elevator": ad.has_elevator,
+        "has_parking": ad.has_parking,
+        "has_balcony": ad.has_balcony,
+        "has_garden": ad.has_garden,
+        "pets_allowed": ad.pets_allowed,
+        "accessibility": ad.accessibility,
+        "publisher_name": ad.publisher_name,
+        "contact_phone": ad.contact_phone,
+        "publish_date": str(ad.publish_date) if ad.publish_date else None
+    }
+
 @app.get("/admin/ads")
 async def get_all_ads(request: Request, db: Session = Depends(get_db)):
     user = request.session.get("user")
     if not user or not user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    ads = db.query(models.Ad).all()
-
-    return [
-        {
-            "id": ad.id,
-            "user_id": ad.user_id,
-            "ad_type": ad.ad_type,
-            "property_type": ad.property_type,
-            "address": ad.address,
-            "rooms": ad.rooms,
-            "size": ad.size,
-            "price": ad.price,
-            "floor": ad.floor,
-            "has_elevator": ad.has_elevator,
-            "has_parking": ad.has_parking,
-            "has_balcony": ad.has_balcony,
-            "has_garden": ad.has_garden,
-            "pets_allowed": ad.pets_allowed,
-            "accessibility": ad.accessibility,
-            "publisher_name": ad.publisher_name,
-            "contact_phone": ad.contact_phone,
-            "publish_date": str(ad.publish_date) if ad.publish_date else None
-        }
-        for ad in ads
-    ]
+    return stream_query(db, db.query(models.Ad), admin_ad_to_dict)
 
 @app.delete("/ads/{ad_id}")
 def delete_ad(ad_id: int, request: Request, db: Session = Depends(get_db)):
@@ -818,8 +927,14 @@ def delete_ad(ad_id: int, request: Request, db: Session = Depends(get_db)):
     
     # Delete the ad
     try:
+        score_store.purge_ad(db, ad_id)
+        poi_distances.purge_ad(db, ad_id)
+        clusters.remove_ad(db, ad)
+        address = ad.address
         db.delete(ad)
         db.commit()
+        versions.bump(db, "ads")
+        autocomplete.ad_deleted(db, address)
         return {"detail": f"Ad with ID {ad_id} deleted successfully"}
     except Exception as e:
         db.rollback()
@@ -854,6 +969,7 @@ def create_review(
     # Add review to database, commit changes, and refresh to get the full object
     db.add(new_review)
     db.commit()
+    versions.bump(db, "reviews")
     db.refresh(new_review)
 
     return {
@@ -864,24 +980,19 @@ def create_review(
         "created_at": new_review.created_at
     }
 
+def review_to_dict(review):
+    return {
+        "id": review.id,
+        "user_id": review.user_id,
+        "content": review.content,
+        "rating": review.rating,
+        "created_at": review.created_at.isoformat() if review.created_at else None
+    }
+
 @app.get("/reviews/")
 def get_reviews(db: Session = Depends(get_db)):
-    # Get all reviews from the database
-    reviews = db.query(models.Review).all()
-    
-    # Convert reviews to a list of dictionaries for easier JSON serialization
-    review_list = [
-        {
-            "id": review.id,
-            "user_id": review.user_id,
-            "content": review.content,
-            "rating": review.rating,
-            "created_at": review.created_at.isoformat() if review.created_at else None
-        }
-        for review in reviews
-    ]
-    
-    return review_list
+    # Stream all reviews from the database
+    return stream_query(db, db.query(models.Review), review_to_dict)
 
 @app.get("/admin/reviews/")
 def get_reviews_for_admin(request: Request, db: Session = Depends(get_db)):
@@ -919,12 +1030,19 @@ def update_review_visibility(review_id: int, visibility_update: VisibilityUpdate
 
     review.is_visible = visibility_update.is_visible
     db.commit()
+    versions.bump(db, "reviews")
 
     return {"success": True, "is_visible": review.is_visible}
 
 
 @app.get("/reviews/visible")
-def get_visible_reviews(db: Session = Depends(get_db)):
+def get_visible_reviews(request: Request, response: Response, db: Session = Depends(get_db)):
+    # Author names come from Users, so their edits change the response too
+    etag = make_etag("reviews/visible", versions.current(db, "reviews", "users"))
+    if matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     reviews = db.query(models.Review).filter(models.Review.is_visible == True).all()
     reviews_for_show=[
         {
@@ -941,53 +1059,267 @@ def get_visible_reviews(db: Session = Depends(get_db)):
     
 
 
+def ad_to_dict(ad, score=None, stars=None):
+    """Serialize an ad for the map, with its personal score when there is one"""
+    ad_dict = {
+        "id": ad.id,
+        "ad_type": ad.ad_type,
+        "property_type": ad.property_type,
+        "address": ad.address,
+        "latitude": ad.latitude,
+        "longitude": ad.longitude,
+        "rooms": ad.rooms,
+        "size": ad.size,
+        "price": ad.price,
+        "floor": ad.floor,
+        "publisher_name": ad.publisher_name,
+        "contact_phone": ad.contact_phone,
+        "has_elevator": ad.has_elevator,
+        "has_parking": ad.has_parking,
+        "has_balcony": ad.has_balcony,
+        "has_garden": ad.has_garden,
+        "pets_allowed": ad.pets_allowed,
+        "accessibility": ad.accessibility,
+        "publish_date": ad.publish_date.isoformat() if ad.publish_date else None,
+        "description": ad.description
+    }
+    if score is not None:
+        ad_dict["score"] = score
+        ad_dict["stars"] = stars
+    return ad_dict
+
+
+def ad_sort_key(sort, ad, score=0):
+    """Cursor key of an ad in a paged /ads listing (ties broken by id)"""
+    if sort == "score":
+        return (-score, ad.id)
+    if sort == "price":
+        return (ad.price, ad.id)
+    return (ad.publish_date.isoformat(), ad.id)
+
+
+def parse_ad_cursor(cursor, sort):
+    """decode_cursor plus a shape check for the keys ad_sort_key produces"""
+    key = decode_cursor(cursor, sort)
+    try:
+        first, ad_id = key
+        if sort == "publish_date":
+            date.fromisoformat(first)
+        elif isinstance(first, bool) or not isinstance(first, (int, float)):
+            raise ValueError
+        if isinstance(ad_id, bool) or not isinstance(ad_id, int):
+            raise ValueError
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    return key
+
+
+def ads_after(query, sort, after, personalized=False):
+    """Keyset filter + ordering for a paged /ads query"""
+    if sort == "score":
+        if not personalized:
+            # Every score is 0, so the order is just the tie-breaker
+            if after:
+                query = query.filter(models.Ad.id > after[1])
+            return query.order_by(models.Ad.id)
+        score, ad_id = models.UserAdScore.score, models.UserAdScore.ad_id
+        if after:
+            best, last_id = -after[0], after[1]
+            query = query.filter(or_(score < best, and_(score == best, ad_id > last_id)))
+        return query.order_by(score.desc(), ad_id)
+
+    if sort == "price":
+        if after:
+            price, ad_id = after
+            query = query.filter(or_(
+                models.Ad.price > price,
+                and_(models.Ad.price == price, models.Ad.id > ad_id),
+            ))
+        return query.order_by(models.Ad.price, models.Ad.id)
+
+    # publish_date: newest first
+    if after:
+        published, ad_id = after
+        published = date.fromisoformat(published)
+        query = query.filter(or_(
+            models.Ad.publish_date < published,
+            and_(models.Ad.publish_date == published, models.Ad.id < ad_id),
+        ))
+    return query.order_by(models.Ad.publish_date.desc(), models.Ad.id.desc())
+
+
+def ad_filter_params(
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    ad_type: Optional[str] = None,
+    property_type: Optional[str] = None,
+    min_rooms: Optional[float] = None,
+    max_rooms: Optional[float] = None,
+    max_size: Optional[int] = None,
+    features: List[str] = Query([]),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """The AdFilters / FeatureFilter criteria, as /ads query parameters"""
+    unknown = set(features) - set(FEATURE_TO_AD_FIELD.values())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown features: {', '.join(sorted(unknown))}")
+    return {
+        "min_price": min_price,
+        "max_price": max_price,
+        "ad_type": ad_type,
+        "property_type": property_type,
+        "min_rooms": min_rooms,
+        "max_rooms": max_rooms,
+        "max_size": max_size,
+        "features": features,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+
+def apply_ad_filters(query, filters):
+    Ad = models.Ad
+    if filters["ad_type"]:
+        query = query.filter(Ad.ad_type == filters["ad_type"])
+    if filters["property_type"]:
+        query = query.filter(Ad.property_type == filters["property_type"])
+    if filters["min_price"] is not None:
+        query = query.filter(Ad.price >= filters["min_price"])
+    if filters["max_price"] is not None:
+        query = query.filter(Ad.price <= filters["max_price"])
+    if filters["min_rooms"] is not None:
+        query = query.filter(Ad.rooms >= filters["min_rooms"])
+    if filters["max_rooms"] is not None:
+        query = query.filter(Ad.rooms <= filters["max_rooms"])
+    if filters["max_size"] is not None:
+        query = query.filter(Ad.size <= filters["max_size"])
+    for field in filters["features"]:
+        query = query.filter(getattr(Ad, field) == True)
+    if filters["start_date"]:
+        query = query.filter(Ad.publish_date >= filters["start_date"])
+    if filters["end_date"]:
+        query = query.filter(Ad.publish_date <= filters["end_date"])
+    return query
+
+
 @app.get("/ads")
-async def get_ads(request: Request, db: db_dependency):
-    """Get all ads for display on map"""
+async def get_ads(
+    request: Request,
+    response: Response,
+    db: db_dependency,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    sort: Optional[str] = Query(None, pattern="^(score|price|publish_date)$"),
+    cursor: Optional[str] = None,
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    filters: dict = Depends(ad_filter_params),
+):
+    """
+    Get ads for display on map.
+
+    min_lat/min_lon/max_lat/max_lon limit the result to the visible
+    viewport, and the ad_filter_params criteria are applied in SQL.
+    Without limit/sort/cursor every matching ad is returned. Otherwise the
+    ads are ordered by `sort` (score: best first, price: cheapest first,
+    publish_date: newest first) and, when there are more, the
+    X-Next-Cursor header holds the cursor for the next page.
+
+    The ETag covers the ads table and, for a signed-in user, the
+    preferences and POIs their scores depend on.
+    """
     user = request.session.get("user")
-    preferences = None
     if user:
-        db_user = db.query(models.Users).filter(models.Users.email == user["email"]).first()
-        if db_user:
-            preferences = db.query(models.UserPreferences).filter(
-                models.UserPreferences.user_id == db_user.ID
-            ).first()
+        tables = versions.current(db, "ads", "user_preferences", "pois")
+        etag = make_etag("ads", tables, user["email"], sorted(request.query_params.multi_items()))
+    else:
+        etag = make_etag("ads", versions.current(db, "ads"), sorted(request.query_params.multi_items()))
+    cache_headers = {"ETag": etag, "Vary": "Cookie"}
+    if matches(request, etag):
+        return not_modified(etag, {"Vary": "Cookie"})
+    response.headers.update(cache_headers)
+
+    preferences = profile_cache.get_profile(db, user["email"]) if user else None
+    query = db.query(models.Ad)
+
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+    if any(v is not None for v in bbox):
+        if any(v is None for v in bbox) or min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="Invalid bounding box")
+        query = within_bbox(query, db, *bbox)
+    query = apply_ad_filters(query, filters)
+
+    paged = limit is not None or sort is not None or cursor is not None
+    sort = sort or "score"
+
+    # Personal scores come precomputed from user_ad_scores
+    if preferences:
+        score_store.sync_user(db, preferences)
+        query = score_store.with_scores(query, preferences.user_id, inner=paged and sort == "score")
+    else:
+        query = query.add_columns(literal(None).label("score"), literal(None).label("stars"))
 
-    ads = db.query(models.Ad).all()
-    
-    # Convert ads to a format suitable for the frontend
-    ad_list = []
-    for ad in ads:
-        ad_dict = {
-            "id": ad.id,
-            "ad_type": ad.ad_type,
-            "property_type": ad.property_type,
-            "address": ad.address,
-            "latitude": ad.latitude,
-            "longitude": ad.longitude,
-            "rooms": ad.rooms,
-            "size": ad.size,
-            "price": ad.price,
-            "floor": ad.floor,
-            "publisher_name": ad.publisher_name,
-            "contact_phone": ad.contact_phone,
-            "has_elevator": ad.has_elevator,
-            "has_parking": ad.has_parking,
-            "has_balcony": ad.has_balcony,
-            "has_garden": ad.has_garden,
-            "pets_allowed": ad.pets_allowed,
-            "accessibility": ad.accessibility,
-            "publish_date": ad.publish_date.isoformat() if ad.publish_date else None,
-            "description": ad.description
+    if not paged:
+        return stream_query(db, query, lambda row: ad_to_dict(*row), headers=cache_headers)
+
+    try:
+        after = parse_ad_cursor(cursor, sort) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    query = ads_after(query, sort, after, personalized=preferences is not None)
+    rows = query.limit(limit + 1).all() if limit is not None else query.all()
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_ad, last_score, _ = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort, ad_sort_key(sort, last_ad, last_score or 0))
+
+    return [ad_to_dict(ad, score, stars) for ad, score, stars in rows]
+
+@app.get("/ads/clusters")
+def get_ad_clusters(
+    request: Request,
+    db: db_dependency,
+    zoom: int = Query(..., ge=0, le=22),
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat (Leaflet's toBBoxString)"),
+):
+    """
+    Ads grouped into grid cells for zoomed-out map views: count, centroid
+    and min/max price per cell, plus the best personal score when the user
+    has preferences. Zoom levels past clusters.MAX_ZOOM use its grid.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    zoom = min(zoom, clusters.MAX_ZOOM)
+
+    clusters.ensure_built(db)
+    cells = clusters.visible_cells(db, zoom, min_lat, min_lon, max_lat, max_lon)
+
+    best = {}
+    user = request.session.get("user")
+    preferences = profile_cache.get_profile(db, user["email"]) if user else None
+    if preferences:
+        score_store.sync_user(db, preferences)
+        best = clusters.best_scores(db, preferences.user_id, zoom, cells)
+
+    return [
+        {
+            "latitude": cell.latitude_sum / cell.count,
+            "longitude": cell.longitude_sum / cell.count,
+            "count": cell.count,
+            "min_price": cell.min_price,
+            "max_price": cell.max_price,
+            "best_score": best.get((cell.cell_x, cell.cell_y)),
         }
-        if preferences:
-            score = score_apartment(ad, preferences)
-            stars = calculate_star_rating(score)
-            ad_dict["score"] = score
-            ad_dict["stars"] = stars
-        ad_list.append(ad_dict)
-    
-    return ad_list
+        for cell in cells
+    ]
 
 @app.get("/ads/{ad_id}")
 def get_ad(ad_id: int, db: db_dependency):
@@ -996,4 +1328,12 @@ def get_ad(ad_id: int, db: db_dependency):
         raise HTTPException(status_code=404, detail="Ad not found")
     return ad
 
+@app.get("/ads/{ad_id}/poi-distances")
+def get_ad_poi_distances(ad_id: int, db: db_dependency):
+    """Nearest POI, its distance and counts within 300/500/1000 m, per POI type"""
+    ad = db.query(models.Ad).filter(models.Ad.id == ad_id).first()
+    if not ad:
+        raise HTTPException(status_code=404, detail="Ad not found")
+    return poi_distances.for_ad(db, ad)
+
 
@@ -1,7 +1,8 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, Float, Date, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Integer, String, Text, Float, Date, UniqueConstraint, Index
 from database import Base
 from datetime import date
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+from utils.hebrew import normalize as normalize_hebrew
 
 
 class Users(Base):
@@ -61,6 +62,40 @@ class POI(Base):
     description = Column(Text, nullable=True)
     address = Column(String, nullable=True)
     tags = Column(Text, nullable=True)  # Store additional OSM tags as JSON string
+    name_normalized = Column(String, nullable=True)  # utils.hebrew.normalize(name), for /search
+    # The OSM element a fetched POI came from; null for POIs added through the API
+    osm_type = Column(String, nullable=True)  # "node", "way" or "relation"
+    osm_id = Column(BigInteger, nullable=True)
+
+    # Tile queries: one layer within a latitude/longitude box
+    __table_args__ = (
+        Index('ix_pois_type_lat_lon', 'type', 'latitude', 'longitude'),
+        Index('ix_pois_type_osm', 'type', 'osm_type', 'osm_id'),
+    )
+
+    @validates('name')
+    def _set_name_normalized(self, key, name):
+        self.name_normalized = normalize_hebrew(name)
+        return name
+
+class POIStaging(Base):
+    """A fetch of OSM POIs, diffed into pois by utils/poi_refresh.py"""
+    __tablename__ = "pois_staging"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    type = Column(String, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    address = Column(String, nullable=True)
+    tags = Column(Text, nullable=True)
+    name_normalized = Column(String, nullable=True)
+    osm_type = Column(String, nullable=False)
+    osm_id = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index('ix_pois_staging_type_osm', 'type', 'osm_type', 'osm_id'),
+    )
 
 class Ad(Base):
     __tablename__ = 'ads'  
@@ -87,6 +122,18 @@ class Ad(Base):
     publish_date = Column(Date, nullable=False, default=date.today)
     description = Column(Text, nullable=True)
 
+    # Indexes for the /ads filters and sort orders
+    __table_args__ = (
+        Index('ix_ads_type_price_rooms', 'ad_type', 'price', 'rooms'),
+        Index('ix_ads_sale_price_rooms', 'price', 'rooms',
+              postgresql_where=(ad_type == 'מכירה'), sqlite_where=(ad_type == 'מכירה')),
+        Index('ix_ads_rent_price_rooms', 'price', 'rooms',
+              postgresql_where=(ad_type == 'השכרה'), sqlite_where=(ad_type == 'השכרה')),
+        Index('ix_ads_property_type_price', 'property_type', 'price'),
+        Index('ix_ads_price_id', 'price', 'id'),
+        Index('ix_ads_publish_date_id', 'publish_date', 'id'),
+    )
+
 class Review(Base):
     __tablename__ = 'reviews'
 
@@ -111,4 +158,79 @@ class LikedAds(Base):
 
     __table_args__ = (
     UniqueConstraint('user_id', 'ad_id', name='unique_user_ad_like'),
-)
\ No newline at end of file
+)
+
+
+class UserAdScore(Base):
+    __tablename__ = 'user_ad_scores'
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('Users.ID'), nullable=False)
+    ad_id = Column(Integer, ForeignKey('ads.id'), nullable=False, index=True)
+    score = Column(Integer, nullable=False)
+    stars = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'ad_id', name='unique_user_ad_score'),
+        Index('ix_user_ad_scores_user_score', user_id, score.desc(), ad_id),
+    )
+
+
+class AdPOIDistance(Base):
+    """Precomputed distances from an ad to each POI type (see utils/poi_distances.py)"""
+    __tablename__ = 'ad_poi_distances'
+
+    id = Column(Integer, primary_key=True, index=True)
+    ad_id = Column(Integer, ForeignKey('ads.id'), nullable=False)
+    poi_type = Column(String, nullable=False, index=True)
+    nearest_poi_id = Column(Integer, nullable=True)  # no FK: refreshes delete POIs without touching this table
+    distance_m = Column(Float, nullable=True)
+    count_300m = Column(Integer, nullable=False, default=0)
+    count_500m = Column(Integer, nullable=False, default=0)
+    count_1000m = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('ad_id', 'poi_type', name='unique_ad_poi_type'),
+    )
+
+
+class TableVersion(Base):
+    """Write counter per table, for ETags (see utils/versions.py)"""
+    __tablename__ = 'table_versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class AdCluster(Base):
+    """Ads aggregated per grid cell and zoom level (see utils/clusters.py)"""
+    __tablename__ = 'ad_clusters'
+
+    id = Column(Integer, primary_key=True, index=True)
+    zoom = Column(Integer, nullable=False)
+    cell_x = Column(Integer, nullable=False)
+    cell_y = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+    latitude_sum = Column(Float, nullable=False)
+    longitude_sum = Column(Float, nullable=False)
+    min_price = Column(Integer, nullable=False)
+    max_price = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('zoom', 'cell_x', 'cell_y', name='unique_ad_cluster_cell'),
+    )
+
+
+class GeocodeCacheEntry(Base):
+    """A stored geocoder answer (see utils/geocode_cache.py)"""
+    __tablename__ = 'geocode_cache'
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # "forward" or "reverse"
+    key = Column(String, nullable=False)
+    result = Column(Text, nullable=False)  # JSON text; "null" when the geocoder found nothing
+    fetched_at = Column(Float, nullable=False)  # epoch seconds
+
+    __table_args__ = (
+        UniqueConstraint('kind', 'key', name='unique_geocode_cache_key'),
+    )
@@ -7,7 +7,12 @@ from typing import Generator
 
 # Add the parent directory to path so we can import the main app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests stub the geocoder, so Nominatim's 1 request/second limit doesn't apply
+os.environ.setdefault("GEOCODER_RATE_LIMIT", "0")
+# Stale in-process indexes are rebuilt inside the request, so tests see every change at once
+os.environ.setdefault("INDEX_REBUILD_IN_BACKGROUND", "0")
 from main import app
+from utils import autocomplete, clusters, geocode_cache, poi_index, poi_layers, poi_search, profile_cache, score_store, tiles, versions
 
 @pytest.fixture
 def client() -> Generator:
@@ -16,4 +21,22 @@ def client() -> Generator:
     This fixture will be used by the test functions.
     """
     with TestClient(app) as test_client:
-        yield test_client
\ No newline at end of file
+        yield test_client
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """
+    Every test builds a fresh database, so in-process caches must not
+    carry entries over from the previous test.
+    """
+    profile_cache.clear()
+    score_store.clear()
+    poi_index.clear()
+    versions.clear()
+    clusters.clear()
+    tiles.clear()
+    poi_layers.clear()
+    poi_search.clear()
+    geocode_cache.clear()
+    autocomplete.clear()
+    yield
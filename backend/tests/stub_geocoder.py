@@ -0,0 +1,60 @@
+"""
+A local Nominatim stand-in for the geocoder tests: serves /reverse and
+/search on 127.0.0.1, optionally after a delay, and records every request.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from geopy.geocoders import Nominatim
+
+
+class StubGeocoder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []  # (path, query params, monotonic arrival time)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with stub._lock:
+                    stub.requests.append((url.path, params, time.monotonic()))
+                time.sleep(stub.delay)
+                body = json.dumps(stub.answer(url.path, params), ensure_ascii=False).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client timed out
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def answer(self, path, params):
+        if path == "/reverse":
+            return {"display_name": f"רחוב {params['lat']}, באר שבע", "lat": params["lat"], "lon": params["lon"]}
+        return [{"display_name": f"{params['q']}", "lat": "31.25", "lon": "34.79"}]
+
+    def paths(self):
+        with self._lock:
+            return [path for path, _, _ in self.requests]
+
+    def geolocator(self):
+        host, port = self.server.server_address
+        return Nominatim(user_agent="smartestate-tests", domain=f"{host}:{port}", scheme="http")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,75 @@
+"""
+A local Overpass stand-in for the fetch_pois tests: answers POSTed
+queries on 127.0.0.1 with a node per tag filter in the query, optionally
+after a delay or with queued error statuses, and records every query and
+how many were in flight at once.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+TAG_FILTER = re.compile(r"node((?:\[[^\]]+\])+)\(")
+
+
+class StubOverpass:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.queries = []
+        self.statuses = []  # returned, in order, before any normal answer
+        self.broken = set()  # tag filters that always get a 500
+        self.missing = set()  # tag filters that match nothing
+        self.names = {}  # tag filter -> name of its node, instead of the filter itself
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                query = form["data"][0]
+                with stub._lock:
+                    stub.queries.append(query)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    time.sleep(stub.delay)
+                    tags = TAG_FILTER.findall(query)
+                    if status == 200 and stub.broken & set(tags):
+                        status = 500
+                    elements = [stub.element(tag) for tag in tags if tag not in stub.missing]
+                    body = json.dumps({"elements": elements}, ensure_ascii=False).encode()
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", "0")
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def element(self, tag):
+        """The node answering a tag filter, named after it"""
+        return {"type": "node", "id": abs(hash(tag)) % 10**9, "lat": 31.25, "lon": 34.79,
+                "tags": {"name": self.names.get(tag, tag), "addr:street": "הרצל"}}
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/api/interpreter"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,546 @@
+import os
+import random
+import sys
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import Users, Ad, UserPreferences, UserAdScore, AdPOIDistance, POI, TableVersion
+from utils.ranking import score_apartment, calculate_star_rating
+from fetch_pois import POI_TYPES
+from utils import poi_distances, score_store, versions
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def make_ad(**kwargs):
+    values = dict(
+        user_id=1,
+        publisher_name="Test Publisher",
+        contact_phone="0501234567",
+        ad_type="השכרה",
+        property_type="apartment",
+        address="רחוב הבדיקה 1",
+        latitude=31.25,
+        longitude=34.79,
+        rooms=3,
+        size=80,
+        price=5000,
+        publish_date=date(2024, 1, 1),
+    )
+    values.update(kwargs)
+    return Ad(**values)
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(
+        Users(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="password123",
+            is_admin=False,
+        )
+    )
+    db.add_all(
+        [
+            make_ad(property_type="apartment", price=4500, rooms=3, has_parking=True),
+            make_ad(property_type="house", price=9000, rooms=5, has_garden=True),
+            make_ad(property_type="apartment", price=3000, rooms=2, has_elevator=True),
+        ]
+    )
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def login(client):
+    resp = client.post("/login/", json={"email": "test@example.com", "password": "password123"})
+    assert resp.status_code == 200
+
+
+PREFERENCES = {
+    "houseType": "apartment",
+    "rooms": "3",
+    "features": ["parking", "elevator"],
+    "importantLayers": [],
+    "budgetMin": 2000,
+    "budgetMax": 6000,
+}
+
+
+def test_get_ads_anonymous_has_no_scores(client, test_db):
+    resp = client.get("/ads")
+    assert resp.status_code == 200
+    ads = resp.json()
+    assert len(ads) == 3
+    assert all("score" not in ad for ad in ads)
+
+
+def test_get_ads_scores_match_per_ad_ranking(client, test_db):
+    login(client)
+    assert client.post("/user-preferences/", json=PREFERENCES).status_code == 200
+
+    resp = client.get("/ads")
+    assert resp.status_code == 200
+
+    db = TestingSessionLocal()
+    prefs = db.query(UserPreferences).first()
+    expected = {ad.id: score_apartment(ad, prefs) for ad in db.query(Ad).all()}
+    db.close()
+
+    for ad in resp.json():
+        assert ad["score"] == expected[ad["id"]]
+        assert ad["stars"] == calculate_star_rating(expected[ad["id"]])
+
+
+def test_preferences_are_cached_between_requests(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    client.get("/ads")
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        resp = client.get("/ads")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert resp.status_code == 200
+    assert not any('"UserPreferences"' in sql or '"Users"' in sql for sql in statements)
+
+
+def test_saving_preferences_rebuilds_cached_profile(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    before = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+
+    client.post("/user-preferences/", json={**PREFERENCES, "houseType": "house", "rooms": "5+"})
+    after = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+
+    assert before != after
+    house = next(ad for ad in client.get("/ads").json() if ad["property_type"] == "house")
+    assert house["score"] == 15 + 10 - 2 - 2
+
+
+def test_preferences_saved_by_another_worker_are_seen(client, test_db):
+    login(client)
+    client.get("/ads")  # caches "no preferences"
+
+    # As if another worker saved them: this process's cache was not told
+    db = TestingSessionLocal()
+    db.add(UserPreferences(user_id=1, house_type="house", rooms="5+", features="[]",
+                           important_layers="[]", budget_min=2000, budget_max=6000))
+    db.commit()
+    versions.bump(db, "user_preferences")
+    prefs = db.query(UserPreferences).one()
+    expected = {ad.id: score_apartment(ad, prefs) for ad in db.query(Ad).all()}
+    db.close()
+
+    assert {ad["id"]: ad["score"] for ad in client.get("/ads").json()} == expected
+
+
+def page_through(client, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        resp = client.get("/ads", params=query)
+        assert resp.status_code == 200
+        pages.append(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def add_more_ads(count):
+    db = TestingSessionLocal()
+    db.add_all(
+        make_ad(price=1000 + (i * 7919) % 5000, rooms=1 + i % 4, has_parking=i % 2 == 0,
+                publish_date=date(2024, 1 + i % 12, 1 + i % 28))
+        for i in range(count)
+    )
+    db.commit()
+    db.close()
+
+
+def test_top_k_by_score_pages_cover_catalog_in_order(client, test_db):
+    add_more_ads(20)
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    everything = client.get("/ads").json()
+
+    pages = page_through(client, limit=4, sort="score")
+    flat = [ad for page in pages for ad in page]
+
+    assert all(len(page) <= 4 for page in pages)
+    assert [ad["id"] for ad in flat] == [
+        ad["id"] for ad in sorted(everything, key=lambda ad: (-ad["score"], ad["id"]))
+    ]
+
+
+def test_paging_by_price_and_publish_date(client, test_db):
+    add_more_ads(15)
+    everything = client.get("/ads").json()
+
+    by_price = [ad for page in page_through(client, limit=5, sort="price") for ad in page]
+    assert [ad["id"] for ad in by_price] == [
+        ad["id"] for ad in sorted(everything, key=lambda ad: (ad["price"], ad["id"]))
+    ]
+
+    by_date = [ad for page in page_through(client, limit=5, sort="publish_date") for ad in page]
+    assert [ad["id"] for ad in by_date] == [
+        ad["id"] for ad in sorted(everything, key=lambda ad: (ad["publish_date"], ad["id"]), reverse=True)
+    ]
+
+
+def test_limit_without_more_results_has_no_cursor(client, test_db):
+    resp = client.get("/ads?limit=10")
+    assert len(resp.json()) == 3
+    assert "X-Next-Cursor" not in resp.headers
+
+
+def test_invalid_cursor_is_rejected(client, test_db):
+    cursor = client.get("/ads?limit=1&sort=price").headers["X-Next-Cursor"]
+
+    assert client.get("/ads?limit=1&sort=score", params={"cursor": cursor}).status_code == 400
+    assert client.get("/ads?limit=1&sort=price&cursor=garbage").status_code == 400
+    assert client.get("/ads?sort=rating").status_code == 422
+
+
+def test_ads_bounding_box(client, test_db):
+    db = TestingSessionLocal()
+    db.add_all([
+        make_ad(address="north", latitude=31.30, longitude=34.80),
+        make_ad(address="edge", latitude=31.20, longitude=34.70),
+    ])
+    db.commit()
+    db.close()
+
+    resp = client.get("/ads", params={"min_lat": 31.2, "min_lon": 34.7, "max_lat": 31.26, "max_lon": 34.8})
+    assert resp.status_code == 200
+    addresses = [ad["address"] for ad in resp.json()]
+    assert "north" not in addresses
+    assert "edge" in addresses
+    assert len(addresses) == 4
+
+
+def test_ads_bounding_box_follows_updates_and_deletes(client, test_db):
+    db = TestingSessionLocal()
+    moved = db.query(Ad).first()
+    moved.latitude = 32.0
+    db.delete(db.query(Ad).filter(Ad.property_type == "house").first())
+    db.commit()
+    db.close()
+
+    resp = client.get("/ads", params={"min_lat": 31, "min_lon": 34, "max_lat": 31.5, "max_lon": 35})
+    assert len(resp.json()) == 1
+
+
+def test_ads_partial_bounding_box_rejected(client, test_db):
+    assert client.get("/ads?min_lat=31").status_code == 400
+    assert client.get("/ads?min_lat=32&min_lon=34&max_lat=31&max_lon=35").status_code == 400
+
+
+def test_ads_filters_run_in_sql(client, test_db):
+    db = TestingSessionLocal()
+    db.add_all([
+        make_ad(ad_type="מכירה", price=1_200_000, rooms=4, has_parking=True, has_elevator=True),
+        make_ad(ad_type="מכירה", price=900_000, rooms=3, has_parking=True),
+        make_ad(ad_type="מכירה", price=2_500_000, rooms=5, property_type="house"),
+    ])
+    db.commit()
+    db.close()
+
+    resp = client.get("/ads", params={"ad_type": "מכירה", "min_price": 800_000, "max_price": 2_000_000})
+    assert sorted(ad["price"] for ad in resp.json()) == [900_000, 1_200_000]
+
+    resp = client.get("/ads", params={"ad_type": "מכירה", "features": ["has_parking", "has_elevator"]})
+    assert [ad["price"] for ad in resp.json()] == [1_200_000]
+
+    resp = client.get("/ads", params={"property_type": "house", "min_rooms": 5})
+    assert sorted(ad["price"] for ad in resp.json()) == [9000, 2_500_000]
+
+    resp = client.get("/ads", params={"max_rooms": 2, "start_date": "2023-12-01", "end_date": "2024-01-31"})
+    assert [ad["price"] for ad in resp.json()] == [3000]
+
+
+def test_ads_filters_combine_with_paging(client, test_db):
+    add_more_ads(20)
+    everything = [ad for ad in client.get("/ads").json() if ad["price"] <= 3000]
+
+    pages = page_through(client, limit=3, sort="price", max_price=3000)
+    assert [ad["id"] for page in pages for ad in page] == [
+        ad["id"] for ad in sorted(everything, key=lambda ad: (ad["price"], ad["id"]))
+    ]
+
+
+def test_ads_unknown_feature_filter_rejected(client, test_db):
+    assert client.get("/ads?features=has_pool").status_code == 400
+
+
+NEW_AD = {
+    "ad_type": "השכרה",
+    "property_type": "apartment",
+    "address": "רחוב חדש 5",
+    "latitude": 31.26,
+    "longitude": 34.8,
+    "rooms": 3,
+    "size": 90,
+    "price": 5500,
+    "has_parking": True,
+    "has_elevator": True,
+    "publisher_name": "Test Publisher",
+    "contact_phone": "0501234567",
+}
+
+
+def stored_scores():
+    db = TestingSessionLocal()
+    rows = {(r.user_id, r.ad_id): (r.score, r.stars) for r in db.query(UserAdScore).all()}
+    db.close()
+    return rows
+
+
+def add_admin():
+    db = TestingSessionLocal()
+    db.add(Users(email="admin@example.com", first_name="Admin", last_name="User",
+                 password="admin123", is_admin=True))
+    db.commit()
+    db.close()
+
+
+def test_saving_preferences_materializes_scores(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+
+    rows = stored_scores()
+    assert len(rows) == 3
+    served = {ad["id"]: (ad["score"], ad["stars"]) for ad in client.get("/ads").json()}
+    assert served == {ad_id: value for (_, ad_id), value in rows.items()}
+
+
+def test_created_ad_is_scored_for_every_profile(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+
+    new_id = client.post("/ads/", json=NEW_AD).json()["id"]
+
+    # apartment +15, budget +20, rooms +10, parking +5, elevator +5
+    assert stored_scores()[(1, new_id)] == (55, calculate_star_rating(55))
+    assert client.get("/ads?limit=1").json()[0]["id"] == new_id
+
+
+def test_deleting_ad_and_user_purges_scores(client, test_db):
+    add_admin()
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    client.post("/ads/", json=NEW_AD)
+
+    client.post("/login/", json={"email": "admin@example.com", "password": "admin123"})
+    ad_id = next(iter(stored_scores()))[1]
+    assert client.delete(f"/ads/{ad_id}").status_code == 200
+    assert all(key[1] != ad_id for key in stored_scores())
+
+    assert client.delete("/users/1").status_code == 200
+    assert stored_scores() == {}
+
+
+def test_ads_written_outside_the_api_are_scored_on_first_read(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    score_store.clear()  # as after a restart
+    add_more_ads(5)
+
+    ads = client.get("/ads?sort=score").json()
+    assert len(ads) == 8
+    assert len(stored_scores()) == 8
+
+
+def test_ads_added_by_another_process_are_scored_once_the_version_moves(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json=PREFERENCES)
+    assert len(client.get("/ads?sort=score").json()) == 3
+
+    db = TestingSessionLocal()
+    ad = make_ad(price=5500)
+    db.add(ad)
+    db.commit()
+    versions.bump(db, "ads")
+
+    assert len(client.get("/ads?sort=score&limit=10").json()) == 4
+    assert all(ad["score"] is not None for ad in client.get("/ads").json())
+    # Scoring it again, as a concurrent request would, updates the same row
+    score_store.score_new_ad(db, ad)
+    assert [key for key in stored_scores() if key[1] == ad.id] == [(1, ad.id)]
+    db.close()
+
+
+def test_important_layers_reward_nearby_ads(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json={**PREFERENCES, "importantLayers": ["school"]})
+    before = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+
+    # A school next to the first ad only; the others are ~2 km away
+    db = TestingSessionLocal()
+    db.query(Ad).filter(Ad.id != 1).update({Ad.latitude: 31.27})
+    db.commit()
+    db.close()
+    poi = {"id": 1, "name": "School", "type": "school", "latitude": 31.25, "longitude": 34.79,
+           "description": None, "address": None, "tags": None}
+    assert client.post("/poi", json=poi).status_code == 200
+
+    after = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+    assert after == {**before, 1: before[1] + 5}
+    assert stored_scores()[(1, 1)][0] == before[1] + 5
+
+
+def test_pois_changed_by_another_process_rescore_important_layers(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json={**PREFERENCES, "importantLayers": ["school"]})
+    before = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+
+    # As fetch_pois.py would: new POIs and a bumped counter, from outside this process
+    db = TestingSessionLocal()
+    db.add(POI(name="School", type="school", latitude=31.2501, longitude=34.79))
+    db.add(TableVersion(name="pois", version=1))
+    db.commit()
+    db.close()
+    versions.clear()  # as once VERSION_REFRESH_SECONDS have passed
+
+    after = {ad["id"]: ad["score"] for ad in client.get("/ads").json()}
+    assert after == {ad_id: score + 5 for ad_id, score in before.items()}
+
+
+def school(poi_id, latitude, longitude=34.8):
+    return {"id": poi_id, "name": f"School {poi_id}", "type": "school", "latitude": latitude,
+            "longitude": longitude, "description": None, "address": None, "tags": None}
+
+
+def stored_distances(ad_id, poi_type="school"):
+    db = TestingSessionLocal()
+    row = db.query(AdPOIDistance).filter_by(ad_id=ad_id, poi_type=poi_type).one()
+    db.close()
+    return row.nearest_poi_id, row.distance_m, (row.count_300m, row.count_500m, row.count_1000m)
+
+
+def test_created_ad_gets_a_row_per_poi_type(client, test_db):
+    login(client)
+    # ~0.0009 degrees of latitude per 100 m from NEW_AD
+    client.post("/poi", json=school(1, 31.2618))
+    client.post("/poi", json=school(2, 31.2640))
+    new_id = client.post("/ads/", json=NEW_AD).json()["id"]
+
+    db = TestingSessionLocal()
+    assert db.query(AdPOIDistance).filter_by(ad_id=new_id).count() == len(POI_TYPES)
+    db.close()
+    nearest, distance, counts = stored_distances(new_id)
+    assert nearest == 1 and 195 < distance < 205
+    assert counts == (1, 2, 2)
+    assert stored_distances(new_id, "park") == (None, None, (0, 0, 0))
+
+
+def test_poi_changes_refresh_their_type(client, test_db):
+    add_admin()
+    login(client)
+    new_id = client.post("/ads/", json=NEW_AD).json()["id"]
+    assert stored_distances(new_id)[0] is None
+
+    client.post("/poi", json=school(1, 31.2640))
+    assert stored_distances(new_id)[0] == 1
+    client.put("/poi/1", json={**school(1, 31.2640), "type": "park"})
+    assert stored_distances(new_id)[0] is None
+    assert stored_distances(new_id, "park")[0] == 1
+    client.delete("/poi/1")
+    assert stored_distances(new_id, "park")[0] is None
+
+    client.post("/login/", json={"email": "admin@example.com", "password": "admin123"})
+    client.delete(f"/ads/{new_id}")
+    db = TestingSessionLocal()
+    assert db.query(AdPOIDistance).filter_by(ad_id=new_id).count() == 0
+    db.close()
+
+
+def all_distances():
+    db = TestingSessionLocal()
+    rows = {(r.ad_id, r.poi_type): (r.nearest_poi_id, None if r.distance_m is None else round(r.distance_m, 3),
+                                    r.count_300m, r.count_500m, r.count_1000m)
+            for r in db.query(AdPOIDistance)}
+    db.close()
+    return rows
+
+
+def test_poi_changes_rewrite_only_nearby_ads_and_match_a_rebuild(client, test_db):
+    rng = random.Random(3)
+    db = TestingSessionLocal()
+    db.add_all(make_ad(latitude=rng.uniform(31.2, 31.3), longitude=rng.uniform(34.75, 34.85)) for _ in range(60))
+    db.commit()
+    poi_distances.refresh_all(db)
+    db.close()
+
+    client.post("/poi", json=school(1, 31.25, 34.8))
+    client.post("/poi", json=school(2, 31.22, 34.77))
+    client.put("/poi/1", json=school(1, 31.28, 34.82))
+    client.put("/poi/2", json={**school(2, 31.22, 34.77), "type": "park"})
+    client.post("/poi", json=school(3, 31.26, 34.79))
+    client.delete("/poi/3")
+    after_edits = all_distances()
+
+    db = TestingSessionLocal()
+    poi_distances.refresh_all(db)
+    assert all_distances() == after_edits
+    # A school among the others only reaches the ads around it
+    db.add(POI(id=4, name="School 4", type="school", latitude=31.281, longitude=34.821))
+    db.commit()
+    rewritten = poi_distances.refresh_poi(db, 4, "school", (31.281, 34.821))
+    assert 0 < rewritten < 30
+    db.close()
+
+
+def test_poi_distances_endpoint_and_bulk_refresh(client, test_db):
+    db = TestingSessionLocal()
+    db.add(POI(name="School", type="school", latitude=31.25, longitude=34.79))
+    db.commit()
+
+    # Ads written before the table was filled are computed on first read
+    resp = client.get("/ads/1/poi-distances")
+    assert resp.status_code == 200
+    assert resp.json()["school"]["count_300m"] == 1
+    assert client.get("/ads/999/poi-distances").status_code == 404
+
+    assert poi_distances.refresh_all(db) == 3 * len(POI_TYPES)
+    assert db.query(AdPOIDistance).count() == 3 * len(POI_TYPES)
+    assert {row.nearest_poi_id for row in db.query(AdPOIDistance).filter_by(poi_type="school")} == {1}
+    db.close()
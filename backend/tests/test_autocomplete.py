@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db, geolocator
+from database import Base
+from models import Ad, GeocodeCacheEntry, POI, Users
+from utils import autocomplete, versions
+from utils.autocomplete import Entry, PrefixIndex
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+AD_FIELDS = dict(ad_type="השכרה", property_type="apartment", rooms=3, size=80, price=5000,
+                 publisher_name="P", contact_phone="050")
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        Users(email="test@example.com", first_name="Test", last_name="User", password="password123", is_admin=False),
+        Users(email="admin@example.com", first_name="Admin", last_name="User", password="admin123", is_admin=True),
+        POI(name="קניון הנגב", type="shopping", latitude=31.24, longitude=34.79),
+        POI(name="הנגב הצעיר", type="school", latitude=31.25, longitude=34.80),
+        GeocodeCacheEntry(kind="forward", key="הרצל באר שבע", fetched_at=time.time(),
+                          result=json.dumps([{"address": "הרצל 3, באר שבע", "latitude": 31.24, "longitude": 34.78}])),
+    ])
+    db.commit()
+    for address in ("הרצל 10, באר שבע", "הרצל 10, באר שבע", "הרצל 12, באר שבע"):
+        db.add(Ad(user_id=1, address=address, latitude=31.25, longitude=34.79,
+                  publish_date=date(2024, 1, 1), **AD_FIELDS))
+    db.commit()
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def suggest(client, q, **params):
+    resp = client.get("/autocomplete", params={"q": q, **params})
+    assert resp.status_code == 200
+    return [(r["name"], r["source"]) for r in resp.json()]
+
+
+def login(client, email="test@example.com", password="password123"):
+    assert client.post("/login/", json={"email": email, "password": password}).status_code == 200
+
+
+def test_prefix_matches_any_word(client, test_db):
+    # Names starting with the prefix first
+    assert suggest(client, "הנג") == [("הנגב הצעיר", "poi"), ("קניון הנגב", "poi")]
+    assert suggest(client, "קני") == [("קניון הנגב", "poi")]
+    assert suggest(client, "xyz") == []
+
+
+def test_ranked_by_source_and_popularity(client, test_db):
+    assert suggest(client, "הרצל") == [
+        ("הרצל 10, באר שבע", "ad"),   # two ads at this address
+        ("הרצל 12, באר שבע", "ad"),
+        ("הרצל 3, באר שבע", "geocoding"),
+    ]
+    assert len(suggest(client, "הרצל", limit=1)) == 1
+
+
+def test_follows_poi_and_ad_changes(client, test_db):
+    assert suggest(client, "פארק") == []
+    client.post("/poi", json={"id": 50, "name": "פארק הנחל", "type": "park", "latitude": 31.26,
+                              "longitude": 34.80, "description": None, "address": None, "tags": None})
+    assert suggest(client, "פארק") == [("פארק הנחל", "poi")]
+    client.put("/poi/50", json={"id": 50, "name": "גן הנחל", "type": "park", "latitude": 31.26,
+                                "longitude": 34.80, "description": None, "address": None, "tags": None})
+    assert suggest(client, "פארק") == []
+    assert suggest(client, "הנחל") == [("גן הנחל", "poi")]
+    client.delete("/poi/50")
+    assert suggest(client, "הנחל") == []
+
+    login(client)
+    resp = client.post("/ads/", json={"address": "ויצמן 4, באר שבע", "latitude": 31.25, "longitude": 34.79,
+                                      **AD_FIELDS})
+    assert suggest(client, "ויצ") == [("ויצמן 4, באר שבע", "ad")]
+    client.post("/logout/")
+    login(client, "admin@example.com", "admin123")
+    client.delete(f"/ads/{resp.json()['id']}")
+    assert suggest(client, "ויצ") == []
+
+
+def test_changes_are_applied_without_a_rebuild(client, test_db):
+    suggest(client, "הנג")
+    index = autocomplete.get_index(TestingSessionLocal())
+    client.post("/poi", json={"id": 51, "name": "הנגב החדש", "type": "park", "latitude": 31.26,
+                              "longitude": 34.80, "description": None, "address": None, "tags": None})
+    assert suggest(client, "הנגב הח") == [("הנגב החדש", "poi")]
+    assert autocomplete.get_index(TestingSessionLocal()) is index
+
+
+def test_rebuilds_after_changes_it_was_not_told_about(client, test_db):
+    suggest(client, "הנג")
+    db = TestingSessionLocal()
+    db.add(POI(name="הנגבית", type="park", latitude=31.26, longitude=34.80))
+    db.commit()
+    versions.bump(db, "pois")
+    db.close()
+    assert ("הנגבית", "poi") in suggest(client, "הנג")
+
+
+def test_new_geocoder_answers_are_suggested(client, test_db, monkeypatch):
+    class Location:
+        address, latitude, longitude = "רגר 7, באר שבע", 31.25, 34.80
+
+    suggest(client, "רגר")
+    monkeypatch.setattr(geolocator, "geocode", lambda *_a, **_kw: [Location()])
+    client.get("/search", params={"q": "רגר 7"})
+    assert suggest(client, "רגר") == [("רגר 7, באר שבע", "geocoding")]
+
+
+def test_memoized_prefixes_stay_current():
+    index = PrefixIndex((("poi", i), Entry(f"בית {i}", "school", 31.0, 34.0, None, "poi", 1)) for i in range(600))
+    assert len(index.search("בית", limit=50)) == 50
+    assert "בית" in index._memo
+    index.put(("ad", "בית"), Entry("בית", "address", 31.0, 34.0, "בית", "ad", 100))
+    assert index.search("בית", limit=1)[0].name == "בית"
+    index.remove(("ad", "בית"))
+    assert index.search("בית", limit=1)[0].source == "poi"
+
+
+def test_remembered_lists_match_a_fresh_index():
+    def entry(i, popularity=1):
+        return Entry(f"גן {i % 7} שושנים {i}", "park", 31.0, 34.0, None, "poi", popularity)
+
+    index = PrefixIndex((("poi", i), entry(i)) for i in range(1500))
+    for i in range(0, 1500, 3):
+        index.remove(("poi", i))
+    for i in range(1, 1500, 3):
+        index.put(("poi", i), entry(i, popularity=i % 11))
+    fresh = PrefixIndex((entry_id, e) for entry_id, e in index.entries.items())
+    for prefix in ("ג", "גן", "גן 3", "ש", "שושנים 1"):
+        assert index.search(prefix, limit=50) == fresh.search(prefix, limit=50)
@@ -0,0 +1,105 @@
+import random
+
+from utils.ranking import score_apartment, calculate_star_rating
+from utils.batch_ranking import AdCatalog, PreferenceProfile, score_ads, star_ratings
+from utils.lru import LRUCache
+
+class DummyAd:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class DummyPrefs:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+PROPERTY_TYPES = ["house", "apartment", "penthouse", "garden_apartment", "private_house"]
+FEATURES = ["parking", "elevator", "balcony", "garden", "pets_allowed", "accessibility", "ac", "mamad"]
+
+
+def random_ad(rng):
+    return DummyAd(
+        property_type=rng.choice(PROPERTY_TYPES),
+        price=rng.randrange(500, 3_000_000, 500),
+        rooms=rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4, 5]),
+        has_parking=rng.random() < 0.5,
+        has_elevator=rng.random() < 0.5,
+        has_balcony=rng.random() < 0.5,
+        has_garden=rng.choice([True, False, None]),
+        pets_allowed=rng.random() < 0.5,
+        accessibility=rng.random() < 0.5,
+    )
+
+
+def random_prefs(rng):
+    features = rng.sample(FEATURES, rng.randrange(0, len(FEATURES)))
+    return DummyPrefs(
+        house_type=rng.choice(PROPERTY_TYPES + ["any", None]),
+        budget_min=rng.choice([None, 1000, 400_000]),
+        budget_max=rng.choice([None, 6000, 2_000_000]),
+        rooms=rng.choice([None, "", "2", "3", "3.5"]),
+        features=rng.choice([None, "", "not json", str(features).replace("'", '"')]),
+    )
+
+
+def test_catalog_matches_per_ad_scoring():
+    rng = random.Random(42)
+    ads = [random_ad(rng) for _ in range(300)]
+    catalog = AdCatalog(ads)
+
+    for _ in range(50):
+        prefs = random_prefs(rng)
+        expected = [score_apartment(ad, prefs) for ad in ads]
+        assert catalog.score(prefs).tolist() == expected
+        assert star_ratings(expected) == [calculate_star_rating(s) for s in expected]
+
+
+def test_repeated_features_are_counted_each_time():
+    ads = [DummyAd(property_type="house", price=100, rooms=3.0, has_parking=False)]
+    prefs = DummyPrefs(house_type=None, budget_min=None, budget_max=None, rooms=None,
+                       features='["parking", "parking"]')
+
+    assert score_ads(ads, prefs) == ([score_apartment(ads[0], prefs)], [0.0])
+
+
+def test_empty_catalog():
+    prefs = DummyPrefs(house_type="house", budget_min=1, budget_max=2, rooms="3", features="[]")
+    assert score_ads([], prefs) == ([], [])
+
+
+def test_private_house_alias():
+    ads = [DummyAd(property_type="house", price=100, rooms=3.0)]
+    prefs = DummyPrefs(house_type="private_house", budget_min=None, budget_max=None, rooms=None, features=None)
+
+    scores, stars = score_ads(ads, prefs)
+    assert scores == [15]
+    assert stars == [calculate_star_rating(15)]
+
+
+def test_compiled_profile_matches_raw_preferences():
+    rng = random.Random(7)
+    ads = [random_ad(rng) for _ in range(100)]
+    catalog = AdCatalog(ads)
+    for _ in range(20):
+        prefs = random_prefs(rng)
+        profile = PreferenceProfile.compile(prefs, user_id=1)
+        assert catalog.score(profile).tolist() == catalog.score(prefs).tolist()
+
+
+def test_rooms_plus_is_a_lower_bound():
+    ads = [DummyAd(property_type="x", price=1, rooms=r) for r in (4, 5, 6.5)]
+    prefs = DummyPrefs(house_type=None, budget_min=None, budget_max=None, rooms="5+", features=None)
+
+    assert score_ads(ads, prefs)[0] == [0, 10, 10]
+    assert [score_apartment(ad, prefs) for ad in ads] == [0, 10, 10]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
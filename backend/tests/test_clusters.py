@@ -0,0 +1,164 @@
+import os
+import random
+import sys
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import Users, Ad, AdCluster
+from utils import clusters
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+BEER_SHEVA = "34.7,31.2,34.9,31.3"
+
+
+def make_ad(**kwargs):
+    values = dict(user_id=1, publisher_name="P", contact_phone="050", ad_type="השכרה",
+                  property_type="apartment", address="רחוב 1", latitude=31.25, longitude=34.79,
+                  rooms=3, size=80, price=5000, publish_date=date(2024, 1, 1))
+    values.update(kwargs)
+    return Ad(**values)
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        Users(email="test@example.com", first_name="Test", last_name="User",
+              password="password123", is_admin=False),
+        Users(email="admin@example.com", first_name="Admin", last_name="User",
+              password="admin123", is_admin=True),
+    ])
+    db.commit()
+    db.add_all([
+        make_ad(latitude=31.24, longitude=34.78, price=3000),
+        make_ad(latitude=31.25, longitude=34.79, price=5000, has_parking=True),
+        make_ad(latitude=31.26, longitude=34.80, price=7000),
+    ])
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def cell_rows():
+    db = TestingSessionLocal()
+    rows = {
+        (c.zoom, c.cell_x, c.cell_y): (c.count, round(c.latitude_sum, 9), round(c.longitude_sum, 9),
+                                      c.min_price, c.max_price)
+        for c in db.query(AdCluster).all()
+    }
+    db.close()
+    return rows
+
+
+def rebuilt_rows():
+    db = TestingSessionLocal()
+    clusters.rebuild(db)
+    db.close()
+    return cell_rows()
+
+
+def login(client, email="test@example.com", password="password123"):
+    assert client.post("/login/", json={"email": email, "password": password}).status_code == 200
+
+
+def test_low_zoom_groups_everything_into_one_cluster(client, test_db):
+    resp = client.get(f"/ads/clusters?zoom=3&bbox={BEER_SHEVA}")
+    assert resp.status_code == 200
+    [cluster] = resp.json()
+    assert cluster["count"] == 3
+    assert cluster["latitude"] == pytest.approx(31.25)
+    assert cluster["longitude"] == pytest.approx(34.79)
+    assert (cluster["min_price"], cluster["max_price"]) == (3000, 7000)
+    assert cluster["best_score"] is None
+
+
+def test_high_zoom_splits_and_clips_to_the_bbox(client, test_db):
+    clusters_at_16 = client.get(f"/ads/clusters?zoom=16&bbox={BEER_SHEVA}").json()
+    assert sorted(c["count"] for c in clusters_at_16) == [1, 1, 1]
+    assert client.get("/ads/clusters?zoom=22&bbox=" + BEER_SHEVA).json() == clusters_at_16
+
+    visible = client.get("/ads/clusters?zoom=16&bbox=34.785,31.245,34.795,31.255").json()
+    assert [c["min_price"] for c in visible] == [5000]
+
+
+def new_ad(price):
+    return {"ad_type": "השכרה", "property_type": "apartment", "address": f"רחוב {price}",
+            "rooms": 3, "size": 80, "price": price, "publisher_name": "P", "contact_phone": "050"}
+
+
+def test_incremental_updates_match_a_rebuild(client, test_db):
+    client.get(f"/ads/clusters?zoom=0&bbox={BEER_SHEVA}")  # builds the table
+    login(client)
+    rng = random.Random(3)
+    for i in range(15):
+        client.post("/ads/", json={**new_ad(rng.choice([1000, 3000, 9000])),
+                                   "latitude": rng.uniform(31.2, 31.3), "longitude": rng.uniform(34.7, 34.9)})
+    client.post("/ads/", json={**new_ad(100), "latitude": 31.25, "longitude": 34.79})
+    client.post("/logout/")
+    login(client, "admin@example.com", "admin123")
+    for ad_id in (1, 3, 5, 8, 13):
+        assert client.delete(f"/ads/{ad_id}").status_code == 200
+
+    incremental = cell_rows()
+    assert incremental == rebuilt_rows()
+
+    # The admin's ads share a cell with user 1's cheapest and dearest ones
+    for price in (1000, 1001, 1002):
+        client.post("/ads/", json={**new_ad(price), "latitude": 31.2501, "longitude": 34.7901})
+    assert client.delete("/users/1").status_code == 200
+    incremental = cell_rows()
+    assert incremental == rebuilt_rows()
+    assert {(row[3], row[4]) for row in incremental.values()} == {(1000, 1002)}
+
+
+def test_best_score_for_signed_in_users(client, test_db):
+    login(client)
+    client.post("/user-preferences/", json={"houseType": "apartment", "rooms": "3", "features": ["parking"],
+                                            "importantLayers": [], "budgetMin": 4000, "budgetMax": 6000})
+    [cluster] = client.get(f"/ads/clusters?zoom=3&bbox={BEER_SHEVA}").json()
+    # apartment +15, budget +20, rooms +10, parking +5
+    assert cluster["best_score"] == 50
+
+    # One ad per cell: each cell's best is its ad's score
+    scores = {(ad["latitude"], ad["longitude"]): ad["score"] for ad in client.get("/ads").json()}
+    by_cell = {(c["latitude"], c["longitude"]): c["best_score"]
+               for c in client.get(f"/ads/clusters?zoom=16&bbox={BEER_SHEVA}").json()}
+    assert by_cell == pytest.approx(scores)
+
+
+def test_invalid_bbox(client, test_db):
+    assert client.get("/ads/clusters?zoom=3&bbox=1,2,3").status_code == 400
+    assert client.get("/ads/clusters?zoom=3&bbox=34.9,31.2,34.7,31.3").status_code == 400
+    assert client.get(f"/ads/clusters?zoom=-1&bbox={BEER_SHEVA}").status_code == 422
@@ -0,0 +1,163 @@
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import Users, Ad, Review
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        Users(email="test@example.com", first_name="Test", last_name="User",
+              password="password123", is_admin=False),
+        Users(email="admin@example.com", first_name="Admin", last_name="User",
+              password="admin123", is_admin=True),
+    ])
+    db.commit()
+    db.add(Ad(user_id=1, publisher_name="P", contact_phone="050", ad_type="השכרה",
+              property_type="apartment", address="רחוב 1", latitude=31.25, longitude=34.79,
+              rooms=3, size=80, price=5000, publish_date=date(2024, 1, 1)))
+    db.add(Review(user_id=1, content="מעולה", rating=5, is_visible=True))
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@contextmanager
+def no_queries():
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(Engine, "before_cursor_execute", listener)
+    try:
+        yield
+    finally:
+        event.remove(Engine, "before_cursor_execute", listener)
+    assert statements == []
+
+
+def revalidate(client, method, path, etag, **kwargs):
+    return client.request(method, path, headers={"If-None-Match": etag}, **kwargs)
+
+
+NEW_AD = {
+    "ad_type": "השכרה", "property_type": "apartment", "address": "רחוב חדש 5",
+    "latitude": 31.26, "longitude": 34.8, "rooms": 3, "size": 90, "price": 5500,
+    "publisher_name": "Test Publisher", "contact_phone": "0501234567",
+}
+POI = {"id": 1, "name": "גן", "type": "park", "latitude": 31.25, "longitude": 34.79,
+       "description": None, "address": None, "tags": None}
+
+
+def test_ads_not_modified_without_touching_the_db(client, test_db):
+    resp = client.get("/ads")
+    etag = resp.headers["etag"]
+    assert etag.startswith('"')
+
+    with no_queries():
+        resp = revalidate(client, "GET", "/ads", etag)
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert resp.content == b""
+
+    assert revalidate(client, "GET", "/ads?sort=price", etag).status_code == 200
+    assert revalidate(client, "GET", "/ads", f'"other", W/{etag}').status_code == 304
+
+
+def test_ad_writes_change_the_etag(client, test_db):
+    etag = client.get("/ads").headers["etag"]
+    client.post("/login/", json={"email": "test@example.com", "password": "password123"})
+    ad_id = client.post("/ads/", json=NEW_AD).json()["id"]
+    client.post("/logout/")
+
+    resp = revalidate(client, "GET", "/ads", etag)
+    assert resp.status_code == 200 and len(resp.json()) == 2
+    etag = resp.headers["etag"]
+
+    client.post("/login/", json={"email": "admin@example.com", "password": "admin123"})
+    client.delete(f"/ads/{ad_id}")
+    client.post("/logout/")
+    assert revalidate(client, "GET", "/ads", etag).status_code == 200
+
+
+def test_personalized_etag_covers_user_and_preferences(client, test_db):
+    anonymous = client.get("/ads").headers["etag"]
+    client.post("/login/", json={"email": "test@example.com", "password": "password123"})
+    assert revalidate(client, "GET", "/ads", anonymous).status_code == 200
+
+    preferences = {"houseType": "apartment", "rooms": "3", "features": [], "importantLayers": [],
+                   "budgetMin": 2000, "budgetMax": 6000}
+    client.post("/user-preferences/", json=preferences)
+    resp = client.get("/ads")
+    assert resp.json()[0]["score"] > 0
+    etag = resp.headers["etag"]
+    with no_queries():
+        assert revalidate(client, "GET", "/ads", etag).status_code == 304
+
+    client.post("/user-preferences/", json={**preferences, "rooms": "4"})
+    assert revalidate(client, "GET", "/ads", etag).status_code == 200
+
+
+def test_map_pois_etag(client, test_db):
+    resp = client.post("/map/pois", json={"layers": ["park"]})
+    etag = resp.headers["etag"]
+    with no_queries():
+        assert revalidate(client, "POST", "/map/pois", etag, json={"layers": ["park"]}).status_code == 304
+    assert revalidate(client, "POST", "/map/pois", etag, json={"layers": ["school"]}).status_code == 200
+
+    client.post("/poi", json=POI)
+    resp = revalidate(client, "POST", "/map/pois", etag, json={"layers": ["park"]})
+    assert resp.status_code == 200
+    assert len(resp.json()["features"]) == 1
+
+
+def test_visible_reviews_etag(client, test_db):
+    resp = client.get("/reviews/visible")
+    etag = resp.headers["etag"]
+    with no_queries():
+        assert revalidate(client, "GET", "/reviews/visible", etag).status_code == 304
+
+    client.post("/login/", json={"email": "admin@example.com", "password": "admin123"})
+    client.patch("/admin/reviews/1/visibility", json={"is_visible": False})
+    resp = revalidate(client, "GET", "/reviews/visible", etag)
+    assert resp.status_code == 200 and resp.json() == []
+    etag = resp.headers["etag"]
+
+    client.put("/update-profile/", json={"email": "test@example.com", "first_name": "T", "last_name": "U"})
+    assert revalidate(client, "GET", "/reviews/visible", etag).status_code == 200
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+
+import pytest
+import requests
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fetch_pois
+from database import Base
+from fetch_pois import POI_TYPES, fetch_all, fetch_pois_from_osm, post_query
+from models import POI, POIStaging
+from tests.stub_overpass import StubOverpass
+from utils import poi_refresh, versions
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def stub():
+    server = StubOverpass()
+    yield server
+    server.close()
+
+
+def test_one_union_query_per_type(stub, test_db):
+    db = TestingSessionLocal()
+    added = fetch_pois_from_osm(db, url=stub.url, workers=4)
+    assert len(stub.queries) == len(POI_TYPES)
+    assert added == sum(len(config["tags"]) for config in POI_TYPES.values())
+
+    rows = {(poi.type, poi.name) for poi in db.query(POI)}
+    assert ("bus_station", '["highway"="bus_stop"]') in rows
+    assert ("bus_station", '["public_transport"="platform"]') in rows
+    assert ("place_of_worship", '["amenity"="place_of_worship"]["religion"="jewish"]') in rows
+    db.close()
+
+
+def test_types_are_fetched_concurrently_within_the_pool(stub):
+    stub.delay = 0.3
+    types = dict(list(POI_TYPES.items())[:8])
+    start = time.monotonic()
+    results = fetch_all(stub.url, fetch_pois.BBOX, workers=4, poi_types=types)
+    elapsed = time.monotonic() - start
+    assert set(results) == set(types)
+    assert stub.max_active == 4
+    # Two rounds of four, not eight in a row
+    assert elapsed < 1.5
+
+
+def test_busy_answers_are_retried(stub):
+    query = fetch_pois.build_query(['["amenity"="bank"]'], fetch_pois.BBOX)
+    stub.statuses = [429, 504]
+    elements = post_query(stub.url, query, backoff=0.01)
+    assert [e["tags"]["name"] for e in elements] == ['["amenity"="bank"]']
+    assert len(stub.queries) == 3
+
+    stub.statuses = [503] * 3
+    with pytest.raises(requests.HTTPError):
+        post_query(stub.url, query, retries=2, backoff=0.01)
+    assert len(stub.queries) == 6
+
+
+def test_failed_types_keep_their_rows(stub, test_db):
+    db = TestingSessionLocal()
+    db.add_all([POI(name="בנק ישן", type="bank", latitude=31.25, longitude=34.79),
+                POI(name="קפה ישן", type="cafe", latitude=31.25, longitude=34.79)])
+    db.commit()
+    stub.broken = {'["amenity"="bank"]'}
+    fetch_pois_from_osm(db, url=stub.url, workers=4)
+
+    assert [poi.name for poi in db.query(POI).filter(POI.type == "bank")] == ["בנק ישן"]
+    assert [poi.name for poi in db.query(POI).filter(POI.type == "cafe")] == ['["amenity"="cafe"]']
+    db.close()
+
+
+def test_refresh_only_writes_what_changed(stub, test_db):
+    db = TestingSessionLocal()
+    fetch_pois_from_osm(db, url=stub.url, workers=4)
+    before = {(poi.type, poi.name): poi.id for poi in db.query(POI)}
+    (version,) = versions.current(db, "pois")
+
+    # The same answer again: nothing is rewritten or invalidated
+    fetch_pois_from_osm(db, url=stub.url, workers=4)
+    assert {(poi.type, poi.name): poi.id for poi in db.query(POI)} == before
+    versions.clear()
+    assert versions.current(db, "pois") == (version,)
+
+    stub.names['["amenity"="cafe"]'] = "קפה חדש"
+    stub.missing = {'["amenity"="bank"]'}
+    fetch_pois_from_osm(db, url=stub.url, workers=4)
+    after = {(poi.type, poi.name): poi.id for poi in db.query(POI)}
+    # Updated in place, deleted, everything else untouched
+    assert after[("cafe", "קפה חדש")] == before[("cafe", '["amenity"="cafe"]')]
+    assert not any(poi_type == "bank" for poi_type, _ in after)
+    assert len(after) == len(before) - 1
+    versions.clear()
+    assert versions.current(db, "pois") == (version + 1,)
+    db.close()
+
+
+def test_staged_rows_are_not_visible_until_applied(stub, test_db):
+    db = TestingSessionLocal()
+    db.add(POI(name="פארק ישן", type="park", latitude=31.25, longitude=34.79))
+    db.commit()
+    rows = [("פארק חדש", "park", 31.26, 34.8, None, "{}", "way", 7)]
+    assert poi_refresh.stage(db, iter(rows))[0] == 1
+    assert [poi.name for poi in db.query(POI)] == ["פארק ישן"]
+
+    counts, types = poi_refresh.apply(db)
+    assert counts == {"deleted": 1, "updated": 0, "inserted": 1}
+    assert types == {"park"}
+    assert [(poi.name, poi.osm_type, poi.osm_id) for poi in db.query(POI)] == [("פארק חדש", "way", 7)]
+    assert db.query(POIStaging).count() == 0
+    db.close()
+
+
+def test_overlapping_filters_are_stored_once(stub, test_db):
+    # The stub answers each filter with its own node at the same spot
+    stub.names = {'["highway"="bus_stop"]': "תחנת הרצל", '["public_transport"="platform"]': "תחנת הרצל"}
+    db = TestingSessionLocal()
+    fetch_pois_from_osm(db, url=stub.url, workers=4)
+    assert sorted(poi.name for poi in db.query(POI).filter(POI.type == "bus_station")) == [
+        '["amenity"="bus_station"]', "תחנת הרצל"]
+    db.close()
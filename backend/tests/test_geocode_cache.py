@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+from main import app, get_db, geolocator
+from database import Base
+from models import GeocodeCacheEntry
+from utils import geocode_cache
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+class DummyLocation:
+    def __init__(self, address, latitude=31.25, longitude=34.79):
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Every call that reached the geocoder, as (method, args)"""
+    made = []
+
+    def reverse(point, **_kw):
+        made.append(("reverse", point))
+        return DummyLocation(f"רחוב {len(made)}, באר שבע") if point[0] > 1 else None
+
+    def geocode(query, **_kw):
+        made.append(("geocode", query))
+        return [DummyLocation(f"{query} {len(made)}")]
+
+    monkeypatch.setattr(geolocator, "reverse", reverse)
+    monkeypatch.setattr(geolocator, "geocode", geocode)
+    return made
+
+
+def test_reverse_is_fetched_once(client, test_db, calls):
+    first = client.get("/reverse_geocode/?lat=31.25&lon=34.79").json()
+    again = client.get("/reverse_geocode/?lat=31.25&lon=34.79").json()
+    assert first == again == {"address": "רחוב 1, באר שבע"}
+    assert calls == [("reverse", (31.25, 34.79))]
+
+
+def test_reverse_key_is_quantized(client, test_db, calls):
+    client.get("/reverse_geocode/?lat=31.250001&lon=34.790002")
+    client.get("/reverse_geocode/?lat=31.249999&lon=34.789998")
+    client.get("/reverse_geocode/?lat=31.2501&lon=34.79")
+    assert calls == [("reverse", (31.25, 34.79)), ("reverse", (31.2501, 34.79))]
+
+
+def test_not_found_is_cached(client, test_db, calls):
+    assert client.get("/reverse_geocode/?lat=0&lon=0").status_code == 404
+    assert client.get("/reverse_geocode/?lat=0&lon=0").status_code == 404
+    assert len(calls) == 1
+
+
+def test_answers_survive_the_memory_cache(client, test_db, calls):
+    client.get("/reverse_geocode/?lat=31.25&lon=34.79")
+    geocode_cache.clear()
+    assert client.get("/reverse_geocode/?lat=31.25&lon=34.79").json() == {"address": "רחוב 1, באר שבע"}
+    assert len(calls) == 1
+
+    db = TestingSessionLocal()
+    assert db.query(GeocodeCacheEntry).filter_by(kind="reverse", key="31.25000,34.79000").count() == 1
+    db.close()
+
+
+def test_expired_answers_are_fetched_again(client, test_db, calls, monkeypatch):
+    monkeypatch.setattr(geocode_cache, "TTL_SECONDS", 0)
+    client.get("/reverse_geocode/?lat=31.25&lon=34.79")
+    assert client.get("/reverse_geocode/?lat=31.25&lon=34.79").json() == {"address": "רחוב 2, באר שבע"}
+    assert len(calls) == 2
+
+    db = TestingSessionLocal()
+    assert db.query(GeocodeCacheEntry).count() == 1
+    db.close()
+
+
+def test_search_caches_by_normalized_query(client, test_db, calls):
+    first = client.get("/search", params={"q": "הרצל"}).json()
+    again = client.get("/search", params={"q": " הֶרְצֵל "}).json()
+    assert first == again
+    assert [r["source"] for r in first] == ["geocoding"]
+    assert calls == [("geocode", "הרצל, באר שבע")]
+
+
+def test_geocoder_errors_are_not_cached(client, test_db, monkeypatch):
+    def fail(*_a, **_kw):
+        raise TimeoutError
+    monkeypatch.setattr(geolocator, "geocode", fail)
+    assert client.get("/search", params={"q": "הרצל"}).json() == []
+
+    monkeypatch.setattr(geolocator, "geocode", lambda *_a, **_kw: [DummyLocation("הרצל, באר שבע")])
+    assert [r["name"] for r in client.get("/search", params={"q": "הרצל"}).json()] == ["הרצל, באר שבע"]
+
+
+def test_answers_after_the_search_deadline_are_cached(client, test_db, monkeypatch):
+    made = []
+
+    def slow_geocode(query, **_kw):
+        made.append(query)
+        time.sleep(0.3)
+        return [DummyLocation("הרצל, באר שבע")]
+    monkeypatch.setattr(geolocator, "geocode", slow_geocode)
+    monkeypatch.setattr(main, "SEARCH_DEADLINE_SECONDS", 0.05)
+
+    resp = client.get("/search", params={"q": "הרצל"})
+    assert resp.headers["X-Search-Partial"] == "true"
+    assert resp.json() == []
+    time.sleep(0.5)
+    resp = client.get("/search", params={"q": "הרצל"})
+    assert resp.headers["X-Search-Partial"] == "false"
+    assert [r["name"] for r in resp.json()] == ["הרצל, באר שבע"]
+    assert len(made) == 1
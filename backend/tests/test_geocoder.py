@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+from main import app, get_db
+from database import Base
+from models import POI
+from utils.geocoder import Geocoder, RateLimiter
+from tests.stub_geocoder import StubGeocoder
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def stub():
+    server = StubGeocoder()
+    yield server
+    server.close()
+
+
+def test_reverse_and_geocode(stub):
+    geocoder = Geocoder(stub.geolocator(), rate=0)
+
+    async def lookups():
+        return await geocoder.reverse(31.25, 34.79), await geocoder.geocode("הרצל, באר שבע")
+
+    address, locations = asyncio.run(lookups())
+    assert address == "רחוב 31.25, באר שבע"
+    assert locations == [{"address": "הרצל, באר שבע", "latitude": 31.25, "longitude": 34.79}]
+    assert stub.paths() == ["/reverse", "/search"]
+
+
+def test_identical_requests_are_coalesced(stub):
+    stub.delay = 0.2
+    geocoder = Geocoder(stub.geolocator(), rate=0)
+
+    async def lookups():
+        return await asyncio.gather(*(geocoder.reverse(31.25, 34.79) for _ in range(5)),
+                                    geocoder.reverse(31.26, 34.79))
+
+    answers = asyncio.run(lookups())
+    assert answers[:5] == ["רחוב 31.25, באר שבע"] * 5
+    assert answers[5] == "רחוב 31.26, באר שבע"
+    assert len(stub.requests) == 2
+
+    # Once answered, the next identical request goes upstream again (caching is geocode_cache's job)
+    asyncio.run(geocoder.reverse(31.25, 34.79))
+    assert len(stub.requests) == 3
+
+
+def test_requests_are_rate_limited(stub):
+    geocoder = Geocoder(stub.geolocator(), rate=10)
+
+    async def lookups():
+        return await asyncio.gather(*(geocoder.geocode(f"רחוב {i}") for i in range(4)))
+
+    asyncio.run(lookups())
+    arrivals = sorted(arrived for _, _, arrived in stub.requests)
+    assert len(arrivals) == 4
+    # Every interval is 100 ms, less some network jitter
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    assert min(gaps) >= 0.08
+
+
+def test_slow_geocoder_times_out(stub):
+    stub.delay = 1.0
+    geocoder = Geocoder(stub.geolocator(), rate=0, timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(geocoder.reverse(31.25, 34.79))
+    assert time.monotonic() - start < 0.8
+
+
+def test_rate_limiter_gives_up_at_the_deadline():
+    limiter = RateLimiter(rate=1)
+    assert limiter.acquire()
+    assert not limiter.acquire(deadline=time.monotonic() + 0.5)
+    # The refused caller did not take the slot
+    assert limiter._next - time.monotonic() <= 1.0
+
+
+def test_event_loop_keeps_running_during_a_lookup(stub):
+    stub.delay = 0.3
+    geocoder = Geocoder(stub.geolocator(), rate=0)
+
+    async def ticker():
+        ticks = 0
+        while not lookup.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return ticks
+
+    async def scenario():
+        nonlocal lookup
+        lookup = asyncio.ensure_future(geocoder.reverse(31.25, 34.79))
+        ticks = await ticker()
+        return ticks, await lookup
+
+    lookup = None
+    ticks, address = asyncio.run(scenario())
+    assert address == "רחוב 31.25, באר שבע"
+    assert ticks >= 10
+
+
+def test_reverse_geocode_endpoint_times_out(stub, test_db, monkeypatch):
+    stub.delay = 1.0
+    monkeypatch.setattr(main, "geocoder", Geocoder(stub.geolocator(), rate=0, timeout=0.2))
+    with TestClient(app) as client:
+        resp = client.get("/reverse_geocode/?lat=31.25&lon=34.79")
+    assert resp.status_code == 504
+
+
+def test_search_endpoint_uses_the_geocoder(stub, test_db, monkeypatch):
+    monkeypatch.setattr(main, "geocoder", Geocoder(stub.geolocator(), rate=0))
+    with TestClient(app) as client:
+        results = client.get("/search", params={"q": "הרצל"}).json()
+    assert [r["name"] for r in results] == ["הרצל, באר שבע"]
+    assert stub.requests[0][1]["q"] == "הרצל, באר שבע"
+
+
+def test_search_returns_pois_when_geocoding_misses_the_deadline(stub, test_db, monkeypatch):
+    db = TestingSessionLocal()
+    db.add(POI(name="הרצל", type="park", latitude=31.25, longitude=34.79))
+    db.commit()
+    db.close()
+    stub.delay = 1.0
+    monkeypatch.setattr(main, "geocoder", Geocoder(stub.geolocator(), rate=0))
+    monkeypatch.setattr(main, "SEARCH_DEADLINE_SECONDS", 0.2)
+    with TestClient(app) as client:
+        start = time.monotonic()
+        resp = client.get("/search", params={"q": "הרצל"})
+        elapsed = time.monotonic() - start
+    assert resp.headers["X-Search-Partial"] == "true"
+    assert [(r["name"], r["source"]) for r in resp.json()] == [("הרצל", "poi")]
+    assert elapsed < 0.8
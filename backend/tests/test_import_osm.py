@@ -0,0 +1,127 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Base
+from import_osm import import_osm_data, matching_types, tag_filters
+from models import OSMData, POI
+from utils.osm_extract import iter_elements
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="31.2500" lon="34.7900"><tag k="amenity" v="school"/><tag k="name" v="בית ספר אשל"/></node>
+  <node id="2" lat="31.2510" lon="34.7910">
+    <tag k="highway" v="bus_stop"/><tag k="public_transport" v="platform"/><tag k="name" v="תחנת הרצל"/>
+  </node>
+  <node id="3" lat="31.2520" lon="34.7920"><tag k="amenity" v="pharmacy"/></node>
+  <node id="4" lat="31.2530" lon="34.7930"><tag k="amenity" v="place_of_worship"/><tag k="religion" v="christian"/></node>
+  <node id="5" lat="32.0800" lon="34.7800"><tag k="amenity" v="school"/><tag k="name" v="בית ספר בתל אביב"/></node>
+  <node id="10" lat="31.2600" lon="34.8000"/>
+  <node id="11" lat="31.2600" lon="34.8020"/>
+  <node id="12" lat="31.2620" lon="34.8020"/>
+  <node id="13" lat="31.2700" lon="34.8100"/>
+  <node id="14" lat="31.2710" lon="34.8110"/>
+  <way id="100">
+    <nd ref="10"/><nd ref="11"/><nd ref="12"/>
+    <tag k="leisure" v="park"/><tag k="name" v="פארק הנחל"/>
+  </way>
+  <way id="101">
+    <nd ref="13"/><nd ref="14"/>
+    <tag k="highway" v="residential"/><tag k="name" v="טוביהו"/>
+  </way>
+</osm>
+"""
+
+BEER_SHEVA = (31.2, 34.7, 31.3, 34.9)
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def extract(tmp_path):
+    path = tmp_path / "beer-sheva.osm"
+    path.write_text(EXTRACT, encoding="utf-8")
+    return path
+
+
+def pois(db):
+    return sorted((p.type, p.name, p.osm_type, p.osm_id, round(p.latitude, 4), round(p.longitude, 4))
+                  for p in db.query(POI))
+
+
+def test_filters_match_like_the_overpass_queries():
+    filters = tag_filters()
+    assert matching_types({"amenity": "place_of_worship", "religion": "jewish"}, filters) == ["place_of_worship"]
+    assert matching_types({"amenity": "place_of_worship"}, filters) == []
+    assert matching_types({"highway": "bus_stop", "public_transport": "platform"}, filters) == ["bus_station"]
+    assert matching_types({"amenity": "college"}, filters) == ["university"]
+    assert matching_types({}, filters) == []
+
+
+def test_import_writes_pois_and_osm_data(extract, test_db):
+    db = TestingSessionLocal()
+    assert import_osm_data(extract, db, bbox=BEER_SHEVA) == 4
+    assert pois(db) == [
+        ("bus_station", "תחנת הרצל", "node", 2, 31.251, 34.791),
+        ("park", "פארק הנחל", "way", 100, 31.2607, 34.8013),
+        ("pharmacy", "בית מרקחת ללא שם", "node", 3, 31.252, 34.792),
+        ("school", "בית ספר אשל", "node", 1, 31.25, 34.79),
+    ]
+    assert sorted((row.osm_id, row.amenity) for row in db.query(OSMData)) == [
+        ("node/1", "school"), ("node/2", "bus_station"), ("node/3", "pharmacy"), ("way/100", "park")]
+    db.close()
+
+
+def test_reimport_replaces_osm_pois_only_where_changed(extract, test_db):
+    db = TestingSessionLocal()
+    import_osm_data(extract, db)
+    ids = {p.osm_id: p.id for p in db.query(POI)}
+    assert 5 in ids
+
+    extract.write_text(EXTRACT.replace("בית ספר אשל", "בית ספר אשל החדש"), encoding="utf-8")
+    import_osm_data(extract, db, bbox=BEER_SHEVA)
+    assert {p.osm_id: p.id for p in db.query(POI)} == {k: v for k, v in ids.items() if k != 5}
+    assert db.query(POI).filter(POI.osm_id == 1).one().name == "בית ספר אשל החדש"
+    assert db.query(OSMData).count() == 4
+    db.close()
+
+
+def test_missing_extract_leaves_the_tables_alone(tmp_path, test_db):
+    db = TestingSessionLocal()
+    db.add(POI(name="פארק", type="park", latitude=31.25, longitude=34.79))
+    db.commit()
+    assert import_osm_data(tmp_path / "missing.osm.pbf", db) == 0
+    assert [p.name for p in db.query(POI)] == ["פארק"]
+    db.close()
+
+
+def test_pbf_extract(extract, tmp_path, test_db):
+    osmium = pytest.importorskip("osmium")
+    pbf = tmp_path / "beer-sheva.osm.pbf"
+    with osmium.SimpleWriter(str(pbf)) as writer:
+        for obj in osmium.FileProcessor(str(extract)):
+            writer.add(obj)
+    for path in (extract, pbf):
+        selected = iter_elements(path, kinds=("node",), keys={"amenity"}, ids={2, 11, 100})
+        assert sorted(element.id for element in selected) == [1, 2, 3, 4, 5, 11]
+
+    db = TestingSessionLocal()
+    assert import_osm_data(pbf, db, bbox=BEER_SHEVA) == 4
+    assert ("park", "פארק הנחל", "way", 100, 31.2607, 34.8013) in pois(db)
+    db.close()
@@ -0,0 +1,145 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+from main import app, get_db
+from database import Base
+from utils.geocoder import Geocoder
+from utils.local_geocoder import AddressIndex, LocalGeocoder
+from utils.osm_extract import iter_elements
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="31.2500" lon="34.7900">
+    <tag k="addr:street" v="הרצל"/><tag k="addr:housenumber" v="12"/><tag k="addr:city" v="באר שבע"/>
+  </node>
+  <node id="2" lat="31.2502" lon="34.7903">
+    <tag k="addr:street" v="הרצל"/><tag k="addr:housenumber" v="14א"/>
+  </node>
+  <node id="3" lat="31.2600" lon="34.8000">
+    <tag k="addr:street" v="שדרות רגר"/><tag k="addr:housenumber" v="5"/><tag k="addr:city" v="באר שבע"/>
+  </node>
+  <node id="4" lat="32.0800" lon="34.7800">
+    <tag k="addr:street" v="הרצל"/><tag k="addr:housenumber" v="12"/><tag k="addr:city" v="תל אביב"/>
+  </node>
+  <node id="10" lat="31.2700" lon="34.8100"/>
+  <node id="11" lat="31.2710" lon="34.8110"/>
+  <node id="12" lat="31.2400" lon="34.7700"/>
+  <node id="13" lat="31.2420" lon="34.7720"/>
+  <node id="20" lat="31.2450" lon="34.7800"><tag k="amenity" v="school"/></node>
+  <way id="100">
+    <nd ref="10"/><nd ref="11"/>
+    <tag k="building" v="yes"/><tag k="addr:street" v="יהודה הלוי"/><tag k="addr:housenumber" v="3"/>
+  </way>
+  <way id="101">
+    <nd ref="12"/><nd ref="13"/>
+    <tag k="highway" v="residential"/><tag k="name" v="טוביהו"/>
+  </way>
+  <relation id="500"><member type="way" ref="100" role="outer"/><tag k="type" v="multipolygon"/></relation>
+</osm>
+"""
+
+
+@pytest.fixture(scope="module")
+def extract(tmp_path_factory):
+    path = tmp_path_factory.mktemp("osm") / "beer-sheva.osm"
+    path.write_text(EXTRACT, encoding="utf-8")
+    return path
+
+
+@pytest.fixture(scope="module")
+def index(extract):
+    return AddressIndex.build(extract, default_city="באר שבע")
+
+
+@pytest.fixture
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def labels(results):
+    return [label for label, _, _ in results]
+
+
+def test_reader_streams_nodes_then_ways(extract):
+    elements = list(iter_elements(extract))
+    assert [e.kind for e in elements] == ["node"] * 9 + ["way"] * 2
+    assert elements[0].tags["addr:street"] == "הרצל"
+    assert elements[-1].refs == [12, 13]
+
+
+def test_build_reads_nodes_ways_and_named_streets(index):
+    assert len(index.latitudes) == 6
+    assert index.search("יהודה הלוי 3") == [("יהודה הלוי 3, באר שבע", pytest.approx(31.2705), pytest.approx(34.8105))]
+    assert labels(index.search("טוביהו")) == ["טוביהו, באר שבע"]
+
+
+def test_forward_search(index):
+    assert labels(index.search("הרצל 12, באר שבע")) == ["הרצל 12, באר שבע"]
+    assert labels(index.search("הרצל 12, תל אביב")) == ["הרצל 12, תל אביב"]
+    assert labels(index.search("הרצל 14")) == ["הרצל 14א, באר שבע"]
+    # A house number the street doesn't have gives the street
+    assert labels(index.search("רגר 99, באר שבע")) == ["שדרות רגר, באר שבע"]
+
+
+def test_forward_search_by_prefix_and_similarity(index):
+    assert labels(index.search("שדרות ר")) == ["שדרות רגר, באר שבע"]
+    assert labels(index.search("שדרות רגרר 5")) == ["שדרות רגר 5, באר שבע"]
+    assert index.search("רחוב שאינו קיים") == []
+
+
+def test_reverse(index):
+    assert index.nearest(31.25001, 34.79001)[0] == "הרצל 12, באר שבע"
+    assert index.nearest(31.20, 34.70) is None
+
+
+def test_save_and_load(index, tmp_path):
+    index.save(tmp_path / "addresses.npz")
+    loaded = AddressIndex.load(tmp_path / "addresses.npz")
+    assert loaded.search("הרצל 12, באר שבע") == index.search("הרצל 12, באר שבע")
+    assert loaded.nearest(31.26, 34.80) == index.nearest(31.26, 34.80)
+
+
+def test_pbf_extract(extract, tmp_path):
+    osmium = pytest.importorskip("osmium")
+    pbf = tmp_path / "beer-sheva.osm.pbf"
+    with osmium.SimpleWriter(str(pbf)) as writer:
+        for obj in osmium.FileProcessor(str(extract)):
+            writer.add(obj)
+    index = AddressIndex.build(pbf, default_city="באר שבע")
+    assert labels(index.search("יהודה הלוי 3")) == ["יהודה הלוי 3, באר שבע"]
+
+
+def test_endpoints_use_the_local_geocoder(index, test_db, monkeypatch):
+    monkeypatch.setattr(main, "geocoder", Geocoder(LocalGeocoder(index)))
+    with TestClient(app) as client:
+        assert client.get("/reverse_geocode/?lat=31.26&lon=34.80").json() == {"address": "שדרות רגר 5, באר שבע"}
+        assert client.get("/reverse_geocode/?lat=31.0&lon=34.0").status_code == 404
+        results = client.get("/search", params={"q": "הרצל 12"}).json()
+    assert [(r["name"], r["source"]) for r in results] == [("הרצל 12, באר שבע", "geocoding")]
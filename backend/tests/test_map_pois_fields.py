@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import POI
+from utils import poi_layers
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        POI(name="גן ילדים", type="kindergarten", latitude=31.25, longitude=34.79,
+            tags='{"amenity": "kindergarten", "opening_hours": "07:30-16:00", "wheelchair": "yes", "source": "survey"}'),
+        POI(name="בית ספר", type="school", latitude=31.25, longitude=34.791, tags='{"amenity": "school"}'),
+        POI(name="גן העיר", type="park", latitude=31.25, longitude=34.79),
+    ])
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def test_map_pois_projection(client, test_db):
+    full = client.post("/map/pois", json={"layers": ["kindergarten"]})
+    assert full.json()["features"][0]["properties"]["tags"]["source"] == "survey"
+
+    resp = client.post("/map/pois", json={"layers": ["kindergarten", "school"], "fields": ["name", "tags"],
+                                          "include_tags": ["opening_hours", "wheelchair", "name"]})
+    assert resp.status_code == 200
+    kindergarten, school = resp.json()["features"]
+    assert kindergarten["properties"] == {"name": "גן ילדים",
+                                          "tags": {"opening_hours": "07:30-16:00", "wheelchair": "yes"}}
+    assert school["properties"] == {"name": "בית ספר", "tags": {}}
+    assert kindergarten["geometry"]["coordinates"] == [34.79, 31.25]
+
+    minimal = client.post("/map/pois", json={"layers": ["kindergarten"], "fields": ["name"]})
+    assert minimal.json()["features"][0]["properties"] == {"name": "גן ילדים"}
+    assert minimal.headers["etag"] != full.headers["etag"]
+    assert len(minimal.content) < len(full.content)
+
+    assert client.post("/map/pois", json={"layers": ["park"], "fields": ["address"]}).status_code == 422
+
+
+def test_projections_do_not_evict_full_layers(client, test_db):
+    client.post("/map/pois", json={"layers": ["kindergarten", "school"]})
+    for i in range(poi_layers.projected.maxsize + 5):
+        client.post("/map/pois", json={"layers": ["kindergarten"], "fields": ["name", "tags"],
+                                       "include_tags": [f"key{i}"]})
+    assert len(poi_layers.projected) == poi_layers.projected.maxsize
+    assert len(poi_layers.fragments) == 2
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.poi_dedupe import Deduper, dedupe
+
+# About one metre in latitude
+METRE = 1 / 111_195
+
+
+def row(name, lat, lon=34.79, poi_type="bus_station", osm_type="node", osm_id=None):
+    return (name, poi_type, lat, lon, None, "{}", osm_type, osm_id)
+
+
+def test_same_element_is_kept_once_per_type():
+    rows = [row("תחנה", 31.25, osm_id=1), row("תחנה אחרת", 31.3, osm_id=1),
+            row("תחנה", 31.25, osm_type="way", osm_id=1), row("תחנה", 31.25, poi_type="shelter", osm_id=1)]
+    assert list(dedupe(rows, Deduper(distance_m=0))) == [rows[0], rows[2], rows[3]]
+
+
+def test_same_name_within_a_few_metres_is_merged():
+    deduper = Deduper(distance_m=10)
+    rows = [
+        row("תחנה מרכזית", 31.25, osm_id=1),
+        row("תחנה מרכזית", 31.25 + 6 * METRE, osm_type="way", osm_id=2),   # its platform
+        row("תחנה מרכזית", 31.25 + 30 * METRE, osm_id=3),                  # too far
+        row("תחנת רכבת", 31.25, osm_id=4),                                 # other name
+        row("תחנה מרכזית", 31.25, poi_type="train_station", osm_id=5),     # other type
+    ]
+    assert list(dedupe(rows, deduper)) == [rows[0], rows[2], rows[3], rows[4]]
+    assert deduper.dropped == {"bus_station": 1}
+
+
+def test_neighbouring_cells_are_searched():
+    deduper = Deduper(distance_m=10)
+    kept = 0
+    # Pairs 3 m apart at many offsets, so some straddle cell boundaries
+    for i in range(200):
+        lat = 31.25 + i * 1.7 * METRE
+        kept += sum(deduper.keep(r) for r in (row(f"ספסל {i}", lat), row(f"ספסל {i}", lat + 3 * METRE)))
+    assert kept == 200
+
+
+def test_unnamed_elements_are_matched_by_element_only():
+    deduper = Deduper(distance_m=10)
+    rows = [
+        row("בית מרקחת ללא שם", 31.25, osm_id=1),
+        row("בית מרקחת ללא שם", 31.25 + 3 * METRE, osm_id=2),   # another unnamed pharmacy
+        row("בית מרקחת ללא שם", 31.25, osm_type="way", osm_id=2),
+        row("בית מרקחת ללא שם", 31.25, osm_id=1),               # same element again
+    ]
+    assert list(dedupe(rows, deduper)) == rows[:3]
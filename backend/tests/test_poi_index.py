@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+from utils.batch_ranking import AdCatalog, PreferenceProfile
+from utils.poi_index import POIIndex, PROXIMITY_MAX
+
+
+class DummyAd:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class DummyPrefs:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+def random_pois(rng, count, types=("school", "park")):
+    return [
+        (i + 1, types[i % len(types)], 31.2 + rng.random() * 0.1, 34.7 + rng.random() * 0.2)
+        for i in range(count)
+    ]
+
+
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(1)
+    pois = random_pois(rng, 200)
+    index = POIIndex(pois)
+    lats = 31.2 + rng.random(50) * 0.1
+    lons = 34.7 + rng.random(50) * 0.2
+
+    distances, ids = index.nearest("school", lats, lons)
+    for lat, lon, distance, poi_id in zip(lats, lons, distances, ids):
+        best = min((haversine(lat, lon, p[2], p[3]), p[0]) for p in pois if p[1] == "school")
+        assert poi_id == best[1]
+        assert abs(distance - best[0]) < 0.01
+
+
+def test_count_within_matches_brute_force():
+    rng = np.random.default_rng(2)
+    pois = random_pois(rng, 300)
+    index = POIIndex(pois)
+    lats = 31.2 + rng.random(30) * 0.1
+    lons = 34.7 + rng.random(30) * 0.2
+
+    counts = index.count_within("park", lats, lons, 1000)
+    for lat, lon, count in zip(lats, lons, counts):
+        assert count == sum(1 for p in pois if p[1] == "park" and haversine(lat, lon, p[2], p[3]) <= 1000)
+
+
+def test_missing_layer_and_coordinates():
+    index = POIIndex([(1, "school", 31.25, 34.79), (2, "park", None, None)])
+
+    distances, ids = index.nearest("park", [31.25], [34.79])
+    assert distances[0] == np.inf and ids[0] == -1
+
+    distances, ids = index.nearest("school", [float("nan"), 31.25], [float("nan"), 34.79])
+    assert ids.tolist() == [-1, 1]
+    assert distances[1] < 0.01
+
+
+def test_proximity_points_by_distance_and_cap():
+    # ~0.0009 degrees of latitude per 100 m
+    index = POIIndex([(1, "school", 31.25, 34.79), (2, "park", 31.2536, 34.79)])
+    lats = [31.25, 31.2536, 31.2545, 31.2635, 31.30]
+    lons = [34.79] * 5
+
+    assert index.proximity_scores(["school"], lats, lons).tolist() == [5, 3, 1, 0, 0]
+    assert index.proximity_scores(["school"] * 10, lats[:1], lons[:1]).tolist() == [PROXIMITY_MAX]
+
+
+def test_catalog_and_single_ad_scoring_include_proximity():
+    index = POIIndex([(1, "school", 31.25, 34.79)])
+    ads = [
+        DummyAd(property_type="apartment", price=100, rooms=3, latitude=31.25, longitude=34.79),
+        DummyAd(property_type="apartment", price=100, rooms=3, latitude=31.35, longitude=34.79),
+        DummyAd(property_type="apartment", price=100, rooms=3, latitude=None, longitude=None),
+    ]
+    prefs = DummyPrefs(house_type="apartment", budget_min=None, budget_max=None, rooms=None,
+                       features=None, important_layers='["school"]')
+    profile = PreferenceProfile.compile(prefs, user_id=1)
+
+    assert profile.important_layers == ("school",)
+    assert AdCatalog(ads).score(profile).tolist() == [15, 15, 15]
+    assert AdCatalog(ads).score(profile, index).tolist() == [20, 15, 15]
+    assert [profile.score_ad(ad, index) for ad in ads] == [20, 15, 15]
+
+
+def test_invalid_important_layers_are_ignored():
+    prefs = DummyPrefs(house_type=None, budget_min=None, budget_max=None, rooms=None,
+                       features=None, important_layers="not json")
+    assert PreferenceProfile.compile(prefs).important_layers == ()
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Base
+from models import POI
+from utils import poi_loader
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_load_writes_batches_in_the_callers_transaction(test_db):
+    rows = [(f"גן שעשועים {i}", "playground", 31.25, 34.79, None if i % 2 else "הרצל", "{}", "node", 10**10 + i)
+            for i in range(25)]
+    db = TestingSessionLocal()
+    count, seconds = poi_loader.load(db, iter(rows), batch_size=10)
+    assert count == 25 and seconds >= 0
+    db.rollback()
+    assert db.query(POI).count() == 0
+
+    poi_loader.load(db, iter(rows), batch_size=10)
+    db.commit()
+    pois = db.query(POI).order_by(POI.id).all()
+    assert [(p.name, p.type, p.latitude, p.longitude, p.address, p.tags, p.osm_type, p.osm_id) for p in pois] == rows
+    # Filled in as models.POI does for ORM writes
+    assert pois[0].name_normalized == "גנ שעשועימ 0"
+    db.close()
+
+
+def test_copy_input_keeps_nulls_and_empty_strings_apart():
+    buffer = poi_loader.copy_buffer([("קפה\t\"נחת\"", "cafe", 31.25, 34.79, None, ""),
+                                     ("שורה\nשנייה \\", "cafe", 31.0, 34.0, "", None)])
+    assert buffer.getvalue() == (
+        'קפה\\t"נחת"\tcafe\t31.25\t34.79\t\\N\t\n'
+        'שורה\\nשנייה \\\\\tcafe\t31.0\t34.0\t\t\\N\n'
+    )
@@ -0,0 +1,156 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db, geolocator
+from database import Base
+from models import POI
+from utils.hebrew import normalize, trigrams
+from utils import poi_search
+from utils.poi_search import NGramIndex
+from utils.search_merge import dedupe
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        POI(name="בית הספר רמות", type="school", latitude=31.27, longitude=34.81),
+        POI(name="בית ספר אשל", type="school", latitude=31.25, longitude=34.79),
+        POI(name="פארק הנחל", type="park", latitude=31.26, longitude=34.80),
+        POI(name="קניון הנגב", type="shopping", latitude=31.24, longitude=34.79),
+        POI(name="צ׳יפס של רינה", type="restaurant", latitude=31.25, longitude=34.78),
+    ])
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(geolocator, "geocode", lambda *_a, **_kw: None)
+    with TestClient(app) as c:
+        yield c
+
+
+def search(client, q, **params):
+    resp = client.get("/search", params={"q": q, **params})
+    assert resp.status_code == 200
+    return [r["name"] for r in resp.json() if r["source"] == "poi"]
+
+
+def test_normalize_strips_niqqud_geresh_and_final_letters():
+    assert normalize("בֵּית סֵפֶר") == "בית ספר"
+    assert normalize("צ׳יפס") == normalize("צ'יפס") == "ציפס"
+    assert normalize("קניון") == normalize("קנייון") == "קניונ"
+    assert normalize("Beer-Sheva!") == "beer sheva"
+    assert normalize(None) == ""
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("אב") == {"  א", " אב", "אב "}
+    assert trigrams("אב אב") == trigrams("אב")
+
+
+def test_index_ranks_by_similarity():
+    index = NGramIndex([(1, normalize("פארק הנחל")), (2, normalize("פארק")), (3, normalize("קניון"))])
+    ranked = index.search(normalize("פארק"), limit=10)
+    assert [poi_id for poi_id, _ in ranked] == [2, 1]
+    assert ranked[0][1] == 1.0
+
+
+def test_search_ranks_exact_match_first(client, test_db):
+    assert search(client, "בית ספר")[:2] == ["בית ספר אשל", "בית הספר רמות"]
+
+
+def test_search_matches_spelling_variants(client, test_db):
+    assert search(client, "קנייון") == ["קניון הנגב"]
+    assert search(client, "ציפס") == ["צ׳יפס של רינה"]
+    assert search(client, "פַּארְק") == ["פארק הנחל"]
+
+
+def test_search_matches_substrings(client, test_db):
+    assert search(client, "נגב") == ["קניון הנגב"]
+
+
+def test_search_limit(client, test_db):
+    assert len(search(client, "בית ספר", limit=1)) == 1
+    assert client.get("/search", params={"q": "x", "limit": 0}).status_code == 422
+
+
+def test_search_sees_new_pois(client, test_db):
+    assert search(client, "ספריה") == []
+    resp = client.post("/poi", json={"id": 100, "name": "ספריה עירונית", "type": "library",
+                                      "latitude": 31.25, "longitude": 34.79,
+                                      "description": None, "address": None, "tags": None})
+    assert resp.status_code == 200
+    assert search(client, "ספרייה") == ["ספריה עירונית"]
+
+
+class DummyLocation:
+    def __init__(self, address, latitude, longitude):
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+def test_search_merges_sources_without_duplicates(client, test_db, monkeypatch):
+    monkeypatch.setattr(geolocator, "geocode", lambda *_a, **_kw: [
+        DummyLocation("קניון הנגב, שדרות טוביהו, באר שבע", 31.2402, 34.7901),
+        DummyLocation("קניון הנגב, באר שבע", 31.30, 34.85),
+    ])
+    resp = client.get("/search", params={"q": "קניון הנגב"})
+    assert resp.headers["X-Search-Partial"] == "false"
+    assert [(r["name"], r["source"]) for r in resp.json()] == [
+        ("קניון הנגב", "poi"),
+        ("קניון הנגב, באר שבע", "geocoding"),
+    ]
+
+
+def test_dedupe_needs_both_name_and_proximity():
+    results = [
+        {"name": "פארק הנחל", "latitude": 31.26, "longitude": 34.80},
+        {"name": "פַּארק הנחל, באר שבע", "latitude": 31.2605, "longitude": 34.8005},
+        {"name": "פארק הנחל", "latitude": 31.27, "longitude": 34.80},
+        {"name": "גן המדע", "latitude": 31.26, "longitude": 34.80},
+    ]
+    assert dedupe(results) == [results[0], results[2], results[3]]
+
+
+def test_poi_edits_are_applied_without_a_rebuild(client, test_db):
+    assert search(client, "ספריה") == []
+    index = poi_search.get_index(TestingSessionLocal())
+    poi = {"id": 100, "name": "ספריה עירונית", "type": "library", "latitude": 31.25,
+           "longitude": 34.79, "description": None, "address": None, "tags": None}
+    client.post("/poi", json=poi)
+    assert search(client, "ספריה") == ["ספריה עירונית"]
+    client.put("/poi/100", json={**poi, "name": "ספריית הנגב"})
+    assert search(client, "ספריה") == ["ספריית הנגב"]
+    client.delete("/poi/100")
+    assert search(client, "ספריה") == []
+    assert poi_search.get_index(TestingSessionLocal()) is index
@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import Users, Ad, POI, Review
+from utils.streaming import iter_json_array
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+ROWS = 2500  # more than one chunk
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(Users(email="admin@example.com", first_name="Admin", last_name="User",
+                 password="admin123", is_admin=True))
+    db.commit()
+    db.execute(Ad.__table__.insert(), [
+        {"user_id": 1, "publisher_name": "P", "contact_phone": "050", "ad_type": "השכרה",
+         "property_type": "apartment", "address": f"רחוב {i}", "latitude": 31.25, "longitude": 34.79,
+         "rooms": 3, "size": 80, "price": 1000 + i, "publish_date": date(2024, 1, 1)}
+        for i in range(ROWS)
+    ])
+    db.execute(POI.__table__.insert(), [
+        {"name": f"פארק {i}", "type": "park", "latitude": 31.25, "longitude": 34.79,
+         "tags": json.dumps({"leisure": "park"}) if i % 2 else None}
+        for i in range(ROWS)
+    ])
+    db.execute(Review.__table__.insert(), [
+        {"user_id": 1, "content": f"ביקורת {i}", "rating": 5, "created_at": date(2024, 1, 1)}
+        for i in range(ROWS)
+    ])
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def test_iter_json_array_chunks():
+    chunks = list(iter_json_array(range(5), lambda i: {"i": i}, chunk_size=2))
+    assert chunks[0] == b"[" and chunks[-1] == b"]"
+    assert len(chunks) == 5
+    assert json.loads(b"".join(chunks)) == [{"i": i} for i in range(5)]
+    assert b"".join(iter_json_array([], str)) == b"[]"
+
+
+def test_get_ads_is_streamed(client, test_db):
+    resp = client.get("/ads")
+    assert resp.status_code == 200
+    assert "content-length" not in resp.headers
+    ads = resp.json()
+    assert len(ads) == ROWS
+    assert ads[0]["address"] == "רחוב 0"
+    assert ads[-1]["price"] == 1000 + ROWS - 1
+
+
+def test_admin_ads_are_streamed(client, test_db):
+    assert client.get("/admin/ads").status_code == 403
+    client.post("/login/", json={"email": "admin@example.com", "password": "admin123"})
+    resp = client.get("/admin/ads")
+    assert resp.status_code == 200
+    ads = resp.json()
+    assert len(ads) == ROWS
+    assert ads[0]["publish_date"] == "2024-01-01"
+
+
+def test_map_pois_are_one_body_of_cached_fragments(client, test_db):
+    # Not streamed: the layers' pre-encoded fragments are joined into one body
+    resp = client.post("/map/pois", json={"layers": ["park"]})
+    assert resp.status_code == 200
+    assert int(resp.headers["content-length"]) == len(resp.content)
+    collection = resp.json()
+    assert collection["type"] == "FeatureCollection"
+    assert len(collection["features"]) == ROWS
+    assert collection["features"][0]["properties"]["tags"] == {}
+    assert collection["features"][1]["properties"]["tags"] == {"leisure": "park"}
+    assert collection["features"][1]["geometry"]["coordinates"] == [34.79, 31.25]
+
+    assert client.post("/map/pois", json={"layers": ["school"]}).json()["features"] == []
+
+
+def test_reviews_are_streamed(client, test_db):
+    reviews = client.get("/reviews/").json()
+    assert len(reviews) == ROWS
+    assert reviews[-1] == {"id": ROWS, "user_id": 1, "content": f"ביקורת {ROWS - 1}",
+                           "rating": 5, "created_at": "2024-01-01"}
@@ -0,0 +1,150 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import app, get_db
+from database import Base
+from models import POI
+from utils.tiles import tile_bounds
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+# The z14 tile around central Beer Sheva (31.25, 34.79)
+TILE = "/map/tiles/14/9775/6693"
+
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([
+        POI(name="גן העיר", type="park", latitude=31.25, longitude=34.79),
+        POI(name="בית ספר", type="school", latitude=31.25, longitude=34.791, tags='{"amenity": "school"}'),
+        POI(name="פארק רחוק", type="park", latitude=31.30, longitude=34.85),
+    ])
+    db.commit()
+    yield
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def names(resp):
+    assert resp.status_code == 200
+    return sorted(f["properties"]["name"] for f in resp.json()["features"])
+
+
+def count_queries(fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(Engine, "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(Engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_tile_bounds():
+    assert tile_bounds(0, 0, 0) == pytest.approx((-85.0511287798, -180, 85.0511287798, 180))
+    south, west, north, east = tile_bounds(14, 9775, 6693)
+    assert south < 31.25 <= north and west <= 34.79 < east
+
+
+def test_tile_serves_only_its_pois(client, test_db):
+    assert names(client.get(f"{TILE}?layers=park,school")) == ["בית ספר", "גן העיר"]
+    assert names(client.get(f"{TILE}?layers=park")) == ["גן העיר"]
+    assert names(client.get("/map/tiles/0/0/0?layers=park")) == ["גן העיר", "פארק רחוק"]
+    assert names(client.get("/map/tiles/14/0/0?layers=park")) == []
+
+    feature = client.get(f"{TILE}?layers=school").json()["features"][0]
+    assert feature["properties"]["tags"] == {"amenity": "school"}
+    assert feature["geometry"]["coordinates"] == [34.791, 31.25]
+
+
+def test_cached_tiles_skip_the_db(client, test_db):
+    first = client.get(f"{TILE}?layers=park,school")
+    assert first.headers["cache-control"] == "public, max-age=60"
+
+    resp, queries = count_queries(lambda: client.get(f"{TILE}?layers=school,park"))
+    assert queries == 0
+    assert resp.content == first.content
+
+    resp, queries = count_queries(
+        lambda: client.get(f"{TILE}?layers=park", headers={"If-None-Match": first.headers["etag"]}))
+    assert resp.status_code == 200 and queries == 0
+
+    resp = client.get(f"{TILE}?layers=park,school", headers={"If-None-Match": first.headers["etag"]})
+    assert resp.status_code == 304
+
+
+def test_poi_changes_invalidate_their_layer(client, test_db):
+    client.get(f"{TILE}?layers=park,school")
+    poi = {"id": 10, "name": "גינה", "type": "park", "latitude": 31.2501, "longitude": 34.7901,
+           "description": None, "address": None, "tags": None}
+    client.post("/poi", json=poi)
+    assert names(client.get(f"{TILE}?layers=park,school")) == ["בית ספר", "גינה", "גן העיר"]
+
+    client.put("/poi/10", json={**poi, "type": "school"})
+    assert names(client.get(f"{TILE}?layers=park")) == ["גן העיר"]
+    assert names(client.get(f"{TILE}?layers=school")) == ["בית ספר", "גינה"]
+
+    client.delete("/poi/10")
+    assert names(client.get(f"{TILE}?layers=school")) == ["בית ספר"]
+
+
+def test_invalid_tile(client, test_db):
+    assert client.get("/map/tiles/2/4/0?layers=park").status_code == 400
+    assert client.get("/map/tiles/23/0/0?layers=park").status_code == 400
+    assert client.get(f"{TILE}").status_code == 422
+
+
+def test_map_pois_reuses_encoded_layers(client, test_db, monkeypatch):
+    from utils import poi_layers
+    encoded = []
+    original = poi_layers.poi_to_feature
+    monkeypatch.setattr(poi_layers, "poi_to_feature", lambda poi, *args: encoded.append(poi.type) or original(poi, *args))
+
+    first = client.post("/map/pois", json={"layers": ["park", "school"]})
+    assert sorted(encoded) == ["park", "park", "school"]
+    assert [f["properties"]["name"] for f in first.json()["features"]] == ["גן העיר", "פארק רחוק", "בית ספר"]
+
+    encoded.clear()
+    resp, queries = count_queries(lambda: client.post("/map/pois", json={"layers": ["school", "park", "park"]}))
+    assert encoded == [] and queries == 0
+    assert [f["properties"]["name"] for f in resp.json()["features"]] == ["בית ספר", "גן העיר", "פארק רחוק"]
+
+    # Only the changed layer is encoded again
+    client.post("/poi", json={"id": 10, "name": "גינה", "type": "park", "latitude": 31.2, "longitude": 34.7,
+                              "description": None, "address": None, "tags": None})
+    resp = client.post("/map/pois", json={"layers": ["park", "school"]})
+    assert sorted(encoded) == ["park", "park", "park"]
+    assert len(resp.json()["features"]) == 4
+
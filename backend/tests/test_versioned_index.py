@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Base
+from utils import versions
+from utils.versioned_index import VersionedIndex
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A file database, so the rebuild thread gets a connection of its own
+    engine = create_engine(f"sqlite:///{tmp_path}/index.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+class Builder:
+    """Builds the list of versions it was built at; blocks while `gate` is unset"""
+
+    def __init__(self):
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, db):
+        self.calls += 1
+        self.gate.wait(5)
+        return [versions.current(db, "pois")[0]]
+
+
+def wait_for_rebuild(index):
+    for thread in threading.enumerate():
+        if thread.name == f"{index.name}-rebuild":
+            thread.join(5)
+
+
+def test_stale_index_is_served_while_one_rebuild_runs(session_factory):
+    build = Builder()
+    index = VersionedIndex("test", ("pois",), build, background=True)
+    db = session_factory()
+    assert index.get(db) == [0]
+
+    versions.bump(db, "pois")
+    build.gate.clear()
+    assert index.get(db) == [0]
+    assert index.get(db) == [0]
+    build.gate.set()
+    wait_for_rebuild(index)
+    assert index.get(db) == [1]
+    assert build.calls == 2
+    assert index.build_seconds is not None
+    db.close()
+
+
+def test_changes_are_applied_in_place(session_factory):
+    build = Builder()
+    index = VersionedIndex("test", ("pois",), build, background=False)
+    db = session_factory()
+    built = index.get(db)
+
+    versions.bump(db, "pois")
+    index.apply(db, "pois", lambda i: i.append("applied"))
+    assert index.get(db) is built
+    assert built == [0, "applied"]
+
+    # Two bumps, one applied: the missed one makes get() rebuild
+    versions.bump(db, "pois")
+    versions.bump(db, "pois")
+    index.apply(db, "pois", lambda i: i.append("skipped"))
+    assert index.get(db) == [3]
+    assert build.calls == 2
+    db.close()
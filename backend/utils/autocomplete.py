@@ -0,0 +1,270 @@
+"""
+In-memory prefix index for /autocomplete.
+
+Entries are POI names, ad addresses (one entry per distinct address, its
+popularity the number of ads there) and addresses the geocoder has
+returned (utils.geocode_cache, popularity the number of lookups that
+returned them). Every word-suffix of an entry's normalized name is a key
+in one sorted list, so a prefix is a bisect range and "הנגב" finds
+"קניון הנגב". Results are ranked by source, popularity and whether the
+prefix starts the name.
+
+The index is built from the DB at startup (warm) or on first use and
+kept current incrementally: the write endpoints report their changes
+right after bumping the table's version. A version that moved by
+anything else (another process, fetch_pois.py, deleting a user) means a
+change was missed; the index is then rebuilt in a background thread
+while the previous one keeps answering (utils.versioned_index).
+"""
+import heapq
+import json
+import math
+from bisect import bisect_left
+from collections import namedtuple
+
+import models
+from utils.hebrew import normalize
+from utils.versioned_index import VersionedIndex
+
+# Rank = source weight + log(1 + popularity) + NAME_START_BONUS if the prefix starts the name
+SOURCE_WEIGHTS = {"poi": 3.0, "ad": 2.0, "geocoding": 1.0}
+NAME_START_BONUS = 1.0
+MAX_WORDS = 6
+MAX_LIMIT = 50
+# Best results are remembered for prefixes matching more keys than this
+MEMO_MIN_MATCHES = 500
+
+Entry = namedtuple("Entry", "name type latitude longitude address source popularity")
+VERSIONED = ("pois", "ads")
+
+
+def entry_keys(name):
+    """Normalized word-suffixes of a name, the full name first"""
+    words = normalize(name).split()[:MAX_WORDS]
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def rank(entry, at_start):
+    return SOURCE_WEIGHTS[entry.source] + math.log1p(entry.popularity) + (NAME_START_BONUS if at_start else 0.0)
+
+
+class PrefixIndex:
+    """
+    Sorted word-suffix keys of every entry, with the best (entry id, rank)
+    pairs remembered for each prefix matching more than MEMO_MIN_MATCHES
+    keys. The remembered lists are built bottom-up when the index is
+    created (a prefix merges its busy children's lists and scans the rest)
+    and patched on every change, so no query scans a large range.
+    """
+
+    def __init__(self, entries=()):
+        """entries: (entry id, Entry) pairs"""
+        self.entries = {}
+        pairs = []
+        for entry_id, entry in entries:
+            self.entries[entry_id] = entry
+            pairs.extend((key, i == 0, entry_id) for i, key in enumerate(entry_keys(entry.name)))
+        pairs.sort(key=lambda pair: pair[0])
+        self.keys = [key for key, _, _ in pairs]
+        self.starts = [at_start for _, at_start, _ in pairs]
+        self.ids = [entry_id for _, _, entry_id in pairs]
+        self._memo = {}
+        self._top("")
+
+    def _order(self, pair):
+        return -pair[1], self.entries[pair[0]].name
+
+    def _top(self, prefix, lo=None, hi=None):
+        """Best (entry id, rank) pairs among the keys starting with prefix"""
+        if lo is None:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        ranks = {}
+
+        def offer(entry_id, score):
+            if score > ranks.get(entry_id, -1.0):
+                ranks[entry_id] = score
+
+        i = lo
+        while i < hi:
+            if len(self.keys[i]) == len(prefix):
+                offer(self.ids[i], rank(self.entries[self.ids[i]], self.starts[i]))
+                i += 1
+                continue
+            child = self.keys[i][:len(prefix) + 1]
+            end = bisect_left(self.keys, child + "\uffff", i, hi)
+            if end - i > MEMO_MIN_MATCHES:
+                best = self._memo.get(child)
+                for entry_id, score in best if best is not None else self._top(child, i, end):
+                    offer(entry_id, score)
+            else:
+                for j in range(i, end):
+                    offer(self.ids[j], rank(self.entries[self.ids[j]], self.starts[j]))
+            i = end
+        best = heapq.nsmallest(MAX_LIMIT, ranks.items(), key=self._order)
+        if hi - lo > MEMO_MIN_MATCHES:
+            self._memo[prefix] = best
+        return best
+
+    def _remembered(self, name):
+        """Prefixes of name's keys with a remembered list"""
+        prefixes = {key[:end] for key in entry_keys(name) for end in range(len(key) + 1)}
+        return [prefix for prefix in prefixes if prefix in self._memo]
+
+    def put(self, entry_id, entry):
+        old = self.entries.get(entry_id)
+        if old is not None and (old.name != entry.name or rank(entry, False) < rank(old, False)):
+            self.remove(entry_id)
+            old = None
+        self.entries[entry_id] = entry
+        keys = entry_keys(entry.name)
+        if old is None:
+            for i, key in enumerate(keys):
+                at = bisect_left(self.keys, key)
+                self.keys.insert(at, key)
+                self.starts.insert(at, i == 0)
+                self.ids.insert(at, entry_id)
+        for i, key in enumerate(keys):
+            score = rank(entry, i == 0)
+            for end in range(len(key) + 1):
+                best = self._memo.get(key[:end])
+                if best is None or (len(best) == MAX_LIMIT and self._order((entry_id, score)) >= self._order(best[-1])):
+                    continue
+                best = [pair for pair in best if pair[0] != entry_id or pair[1] > score]
+                if all(pair[0] != entry_id for pair in best):
+                    best.append((entry_id, score))
+                    best.sort(key=self._order)
+                self._memo[key[:end]] = best[:MAX_LIMIT]
+
+    def remove(self, entry_id):
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return
+        for key in entry_keys(entry.name):
+            at = bisect_left(self.keys, key)
+            while self.ids[at] != entry_id:
+                at += 1
+            del self.keys[at], self.starts[at], self.ids[at]
+        # Lists it was in lose a member they cannot replace; rebuild them, longest prefix first
+        stale = [prefix for prefix in self._remembered(entry.name)
+                 if any(pair[0] == entry_id for pair in self._memo[prefix])]
+        for prefix in stale:
+            del self._memo[prefix]
+        del self.entries[entry_id]
+        for prefix in sorted(stale, key=len, reverse=True):
+            self._top(prefix)
+
+    def bump(self, entry_id, make_entry, delta):
+        """Change an entry's popularity by delta, creating it with make_entry() or dropping it at 0"""
+        entry = self.entries.get(entry_id)
+        popularity = (entry.popularity if entry else 0) + delta
+        if popularity <= 0:
+            self.remove(entry_id)
+        else:
+            self.put(entry_id, (entry or make_entry())._replace(popularity=popularity))
+
+    def search(self, prefix, limit=10):
+        """Best entries with a name word starting with prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        best = self._memo.get(prefix)
+        if best is None:
+            best = self._top(prefix)
+        return [self.entries[entry_id] for entry_id, _ in best[:limit]]
+
+
+def load_entries(db):
+    """(entry id, Entry) for everything in the DB"""
+    P = models.POI
+    for poi_id, name, poi_type, lat, lon, address in db.query(P.id, P.name, P.type, P.latitude, P.longitude, P.address):
+        if name:
+            yield ("poi", poi_id), Entry(name, poi_type, lat, lon, address, "poi", 1)
+
+    ads = {}
+    A = models.Ad
+    for address, lat, lon in db.query(A.address, A.latitude, A.longitude):
+        key = normalize(address)
+        if key:
+            known = ads.get(key)
+            ads[key] = known._replace(popularity=known.popularity + 1) if known else ad_entry(address, lat, lon)
+    for key, entry in ads.items():
+        yield ("ad", key), entry
+
+    geocoded = {}
+    G = models.GeocodeCacheEntry
+    for kind, key, result in db.query(G.kind, G.key, G.result):
+        for location in answer_locations(kind, key, json.loads(result)):
+            entry_id = ("geocoding", normalize(location["address"]))
+            known = geocoded.get(entry_id)
+            geocoded[entry_id] = known._replace(popularity=known.popularity + 1) if known else geocoded_entry(location)
+    yield from geocoded.items()
+
+
+def ad_entry(address, lat, lon, popularity=1):
+    return Entry(address, "address", lat, lon, address, "ad", popularity)
+
+
+def geocoded_entry(location, popularity=1):
+    return Entry(location["address"], "address", location["latitude"], location["longitude"],
+                 location["address"], "geocoding", popularity)
+
+
+def answer_locations(kind, key, answer):
+    """A geocode_cache answer as [{"address", "latitude", "longitude"}]"""
+    if not answer:
+        return []
+    if kind == "reverse":
+        lat, lon = (float(v) for v in key.split(","))
+        return [{"address": answer, "latitude": lat, "longitude": lon}]
+    return answer
+
+
+def build(db):
+    return PrefixIndex(load_entries(db))
+
+
+_index = VersionedIndex("autocomplete", VERSIONED, build)
+
+
+def get_index(db):
+    """The index; while a change it was not told about is rebuilt, the previous one"""
+    return _index.get(db)
+
+
+def warm(bind):
+    """Build the index in the background, e.g. at startup"""
+    _index.warm(bind)
+
+
+def search(db, q, limit=10):
+    return _index.read(db, lambda index: index.search(q, limit))
+
+
+def poi_saved(db, poi):
+    entry = Entry(poi.name, poi.type, poi.latitude, poi.longitude, poi.address, "poi", 1)
+    _index.apply(db, "pois", lambda index: index.put(("poi", poi.id), entry) if poi.name else index.remove(("poi", poi.id)))
+
+
+def poi_deleted(db, poi_id):
+    _index.apply(db, "pois", lambda index: index.remove(("poi", poi_id)))
+
+
+def ad_saved(db, address, lat, lon):
+    _index.apply(db, "ads", lambda index: index.bump(("ad", normalize(address)), lambda: ad_entry(address, lat, lon), 1))
+
+
+def ad_deleted(db, address):
+    _index.apply(db, "ads", lambda index: index.bump(("ad", normalize(address)), None, -1))
+
+
+def geocoded(kind, key, answer):
+    """Addresses a geocoder lookup has just returned (not versioned: the table only grows)"""
+    def change(index):
+        for location in answer_locations(kind, key, answer):
+            index.bump(("geocoding", normalize(location["address"])), lambda: geocoded_entry(location), 1)
+    _index.update(change)
+
+
+def clear():
+    _index.clear()
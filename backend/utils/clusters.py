@@ -0,0 +1,198 @@
+"""
+Precomputed marker clusters for /ads/clusters (models.AdCluster).
+
+Each zoom level has a square latitude/longitude grid of 2**(zoom + CELL_BITS)
+cells around the globe, i.e. 4x4 cells per web-mercator tile width. A cell
+keeps its ad count, coordinate sums (for the centroid) and min/max price.
+add_ad / remove_ad update the ad's cell at every zoom level, so a query
+reads only the cells in view. add_ad upserts, so requests creating the
+same new cell at once add up instead of colliding.
+"""
+import math
+import threading
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, delete, func, insert, or_, select, tuple_, update
+
+import models
+from utils import upsert
+from utils.spatial import within_bbox
+
+AdCluster = models.AdCluster
+
+MIN_ZOOM = 0
+MAX_ZOOM = 16  # past this the map shows individual markers
+CELL_BITS = 2
+ZOOMS = range(MIN_ZOOM, MAX_ZOOM + 1)
+
+_checked = False
+_lock = threading.Lock()
+
+
+def cell_size(zoom):
+    """Cell edge in degrees"""
+    return 360.0 / 2 ** (zoom + CELL_BITS)
+
+
+def cell_of(zoom, lat, lon):
+    size = cell_size(zoom)
+    return math.floor((lon + 180) / size), math.floor((lat + 90) / size)
+
+
+def cell_bounds(zoom, cell_x, cell_y):
+    """(min_lat, min_lon, max_lat, max_lon) of a cell"""
+    size = cell_size(zoom)
+    return (cell_y * size - 90, cell_x * size - 180, (cell_y + 1) * size - 90, (cell_x + 1) * size - 180)
+
+
+def _cells_of(ad):
+    return [(zoom, *cell_of(zoom, ad.latitude, ad.longitude)) for zoom in ZOOMS]
+
+
+def add_ad(db, ad):
+    """Count a new ad in its cell at every zoom level"""
+    table = AdCluster.__table__
+    statement = upsert.insert(db, table)
+    new = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=["zoom", "cell_x", "cell_y"],
+        set_={
+            "count": table.c.count + new.count,
+            "latitude_sum": table.c.latitude_sum + new.latitude_sum,
+            "longitude_sum": table.c.longitude_sum + new.longitude_sum,
+            "min_price": case((new.min_price < table.c.min_price, new.min_price), else_=table.c.min_price),
+            "max_price": case((new.max_price > table.c.max_price, new.max_price), else_=table.c.max_price),
+        },
+    )
+    db.execute(statement, [
+        {"zoom": zoom, "cell_x": cell_x, "cell_y": cell_y, "count": 1,
+         "latitude_sum": ad.latitude, "longitude_sum": ad.longitude,
+         "min_price": ad.price, "max_price": ad.price}
+        for zoom, cell_x, cell_y in _cells_of(ad)
+    ])
+    db.commit()
+
+
+def remove_ad(db, ad, removing=()):
+    """
+    Take an ad out of its cells, before it is deleted; the caller commits.
+    The counts and sums are decremented in SQL, like add_ad increments
+    them, so concurrent writers don't lose each other's changes. Only a
+    cell whose min or max price was this ad's is re-read from ads, leaving
+    out `removing`: the ids of other ads deleted along with it.
+    """
+    table = AdCluster.__table__
+    keys = _cells_of(ad)
+    in_cells = tuple_(table.c.zoom, table.c.cell_x, table.c.cell_y).in_(keys)
+    db.execute(update(table).where(in_cells).values(
+        count=table.c.count - 1,
+        latitude_sum=table.c.latitude_sum - ad.latitude,
+        longitude_sum=table.c.longitude_sum - ad.longitude,
+    ))
+    db.execute(delete(table).where(in_cells, table.c.count <= 0))
+
+    edges = db.execute(
+        select(table.c.zoom, table.c.cell_x, table.c.cell_y)
+        .where(in_cells, or_(table.c.min_price == ad.price, table.c.max_price == ad.price))
+    ).all()
+    Ad = models.Ad
+    for zoom, cell_x, cell_y in edges:
+        min_lat, min_lon, max_lat, max_lon = cell_bounds(zoom, cell_x, cell_y)
+        min_price, max_price = db.query(func.min(Ad.price), func.max(Ad.price)).filter(
+            Ad.latitude >= min_lat, Ad.latitude < max_lat,
+            Ad.longitude >= min_lon, Ad.longitude < max_lon,
+            Ad.id.notin_({ad.id, *removing}),
+        ).one()
+        if min_price is None:
+            continue  # only ads being deleted are left; their own remove_ad empties the cell
+        db.execute(update(table).where(
+            table.c.zoom == zoom, table.c.cell_x == cell_x, table.c.cell_y == cell_y,
+        ).values(min_price=min_price, max_price=max_price))
+
+
+def rebuild(db):
+    """Recompute every cell from the ads table"""
+    db.query(AdCluster).delete(synchronize_session=False)
+    ads = db.query(models.Ad.latitude, models.Ad.longitude, models.Ad.price).all()
+    if ads:
+        lats, lons, prices = (np.array(column) for column in zip(*ads))
+        rows = []
+        for zoom in ZOOMS:
+            size = cell_size(zoom)
+            cells = np.column_stack((np.floor((lons + 180) / size), np.floor((lats + 90) / size))).astype(np.int64)
+            keys, group = np.unique(cells, axis=0, return_inverse=True)
+            group = group.ravel()
+            counts = np.bincount(group)
+            lat_sums = np.bincount(group, weights=lats)
+            lon_sums = np.bincount(group, weights=lons)
+            min_prices = np.full(len(keys), np.iinfo(np.int64).max)
+            max_prices = np.full(len(keys), np.iinfo(np.int64).min)
+            np.minimum.at(min_prices, group, prices)
+            np.maximum.at(max_prices, group, prices)
+            rows.extend(
+                {"zoom": zoom, "cell_x": int(keys[i, 0]), "cell_y": int(keys[i, 1]), "count": int(counts[i]),
+                 "latitude_sum": float(lat_sums[i]), "longitude_sum": float(lon_sums[i]),
+                 "min_price": int(min_prices[i]), "max_price": int(max_prices[i])}
+                for i in range(len(keys))
+            )
+        db.execute(insert(AdCluster), rows)
+    db.commit()
+
+
+def ensure_built(db):
+    """
+    Rebuild once per process if the cells don't account for every ad, e.g.
+    for ads written outside the API or a database that predates the table.
+    """
+    global _checked
+    if _checked:
+        return
+    clustered = db.query(func.sum(AdCluster.count)).filter(AdCluster.zoom == MIN_ZOOM).scalar() or 0
+    if clustered != db.query(func.count(models.Ad.id)).scalar():
+        rebuild(db)
+    with _lock:
+        _checked = True
+
+
+def visible_cells(db, zoom, min_lat, min_lon, max_lat, max_lon):
+    """The non-empty cells of `zoom` that intersect the bounding box"""
+    min_x, min_y = cell_of(zoom, min_lat, min_lon)
+    max_x, max_y = cell_of(zoom, max_lat, max_lon)
+    return db.query(AdCluster).filter(
+        AdCluster.zoom == zoom,
+        AdCluster.cell_x.between(min_x, max_x),
+        AdCluster.cell_y.between(min_y, max_y),
+    ).all()
+
+
+def _cell_index(db, degrees, size):
+    """floor(degrees / size) in SQL, for non-negative degrees"""
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite's floor() needs the optional math functions; the cast truncates, the same here
+        return cast(degrees / size, Integer)
+    return cast(func.floor(degrees / size), Integer)
+
+
+def best_scores(db, user_id, zoom, cells):
+    """(cell_x, cell_y) -> the user's best score among the ads of each cell, grouped in SQL"""
+    if not cells:
+        return {}
+    min_lat = min(cell_bounds(zoom, c.cell_x, c.cell_y)[0] for c in cells)
+    min_lon = min(cell_bounds(zoom, c.cell_x, c.cell_y)[1] for c in cells)
+    max_lat = max(cell_bounds(zoom, c.cell_x, c.cell_y)[2] for c in cells)
+    max_lon = max(cell_bounds(zoom, c.cell_x, c.cell_y)[3] for c in cells)
+    Ad, Score = models.Ad, models.UserAdScore
+    size = cell_size(zoom)
+    cell_x = _cell_index(db, Ad.longitude + 180, size)
+    cell_y = _cell_index(db, Ad.latitude + 90, size)
+    query = db.query(cell_x, cell_y, func.max(Score.score)).select_from(Ad).join(
+        Score, (Score.ad_id == Ad.id) & (Score.user_id == user_id)
+    )
+    query = within_bbox(query, db, min_lat, min_lon, max_lat, max_lon).group_by(cell_x, cell_y)
+    return {(x, y): score for x, y, score in query}
+
+
+def clear():
+    global _checked
+    with _lock:
+        _checked = False
@@ -0,0 +1,25 @@
+"""Strong ETags and If-None-Match handling for the cacheable read endpoints."""
+import hashlib
+
+from fastapi import Response
+
+
+def make_etag(*parts):
+    """Strong ETag over the parts the response depends on (versions, user, request body)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def matches(request, etag):
+    """True when the request's If-None-Match already names this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag, headers=None):
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
@@ -0,0 +1,128 @@
+"""
+Two-level cache for geocoder answers (models.GeocodeCacheEntry).
+
+Reverse lookups are keyed by the coordinates rounded to REVERSE_DECIMALS
+places (5 decimals is about a metre), forward lookups by the normalized
+query. An answer is kept for GEOCODE_CACHE_TTL seconds: in an in-memory
+LRU for repeated lookups in this process, and in geocode_cache so other
+processes and restarts don't ask the geocoder again. "Not found" answers
+are cached too; geocoder errors are not. A caller that stops waiting
+(the /search deadline) does not lose the answer: the lookup keeps running
+and is stored when it lands. Offline geocoders answer faster than the
+cache would, so they are not cached.
+"""
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from utils import autocomplete
+from utils.hebrew import normalize
+from utils.lru import TTLCache
+
+GeocodeCacheEntry = models.GeocodeCacheEntry
+
+TTL_SECONDS = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+REVERSE_DECIMALS = 5
+
+# (kind, key) -> answer
+answers = TTLCache(maxsize=int(os.getenv("GEOCODE_CACHE_SIZE", "10000")))
+
+_MISSING = object()
+
+# Lookups whose caller stopped waiting, kept referenced until they are stored
+_landing = set()
+
+
+def reverse_key(lat, lon):
+    return f"{lat:.{REVERSE_DECIMALS}f},{lon:.{REVERSE_DECIMALS}f}"
+
+
+def forward_key(query):
+    return normalize(query)
+
+
+def _remember(kind, key, answer, fetched_at):
+    answers.put((kind, key), answer, time.monotonic() + fetched_at + TTL_SECONDS - time.time())
+
+
+def _load(db, kind, key):
+    row = db.query(GeocodeCacheEntry).filter(
+        GeocodeCacheEntry.kind == kind, GeocodeCacheEntry.key == key
+    ).first()
+    if row is None or row.fetched_at + TTL_SECONDS <= time.time():
+        return _MISSING
+    answer = json.loads(row.result)
+    _remember(kind, key, answer, row.fetched_at)
+    return answer
+
+
+def _store(db, kind, key, answer):
+    fetched_at = time.time()
+    _remember(kind, key, answer, fetched_at)
+    autocomplete.geocoded(kind, key, answer)
+    result = json.dumps(answer, ensure_ascii=False)
+    updated = db.query(GeocodeCacheEntry).filter(
+        GeocodeCacheEntry.kind == kind, GeocodeCacheEntry.key == key
+    ).update({"result": result, "fetched_at": fetched_at}, synchronize_session=False)
+    if not updated:
+        try:
+            db.add(GeocodeCacheEntry(kind=kind, key=key, result=result, fetched_at=fetched_at))
+            db.flush()
+        except IntegrityError:
+            # Another process stored the same lookup first
+            db.rollback()
+            return
+    db.commit()
+
+
+async def cached(db, kind, key, fetch):
+    """The answer for (kind, key), awaiting fetch() only when neither level has a fresh one"""
+    answer = answers.get((kind, key), _MISSING)
+    if answer is _MISSING:
+        answer = _load(db, kind, key)
+    if answer is _MISSING:
+        lookup = asyncio.ensure_future(fetch())
+        try:
+            answer = await asyncio.shield(lookup)
+        except asyncio.CancelledError:
+            _landing.add(lookup)
+            lookup.add_done_callback(lambda done: _store_late(db.get_bind(), kind, key, done))
+            raise
+        _store(db, kind, key, answer)
+    return answer
+
+
+def _store_late(bind, kind, key, lookup):
+    """Store the answer of a lookup nobody waits for; the caller's session is closed by now"""
+    _landing.discard(lookup)
+    if lookup.cancelled() or lookup.exception() is not None:
+        return
+    db = Session(bind=bind)
+    try:
+        _store(db, kind, key, lookup.result())
+    finally:
+        db.close()
+
+
+async def reverse(db, lat, lon, geocoder):
+    """Address at (lat, lon) or None; the geocoder is asked for the rounded coordinates"""
+    if geocoder.offline:
+        return await geocoder.reverse(lat, lon)
+    lat, lon = round(lat, REVERSE_DECIMALS), round(lon, REVERSE_DECIMALS)
+    return await cached(db, "reverse", reverse_key(lat, lon), lambda: geocoder.reverse(lat, lon))
+
+
+async def forward(db, query, geocoder):
+    """[{"address", "latitude", "longitude"}] for a free-text query"""
+    if geocoder.offline:
+        return await geocoder.geocode(query)
+    return await cached(db, "forward", forward_key(query), lambda: geocoder.geocode(query))
+
+
+def clear():
+    answers.clear()
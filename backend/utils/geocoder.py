@@ -0,0 +1,97 @@
+"""
+Geocoder calls off the event loop.
+
+The geopy client is blocking, so its calls run in a small thread pool.
+All calls share one RateLimiter (Nominatim's usage policy allows 1 request
+per second), each caller waits at most `timeout` seconds, and callers that
+ask the same question while it is in flight share a single upstream call.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from geopy.exc import GeocoderTimedOut
+
+WORKERS = int(os.getenv("GEOCODER_WORKERS", "4"))
+RATE_LIMIT = float(os.getenv("GEOCODER_RATE_LIMIT", "1"))  # requests per second, 0 for no limit
+TIMEOUT_SECONDS = float(os.getenv("GEOCODER_TIMEOUT", "5"))
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart, across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Wait for the next free slot; False, without taking one, if it would come after deadline"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            if deadline is not None and slot > deadline:
+                return False
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+
+class Geocoder:
+    """Async facade over a geopy geocoder (anything with geocode() and reverse())"""
+
+    def __init__(self, backend, workers=WORKERS, rate=RATE_LIMIT, timeout=TIMEOUT_SECONDS):
+        self.backend = backend
+        # An in-memory backend (utils.local_geocoder) is called inline
+        self.offline = getattr(backend, "offline", False)
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocoder")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _call(self, deadline, method, *args, **kwargs):
+        if not self.limiter.acquire(deadline):
+            raise TimeoutError("geocoder rate limit: no free slot before the deadline")
+        try:
+            return getattr(self.backend, method)(*args, timeout=max(deadline - time.monotonic(), 0.1), **kwargs)
+        except GeocoderTimedOut as e:
+            raise TimeoutError(str(e)) from e
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _run(self, key, method, *args, **kwargs):
+        if self.offline:
+            return getattr(self.backend, method)(*args, **kwargs)
+        with self._lock:
+            future = self._inflight.get(key)
+            created = future is None
+            if created:
+                deadline = time.monotonic() + self.timeout
+                future = self._pool.submit(self._call, deadline, method, *args, **kwargs)
+                self._inflight[key] = future
+        if created:
+            # Outside the lock: the callback runs right here if the call already finished
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # shield: a caller that times out must not cancel the call for the others
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+
+    async def reverse(self, lat, lon):
+        """Address at (lat, lon), or None"""
+        location = await self._run(("reverse", lat, lon), "reverse", (lat, lon), exactly_one=True, language="he")
+        return location.address if location else None
+
+    async def geocode(self, query):
+        """[{"address", "latitude", "longitude"}] for a free-text query"""
+        locations = await self._run(("geocode", query), "geocode", query, exactly_one=False,
+                                    language="he", country_codes=["il"], limit=5)
+        return [
+            {"address": location.address, "latitude": location.latitude, "longitude": location.longitude}
+            for location in locations or []
+        ]
@@ -0,0 +1,49 @@
+"""GeoJSON encoding of POIs for the map endpoints."""
+import orjson
+
+FEATURE_COLLECTION_PREFIX = b'{"type":"FeatureCollection","features":['
+FEATURE_COLLECTION_SUFFIX = b"]}"
+
+
+PROPERTY_FIELDS = ("id", "name", "amenity", "tags")
+
+
+def select_tags(raw, include_tags):
+    """The allowed keys of a tags JSON string; skips decoding when none of them appear in it"""
+    if not raw or not any(f'"{key}"' in raw for key in include_tags):
+        return {}
+    tags = orjson.loads(raw)
+    return {key: tags[key] for key in include_tags if key in tags}
+
+
+def poi_to_feature(poi, fields=None, include_tags=None):
+    """
+    GeoJSON feature of a POI. fields limits the properties (default: all of
+    PROPERTY_FIELDS) and include_tags limits the OSM tags (default: all).
+    """
+    fields = PROPERTY_FIELDS if fields is None else fields
+    properties = {}
+    if "id" in fields:
+        properties["id"] = str(poi.id)
+    if "name" in fields:
+        properties["name"] = poi.name
+    if "amenity" in fields:
+        properties["amenity"] = poi.type  # Using the POI type as amenity for frontend compatibility
+    if "tags" in fields:
+        if include_tags is None:
+            properties["tags"] = orjson.loads(poi.tags) if poi.tags else {}
+        else:
+            properties["tags"] = select_tags(poi.tags, include_tags)
+    return {
+        "type": "Feature",
+        "properties": properties,
+        "geometry": {
+            "type": "Point",
+            "coordinates": [poi.longitude, poi.latitude]
+        }
+    }
+
+
+def feature_collection(fragments):
+    """A FeatureCollection from already-encoded, comma-joined feature fragments"""
+    return FEATURE_COLLECTION_PREFIX + b",".join(f for f in fragments if f) + FEATURE_COLLECTION_SUFFIX
@@ -0,0 +1,30 @@
+"""Normalization of Hebrew (and mixed) text for search."""
+import re
+
+# Niqqud and cantillation marks, without the punctuation that shares the block
+_MARKS = re.compile("[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]")
+# Geresh / gershayim and the ASCII quotes typed in their place: צ׳, צה״ל, ג'ירפה
+_GERESH = re.compile("[\u05F3\u05F4'\"`\u00B4\u2018\u2019\u201C\u201D]")
+_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+_NON_WORD = re.compile(r"[\W_]+")
+# Full (ktiv male) spelling doubles vav and yod: ריינס / רינס
+_DOUBLED = re.compile("([וי])\\1+")
+
+
+def normalize(text):
+    """Lower-case, strip niqqud and geresh, unify final letters and doubled vav/yod, collapse punctuation"""
+    if not text:
+        return ""
+    text = _MARKS.sub("", text.lower())
+    text = _GERESH.sub("", text).translate(_FINALS)
+    text = _NON_WORD.sub(" ", text)
+    return _DOUBLED.sub("\\1", text).strip()
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams of normalized text: each word padded with two spaces in front and one after"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
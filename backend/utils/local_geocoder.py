@@ -0,0 +1,223 @@
+"""
+Offline geocoder over the address points of a local OSM extract.
+
+build() reads addr:housenumber / addr:street / addr:city from the nodes
+and ways of an extract (plus named highways, so streets without numbered
+addresses can be found) into an AddressIndex of flat arrays, which is
+saved to and loaded from a single .npz file. Forward search matches the
+street by exact name and by prefix (a sorted array of normalized names),
+or failing both by trigram similarity; reverse lookup is a KD-tree query.
+
+LocalGeocoder answers with geopy Location objects through geopy's
+geocode() / reverse() signatures, so it drops in for Nominatim behind
+utils.geocoder.Geocoder. Build the index with:
+    python -m utils.local_geocoder israel-latest.osm.pbf addresses.npz --city "באר שבע"
+and set LOCAL_GEOCODER_PATH=addresses.npz.
+"""
+import argparse
+import bisect
+import re
+
+import numpy as np
+from geopy.location import Location
+from scipy.spatial import cKDTree
+
+from utils.hebrew import normalize
+from utils.osm_extract import NodeLocations, iter_elements
+from utils.poi_index import meters_to_chord, to_xyz
+from utils.poi_search import NGramIndex
+
+REVERSE_MAX_DISTANCE_M = 250
+_LEADING_NUMBER = re.compile(r"\d+")
+
+
+def address_rows(path, default_city=""):
+    """(lat, lon, street, housenumber, city) for every address point and named street of an extract"""
+    nodes = NodeLocations()
+    for element in iter_elements(path):
+        if element.kind == "node":
+            nodes.add(element.id, element.lat, element.lon)
+        tags = element.tags
+        street, housenumber = tags.get("addr:street"), tags.get("addr:housenumber", "")
+        if not street:
+            if element.kind != "way" or "highway" not in tags or not tags.get("name"):
+                continue
+            street, housenumber = tags["name"], ""
+        elif not housenumber:
+            continue
+        point = (element.lat, element.lon) if element.kind == "node" else nodes.centroid(element.refs)
+        if point is not None:
+            yield (*point, street, housenumber, tags.get("addr:city") or default_city)
+
+
+def _codes(values):
+    """(vocabulary, int32 code per value)"""
+    vocabulary, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return vocabulary, codes.astype(np.int32).ravel()
+
+
+class AddressIndex:
+    def __init__(self, latitudes, longitudes, housenumbers, street_names, street_cities, streets, cities):
+        """
+        Per address: latitudes, longitudes, housenumbers and streets (code into
+        street_names / street_cities). A street is a (name, city code) pair;
+        cities holds the city names.
+        """
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.housenumbers = housenumbers
+        self.street_names = street_names
+        self.street_cities = street_cities
+        self.streets = streets
+        self.cities = cities
+
+        self.tree = cKDTree(to_xyz(latitudes, longitudes))
+
+        # Addresses grouped by street, in house number order
+        numbers = np.array([int(m.group()) if (m := _LEADING_NUMBER.match(h)) else -1 for h in housenumbers])
+        self.by_street = np.lexsort((numbers, streets))
+        self.street_offsets = np.searchsorted(streets[self.by_street], np.arange(len(street_names) + 1))
+        self.normalized_housenumbers = [normalize(h) for h in housenumbers]
+
+        # Normalized street name -> its street codes (one per city), and the names sorted for prefix search
+        self.streets_by_name = {}
+        for code, name in enumerate(street_names):
+            self.streets_by_name.setdefault(normalize(name), []).append(code)
+        self.sorted_names = sorted(self.streets_by_name)
+        self.name_index = NGramIndex(list(enumerate(self.sorted_names)))
+        self.cities_by_name = {tuple(normalize(city).split()): code for code, city in enumerate(cities) if city}
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        if not rows:
+            raise ValueError("no address points in the extract")
+        lats, lons, street_names, housenumbers, city_names = zip(*rows)
+        cities, city_codes = _codes(city_names)
+        pairs, streets = np.unique(np.column_stack((np.asarray(street_names, dtype=str), city_codes.astype(str))),
+                                   axis=0, return_inverse=True)
+        return cls(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64),
+                   np.asarray(housenumbers, dtype=str), pairs[:, 0], pairs[:, 1].astype(np.int32),
+                   streets.astype(np.int32).ravel(), cities)
+
+    @classmethod
+    def build(cls, path, default_city=""):
+        return cls.from_rows(address_rows(path, default_city))
+
+    def save(self, path):
+        np.savez(path, latitudes=self.latitudes, longitudes=self.longitudes, housenumbers=self.housenumbers,
+                 street_names=self.street_names, street_cities=self.street_cities, streets=self.streets,
+                 cities=self.cities)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[name] for name in ("latitudes", "longitudes", "housenumbers", "street_names",
+                                                  "street_cities", "streets", "cities")))
+
+    def label(self, street, housenumber=""):
+        name = f"{self.street_names[street]} {housenumber}".strip()
+        city = self.cities[self.street_cities[street]]
+        return f"{name}, {city}" if city else name
+
+    def _match_streets(self, text, city, limit):
+        """Street codes for a normalized street name: exact, then prefix, or else similar names"""
+        names = [text] if text in self.streets_by_name else []
+        start = bisect.bisect_left(self.sorted_names, text)
+        for name in self.sorted_names[start:start + limit + 1]:
+            if not name.startswith(text):
+                break
+            if name != text:
+                names.append(name)
+        if not names:
+            names = [self.sorted_names[i] for i, _ in self.name_index.search(text, limit)]
+        codes = [code for name in names for code in self.streets_by_name[name]]
+        if city is not None:
+            codes = [code for code in codes if self.street_cities[code] == city]
+        return codes[:limit]
+
+    def _parse(self, query):
+        """(street text, house number, city code or None) of a normalized query"""
+        words = query.split()
+        housenumber = next((w for w in words if any(c.isdigit() for c in w)), "")
+        if housenumber:
+            words.remove(housenumber)
+        for size in (3, 2, 1):
+            if len(words) > size and tuple(words[-size:]) in self.cities_by_name:
+                return " ".join(words[:-size]), housenumber, self.cities_by_name[tuple(words[-size:])]
+        return " ".join(words), housenumber, None
+
+    def search(self, query, limit=5):
+        """[(label, lat, lon)] best first"""
+        text, housenumber, city = self._parse(normalize(query))
+        if not text:
+            return []
+        addresses, streets = [], []
+        for street in self._match_streets(text, city, limit):
+            members = self.by_street[self.street_offsets[street]:self.street_offsets[street + 1]]
+            if housenumber:
+                numbered = [i for i in members if self.normalized_housenumbers[i] == housenumber]
+                numbered = numbered or [i for i in members if self.normalized_housenumbers[i].startswith(housenumber)]
+                if numbered:
+                    i = numbered[0]
+                    addresses.append((self.label(street, self.housenumbers[i]),
+                                      float(self.latitudes[i]), float(self.longitudes[i])))
+                    continue
+            # The street itself, at its middle address
+            i = members[len(members) // 2]
+            streets.append((self.label(street), float(self.latitudes[i]), float(self.longitudes[i])))
+        # Streets only when no street has the house number
+        return (addresses or streets)[:limit]
+
+    def nearest(self, lat, lon, max_distance_m=REVERSE_MAX_DISTANCE_M):
+        """(label, lat, lon) of the closest address point, or None past max_distance_m"""
+        _, i = self.tree.query(to_xyz([lat], [lon])[0], distance_upper_bound=meters_to_chord(max_distance_m))
+        if i == len(self.latitudes):
+            return None
+        return self.label(self.streets[i], self.housenumbers[i]), float(self.latitudes[i]), float(self.longitudes[i])
+
+
+class LocalGeocoder:
+    """geopy-compatible geocode() / reverse() over an AddressIndex"""
+
+    # Answers come from memory: no rate limit, thread pool or cache needed
+    offline = True
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def load(cls, path):
+        return cls(AddressIndex.load(path))
+
+    @staticmethod
+    def _location(label, lat, lon):
+        return Location(label, (lat, lon), {"display_name": label, "lat": lat, "lon": lon})
+
+    def geocode(self, query, exactly_one=True, limit=None, **_kwargs):
+        matches = [self._location(*match) for match in self.index.search(query, 1 if exactly_one else limit or 10)]
+        if exactly_one:
+            return matches[0] if matches else None
+        return matches or None
+
+    def reverse(self, query, exactly_one=True, **_kwargs):
+        lat, lon = (float(v) for v in (query.split(",") if isinstance(query, str) else query))
+        match = self.index.nearest(lat, lon)
+        if match is None:
+            return None
+        return self._location(*match) if exactly_one else [self._location(*match)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline geocoder's address index from an OSM extract")
+    parser.add_argument("extract", help=".osm, .osm.gz, .osm.bz2 or .osm.pbf")
+    parser.add_argument("output", help="the .npz file to write")
+    parser.add_argument("--city", default="", help="city for addresses without addr:city")
+    args = parser.parse_args()
+    index = AddressIndex.build(args.extract, args.city)
+    index.save(args.output)
+    print(f"{len(index.latitudes)} addresses on {len(index.street_names)} streets written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
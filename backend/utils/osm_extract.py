@@ -0,0 +1,143 @@
+"""
+Streaming reader for OSM extracts.
+
+.osm XML files (optionally .gz / .bz2 compressed) are read with the
+standard library; .pbf files need the optional osmium package
+(pip install osmium). Nodes and ways are yielded one at a time and never
+kept, except for the compact node coordinate store that way geometry
+needs (NodeLocations).
+"""
+import bz2
+import gzip
+from array import array
+from collections import namedtuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+
+# kind is "node" or "way"; lat/lon are set for nodes, refs (node ids) for ways
+Element = namedtuple("Element", "kind id tags lat lon refs")
+
+
+def iter_elements(path, kinds=("node", "way"), keys=None, ids=None):
+    """
+    The nodes and ways of an extract (or only `kinds` of them), nodes first.
+    With `keys` and/or `ids`, only elements that have one of those tag
+    keys or one of those ids are yielded. For .pbf files this filtering
+    happens inside osmium, far faster than reading every element, and
+    with both given the `keys` matches come before the `ids` ones.
+    """
+    if str(path).endswith(".pbf"):
+        yield from _iter_pbf(path, kinds, keys, ids)
+        return
+    opener = gzip.open if str(path).endswith(".gz") else bz2.open if str(path).endswith(".bz2") else open
+    with opener(path, "rb") as f:
+        yield from _iter_xml(f, kinds, keys, ids)
+
+
+def _wanted(element_id, tags, keys, ids):
+    if keys is None and ids is None:
+        return True
+    return (keys is not None and not keys.isdisjoint(tags)) or (ids is not None and element_id in ids)
+
+
+def _iter_xml(f, kinds=("node", "way"), keys=None, ids=None):
+    keys = None if keys is None else set(keys)
+    events = iterparse(f, events=("start", "end"))
+    _, root = next(events)
+    tags, refs = {}, []
+    for event, elem in events:
+        if event == "start":
+            continue
+        if elem.tag == "tag":
+            tags[elem.get("k")] = elem.get("v")
+        elif elem.tag == "nd":
+            refs.append(int(elem.get("ref")))
+        elif elem.tag in ("node", "way", "relation"):
+            if elem.tag in kinds and _wanted(int(elem.get("id")), tags, keys, ids):
+                if elem.tag == "node":
+                    yield Element("node", int(elem.get("id")), tags, float(elem.get("lat")), float(elem.get("lon")), None)
+                else:
+                    yield Element("way", int(elem.get("id")), tags, None, None, refs)
+            tags, refs = {}, []
+            # Drop the finished element (and its children) from the tree
+            root.clear()
+
+
+def _iter_pbf(path, kinds=("node", "way"), keys=None, ids=None):
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .pbf extracts needs the osmium package: pip install osmium")
+    entities = osmium.osm.osm_entity_bits.NOTHING
+    if "node" in kinds:
+        entities |= osmium.osm.NODE
+    if "way" in kinds:
+        entities |= osmium.osm.WAY
+    if keys is None and ids is None:
+        readers = [osmium.FileProcessor(str(path), entities)]
+    else:
+        # osmium filters can only be chained (and), so "keys or ids" is one read for each
+        readers = []
+        if keys is not None:
+            readers.append(osmium.FileProcessor(str(path), entities).with_filter(osmium.filter.KeyFilter(*keys)))
+        if ids is not None:
+            readers.append(osmium.FileProcessor(str(path), entities).with_filter(osmium.filter.IdFilter(ids)))
+    seen = set()
+    for reader in readers:
+        for obj in reader:
+            kind = "node" if obj.is_node() else "way"
+            if len(readers) > 1:
+                # Elements that both filters let through come once
+                if (kind, obj.id) in seen:
+                    continue
+                if reader is readers[0]:
+                    seen.add((kind, obj.id))
+            # Iterating even an empty tag list is slow in osmium, and most nodes have none
+            tags = {tag.k: tag.v for tag in obj.tags} if len(obj.tags) else {}
+            if kind == "node":
+                location = obj.location
+                if location.valid():
+                    yield Element("node", obj.id, tags, location.lat, location.lon, None)
+            else:
+                yield Element("way", obj.id, tags, None, None, [node.ref for node in obj.nodes])
+
+
+class NodeLocations:
+    """Node id -> (lat, lon) for every node of an extract, in typed arrays (24 bytes per node)"""
+
+    def __init__(self):
+        self._ids = array("q")
+        self._lats = array("d")
+        self._lons = array("d")
+        self._frozen = None
+
+    def add(self, node_id, lat, lon):
+        self._frozen = None
+        self._ids.append(node_id)
+        self._lats.append(lat)
+        self._lons.append(lon)
+
+    def _arrays(self):
+        if self._frozen is None:
+            ids = np.frombuffer(self._ids, dtype=np.int64)
+            lats = np.frombuffer(self._lats, dtype=np.float64)
+            lons = np.frombuffer(self._lons, dtype=np.float64)
+            # Extracts are sorted by id; sort only files that are not
+            if len(ids) > 1 and not np.all(ids[1:] >= ids[:-1]):
+                order = np.argsort(ids, kind="stable")
+                ids, lats, lons = ids[order], lats[order], lons[order]
+            self._frozen = ids, lats, lons
+        return self._frozen
+
+    def centroid(self, refs):
+        """Mean (lat, lon) of the nodes of a way, or None if none of them is in the extract"""
+        ids, lats, lons = self._arrays()
+        if not refs or not len(ids):
+            return None
+        refs = np.asarray(refs, dtype=np.int64)
+        at = np.minimum(np.searchsorted(ids, refs), len(ids) - 1)
+        found = ids[at] == refs
+        if not found.any():
+            return None
+        return float(lats[at[found]].mean()), float(lons[at[found]].mean())
@@ -0,0 +1,21 @@
+import base64
+import json
+
+
+def encode_cursor(sort, key):
+    """Opaque token for the position after `key` in a result set ordered by `sort`"""
+    raw = json.dumps([sort, list(key)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    """Inverse of encode_cursor; raises ValueError for malformed or foreign tokens"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if cursor_sort != sort or not isinstance(key, list):
+        raise ValueError("Cursor does not match the requested sort")
+    return tuple(key)
+
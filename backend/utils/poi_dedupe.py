@@ -0,0 +1,90 @@
+"""
+De-duplication of POI rows (utils.poi_loader tuples) before they are loaded.
+
+Overlapping tag filters can match an element more than once, e.g. a
+node tagged both highway=bus_stop and public_transport=platform. OSM
+also often maps one place twice: a stop node next to its platform way,
+or a shop node inside its building.
+
+Within a POI type, a row is dropped when an earlier row has the same
+OSM element, or has the same name within MERGE_DISTANCE_M. Elements
+without a name tag get a placeholder name (UNNAMED_SUFFIX) that says
+nothing about the place, so those rows are only matched by element.
+Points are hashed into cubic cells CELL_SCALE times that size, using
+earth-centred x/y/z in metres. Each row is compared only with same-name
+rows in its own cell, plus the neighbouring cells it lies within
+MERGE_DISTANCE_M of, which are usually none.
+"""
+import math
+import os
+from collections import Counter
+
+from utils.poi_index import EARTH_RADIUS_M
+
+MERGE_DISTANCE_M = float(os.getenv("POI_MERGE_DISTANCE_M", "10"))
+CELL_SCALE = 4
+# fetch_pois.element_row names an element without name/name:he tags "<type name> ללא שם"
+UNNAMED_SUFFIX = " ללא שם"
+
+
+def _xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return (EARTH_RADIUS_M * cos_lat * math.cos(lon),
+            EARTH_RADIUS_M * cos_lat * math.sin(lon),
+            EARTH_RADIUS_M * math.sin(lat))
+
+
+class Deduper:
+    def __init__(self, distance_m=MERGE_DISTANCE_M):
+        self.distance_m = distance_m
+        self._cell_m = distance_m * CELL_SCALE
+        # Squared chord of a distance_m arc: comparing x/y/z distances to it is exact
+        self._max_chord_sq = (2 * EARTH_RADIUS_M * math.sin(distance_m / (2 * EARTH_RADIUS_M))) ** 2
+        self._elements = set()
+        # (type, name, *cell) -> tuple of x/y/z points; tuples of floats are left alone by the GC
+        self._cells = {}
+        self.dropped = Counter()  # POI type -> rows dropped
+
+    def keep(self, row):
+        """False if row duplicates one kept before"""
+        name, poi_type, lat, lon = row[:4]
+        osm_type, osm_id = row[6:8]
+        if osm_id is not None:
+            element = (poi_type, osm_type, osm_id)
+            if element in self._elements:
+                self.dropped[poi_type] += 1
+                return False
+            self._elements.add(element)
+        if self.distance_m <= 0 or name.endswith(UNNAMED_SUFFIX):
+            return True
+
+        key = (poi_type, name)
+        x, y, z = point = _xyz(lat, lon)
+        near = [self._axis(x), self._axis(y), self._axis(z)]
+        for a in near[0]:
+            for b in near[1]:
+                for c in near[2]:
+                    for ox, oy, oz in self._cells.get(key + (a, b, c), ()):
+                        if (x - ox) ** 2 + (y - oy) ** 2 + (z - oz) ** 2 <= self._max_chord_sq:
+                            self.dropped[poi_type] += 1
+                            return False
+        cell = key + (near[0][0], near[1][0], near[2][0])
+        self._cells[cell] = self._cells.get(cell, ()) + (point,)
+        return True
+
+    def _axis(self, v):
+        """The cell index of coordinate v on one axis, then the neighbouring one if v is within distance_m of it"""
+        c = math.floor(v / self._cell_m)
+        offset = v - c * self._cell_m
+        if offset < self.distance_m:
+            return c, c - 1
+        if self._cell_m - offset < self.distance_m:
+            return c, c + 1
+        return (c,)
+
+
+def dedupe(rows, deduper=None):
+    """rows without duplicates, in order; pass a Deduper to read its counts afterwards"""
+    deduper = Deduper() if deduper is None else deduper
+    return (row for row in rows if deduper.keep(row))
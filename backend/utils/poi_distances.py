@@ -0,0 +1,173 @@
+"""
+Precomputed ad -> POI type distances (models.AdPOIDistance).
+
+One row per ad and POI type from fetch_pois.POI_TYPES: the nearest POI,
+its distance in metres, and how many POIs of the type are within 300 m,
+500 m and 1 km. Rows are written for a new ad in create_ad, for the ads
+a POI change can affect after a POI is created, moved or deleted, and for
+everything after fetch_pois_from_osm reloads the pois table.
+"""
+import math
+
+import numpy as np
+from sqlalchemy import insert, or_, select
+
+import fetch_pois
+import models
+from utils import poi_index, upsert
+from utils.poi_index import EARTH_RADIUS_M, POIIndex, chord_to_meters, to_xyz
+from utils.spatial import within_bbox
+
+AdPOIDistance = models.AdPOIDistance
+
+RADII = (300, 500, 1000)
+BATCH_SIZE = 10_000
+# refresh_all reads and writes this many ads at a time (rows: times the POI types)
+ADS_PER_BATCH = 2_000
+
+
+def distance_rows(index, ads, poi_types):
+    """Insert dicts for every (ad, type) pair, computed a type at a time"""
+    if not ads:
+        return []
+    ids = [ad.id for ad in ads]
+    lats = [float("nan") if ad.latitude is None else ad.latitude for ad in ads]
+    lons = [float("nan") if ad.longitude is None else ad.longitude for ad in ads]
+
+    rows = []
+    for poi_type in poi_types:
+        distances, nearest = index.nearest(poi_type, lats, lons)
+        counts = [index.count_within(poi_type, lats, lons, radius).tolist() for radius in RADII]
+        for i, ad_id in enumerate(ids):
+            found = nearest[i] >= 0
+            rows.append({
+                "ad_id": ad_id,
+                "poi_type": poi_type,
+                "nearest_poi_id": int(nearest[i]) if found else None,
+                "distance_m": float(distances[i]) if found else None,
+                "count_300m": counts[0][i],
+                "count_500m": counts[1][i],
+                "count_1000m": counts[2][i],
+            })
+    return rows
+
+
+def _insert(db, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(AdPOIDistance), rows[start:start + BATCH_SIZE])
+
+
+def refresh_ad(db, ad):
+    """Rows for one ad, e.g. right after it was created"""
+    purge_ad(db, ad.id)
+    _insert(db, distance_rows(poi_index.get_index(db), [ad], fetch_pois.POI_TYPES))
+    db.commit()
+
+
+def _around(lat, lon, meters):
+    """(min_lat, min_lon, max_lat, max_lon) of a box holding every point within `meters`"""
+    dlat = math.degrees(meters / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def _upsert(db, rows):
+    statement = upsert.insert(db, AdPOIDistance.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["ad_id", "poi_type"],
+        set_={column: statement.excluded[column] for column in
+              ("nearest_poi_id", "distance_m", "count_300m", "count_500m", "count_1000m")},
+    )
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(statement, rows[start:start + BATCH_SIZE])
+
+
+def affected_ads(db, poi_id, poi_type, points):
+    """
+    The ads whose rows for poi_type a change of one POI at `points` can
+    alter: ads within the largest radius of a point (their counts), ads
+    whose nearest POI it was, and ads that had nothing of the type that
+    close and are nearer to one of the points than to their nearest POI.
+    """
+    Ad = models.Ad
+    columns = db.query(Ad.id, Ad.latitude, Ad.longitude)
+    of_type = columns.join(AdPOIDistance, AdPOIDistance.ad_id == Ad.id).filter(AdPOIDistance.poi_type == poi_type)
+    ads = {}
+    for lat, lon in points:
+        ads.update((ad.id, ad) for ad in within_bbox(columns, db, *_around(lat, lon, RADII[-1])))
+    ads.update((ad.id, ad) for ad in of_type.filter(AdPOIDistance.nearest_poi_id == poi_id))
+
+    far = of_type.add_columns(AdPOIDistance.distance_m).filter(
+        or_(AdPOIDistance.distance_m.is_(None), AdPOIDistance.distance_m > RADII[-1])
+    ).all()
+    if far and points:
+        stored = np.array([np.inf if row.distance_m is None else row.distance_m for row in far])
+        xyz = to_xyz([np.nan if row.latitude is None else row.latitude for row in far],
+                     [np.nan if row.longitude is None else row.longitude for row in far])
+        closer = np.zeros(len(far), dtype=bool)
+        for point in to_xyz(*zip(*points)):
+            closer |= chord_to_meters(np.linalg.norm(xyz - point, axis=1)) < stored
+        ads.update((far[i].id, far[i]) for i in np.flatnonzero(closer))
+    return list(ads.values())
+
+
+def refresh_poi(db, poi_id, poi_type, *points):
+    """
+    Rewrite the rows of the ads around one POI of poi_type, after it was
+    created at, moved between or deleted from `points` ((lat, lon) pairs).
+    Returns the number of ads rewritten.
+    """
+    if poi_type not in fetch_pois.POI_TYPES:
+        return 0
+    points = [(lat, lon) for lat, lon in points if lat is not None and lon is not None]
+    ads = affected_ads(db, poi_id, poi_type, points)
+    _upsert(db, distance_rows(poi_index.get_index(db), ads, [poi_type]))
+    db.commit()
+    return len(ads)
+
+
+def refresh_all(db):
+    """Rebuild the whole table, after the pois table was reloaded"""
+    index = POIIndex.from_db(db)
+    db.query(AdPOIDistance).delete(synchronize_session=False)
+    Ad = models.Ad
+    count, last_id = 0, None
+    while True:
+        query = db.query(Ad.id, Ad.latitude, Ad.longitude).order_by(Ad.id)
+        if last_id is not None:
+            query = query.filter(Ad.id > last_id)
+        ads = query.limit(ADS_PER_BATCH).all()
+        if not ads:
+            break
+        _insert(db, distance_rows(index, ads, fetch_pois.POI_TYPES))
+        count += len(ads) * len(fetch_pois.POI_TYPES)
+        last_id = ads[-1].id
+    db.commit()
+    return count
+
+
+def purge_ad(db, ad_id):
+    db.query(AdPOIDistance).filter(AdPOIDistance.ad_id == ad_id).delete(synchronize_session=False)
+
+
+def purge_user_ads(db, user_id):
+    ad_ids = select(models.Ad.id).where(models.Ad.user_id == user_id)
+    db.query(AdPOIDistance).filter(AdPOIDistance.ad_id.in_(ad_ids)).delete(synchronize_session=False)
+
+
+def for_ad(db, ad):
+    """poi_type -> distances for one ad; ads written outside the API are filled on first read"""
+    rows = db.query(AdPOIDistance).filter(AdPOIDistance.ad_id == ad.id).all()
+    if not rows:
+        refresh_ad(db, ad)
+        rows = db.query(AdPOIDistance).filter(AdPOIDistance.ad_id == ad.id).all()
+    return {
+        row.poi_type: {
+            "nearest_poi_id": row.nearest_poi_id,
+            "distance_m": row.distance_m,
+            "count_300m": row.count_300m,
+            "count_500m": row.count_500m,
+            "count_1000m": row.count_1000m,
+        }
+        for row in rows
+    }
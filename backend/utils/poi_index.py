@@ -0,0 +1,131 @@
+"""
+In-memory nearest-neighbour index over the pois table, one KD-tree per
+POI type. Points are projected to 3D Cartesian (earth-centred) metres,
+where straight-line distance is monotonic in great-circle distance, so
+nearest-neighbour and radius queries are exact at any scale.
+"""
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import models
+from utils import versions
+
+EARTH_RADIUS_M = 6371008.8
+
+# Points per requested layer by distance to its nearest POI, and the cap
+# on the whole proximity component
+PROXIMITY_POINTS = ((300, 5), (500, 3), (1000, 1))
+PROXIMITY_MAX = 20
+
+
+def to_xyz(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lats)
+    return np.column_stack((
+        EARTH_RADIUS_M * cos_lat * np.cos(lons),
+        EARTH_RADIUS_M * cos_lat * np.sin(lons),
+        EARTH_RADIUS_M * np.sin(lats),
+    ))
+
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / (2 * EARTH_RADIUS_M), 1.0))
+
+
+def meters_to_chord(meters):
+    return 2 * EARTH_RADIUS_M * np.sin(np.asarray(meters, dtype=np.float64) / (2 * EARTH_RADIUS_M))
+
+
+class POIIndex:
+    def __init__(self, rows):
+        """rows: (id, type, latitude, longitude) tuples"""
+        by_type = {}
+        for poi_id, poi_type, lat, lon in rows:
+            if lat is None or lon is None:
+                continue
+            by_type.setdefault(poi_type, []).append((poi_id, lat, lon))
+
+        self.trees = {}
+        self.ids = {}
+        for poi_type, points in by_type.items():
+            points = np.array(points, dtype=np.float64)
+            self.trees[poi_type] = cKDTree(to_xyz(points[:, 1], points[:, 2]))
+            self.ids[poi_type] = points[:, 0].astype(np.int64)
+
+    @classmethod
+    def from_db(cls, db):
+        P = models.POI
+        return cls(db.query(P.id, P.type, P.latitude, P.longitude).all())
+
+    def layers(self):
+        return set(self.trees)
+
+    def nearest(self, layer, lats, lons):
+        """(distance in metres, POI id) of the nearest POI of `layer` for each point; inf / -1 when none"""
+        count = len(lats)
+        distances = np.full(count, np.inf)
+        ids = np.full(count, -1, dtype=np.int64)
+        tree = self.trees.get(layer)
+        if tree is None or count == 0:
+            return distances, ids
+        points = to_xyz(lats, lons)
+        valid = np.isfinite(points).all(axis=1)
+        if valid.any():
+            chord, index = tree.query(points[valid])
+            distances[valid] = chord_to_meters(chord)
+            ids[valid] = self.ids[layer][index]
+        return distances, ids
+
+    def count_within(self, layer, lats, lons, radius_m):
+        """Number of POIs of `layer` within radius_m of each point"""
+        counts = np.zeros(len(lats), dtype=np.int64)
+        tree = self.trees.get(layer)
+        if tree is None or len(lats) == 0:
+            return counts
+        points = to_xyz(lats, lons)
+        valid = np.isfinite(points).all(axis=1)
+        if valid.any():
+            counts[valid] = tree.query_ball_point(points[valid], meters_to_chord(radius_m), return_length=True)
+        return counts
+
+    def proximity_scores(self, layers, lats, lons):
+        """Points for being close to the requested layers, capped at PROXIMITY_MAX"""
+        scores = np.zeros(len(lats), dtype=np.int64)
+        for layer in layers:
+            distances, _ = self.nearest(layer, lats, lons)
+            points = np.zeros(len(lats), dtype=np.int64)
+            for radius, value in reversed(PROXIMITY_POINTS):
+                points[distances <= radius] = value
+            scores += points
+        return np.minimum(scores, PROXIMITY_MAX)
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def get_index(db):
+    """
+    The shared index, rebuilt when the pois version has changed. The
+    version is the table_versions counter, so POI changes made by other
+    workers and by fetch_pois.py / import_osm.py are picked up too.
+    """
+    global _index, _index_version
+    (version,) = versions.current(db, "pois")
+    with _lock:
+        index = _index if _index_version == version else None
+    if index is None:
+        index = POIIndex.from_db(db)
+        with _lock:
+            _index, _index_version = index, version
+    return index
+
+
+def clear():
+    global _index, _index_version
+    with _lock:
+        _index, _index_version = None, None
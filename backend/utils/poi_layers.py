@@ -0,0 +1,61 @@
+"""
+Pre-serialized GeoJSON per POI layer for /map/pois.
+
+Each layer's features are encoded once into a comma-joined byte fragment
+and cached; a request concatenates the fragments of its layers. Like the
+tile cache, the key carries the layer's version ("pois:<layer>", bumped by
+the POI CRUD endpoints for the POI's type and by fetch_pois_from_osm for
+every type), so a change to one layer leaves the others cached.
+
+Only the full projection, which the map's default view requests, goes
+in the main cache. Other fields / include_tags combinations come from
+clients, so they get their own small cache and cannot evict it.
+"""
+import os
+
+import orjson
+
+import models
+from utils import versions
+from utils.geojson import poi_to_feature
+from utils.lru import LRUCache
+
+# (layer, layer version) -> encoded features, full projection
+fragments = LRUCache(maxsize=int(os.getenv("LAYER_CACHE_SIZE", "64")))
+# (layer, layer version, fields, include_tags) -> encoded features, any other projection
+projected = LRUCache(maxsize=int(os.getenv("PROJECTED_LAYER_CACHE_SIZE", "8")))
+
+
+def version_name(layer):
+    return f"pois:{layer}"
+
+
+def layer_versions(db, layers):
+    return versions.current(db, *(version_name(layer) for layer in layers))
+
+
+def projection(fields=None, include_tags=None):
+    """Canonical (fields, include_tags) for cache keys and ETags; None keeps everything"""
+    return (
+        None if fields is None else tuple(sorted(set(fields))),
+        None if include_tags is None else tuple(sorted(set(include_tags))),
+    )
+
+
+def layer_fragment(db, layer, layer_version, fields=None, include_tags=None):
+    """Encoded features of one layer; fields / include_tags as returned by projection()"""
+    if fields is None and include_tags is None:
+        cache, key = fragments, (layer, layer_version)
+    else:
+        cache, key = projected, (layer, layer_version, fields, include_tags)
+    fragment = cache.get(key)
+    if fragment is None:
+        pois = db.query(models.POI).filter(models.POI.type == layer).order_by(models.POI.id).yield_per(1000)
+        fragment = b",".join(orjson.dumps(poi_to_feature(poi, fields, include_tags)) for poi in pois)
+        cache.put(key, fragment)
+    return fragment
+
+
+def clear():
+    fragments.clear()
+    projected.clear()
@@ -0,0 +1,98 @@
+"""
+Bulk writes to the pois table (or pois_staging, which has the same
+columns), for fetch_pois_from_osm and the OSM importers.
+
+Rows are plain tuples in COLUMNS order, with no ORM objects and no
+per-row flush. On PostgreSQL (psycopg2) each batch is one COPY through
+the session's own connection. On SQLite each batch is one DB-API
+executemany, and other databases get a Core insert. Everything stays in
+the caller's transaction. name_normalized is filled in here, as
+models.POI does for ORM writes.
+"""
+import io
+import time
+
+from sqlalchemy import insert
+
+import models
+from utils.hebrew import normalize
+
+COLUMNS = ("name", "type", "latitude", "longitude", "address", "tags", "osm_type", "osm_id")
+BATCH_SIZE = 50_000
+
+ALL_COLUMNS = COLUMNS + ("name_normalized",)
+
+
+def _batches(rows, size):
+    # OSM names repeat a lot (bus stops, "... ללא שם"), normalize each once
+    normalized = {}
+    batch = []
+    for row in rows:
+        name = row[0]
+        if name not in normalized:
+            normalized[name] = normalize(name)
+        batch.append(row + (normalized[name],))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_buffer(batch):
+    """Rows in COPY's text format: tab-separated, backslash escapes, None as \\N"""
+    return io.StringIO("".join(
+        "\t".join("\\N" if value is None else str(value).translate(_ESCAPES) for value in row) + "\n"
+        for row in batch
+    ))
+
+
+def _copy(db, table, batch):
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(ALL_COLUMNS)}) FROM STDIN",
+            copy_buffer(batch),
+        )
+    finally:
+        cursor.close()
+
+
+def _executemany(db, table, batch):
+    db.connection().exec_driver_sql(
+        f"INSERT INTO {table.name} ({', '.join(ALL_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in ALL_COLUMNS)})",
+        batch,
+    )
+
+
+def _insert(db, table, batch):
+    db.execute(insert(table), [dict(zip(ALL_COLUMNS, row)) for row in batch])
+
+
+def _writer(db):
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+        return _copy
+    if dialect.name == "sqlite":
+        return _executemany
+    return _insert
+
+
+def load(db, rows, batch_size=BATCH_SIZE, table=None):
+    """Insert rows (tuples in COLUMNS order) without committing; returns (count, seconds)"""
+    table = models.POI.__table__ if table is None else table
+    write = _writer(db)
+    count = 0
+    started = time.perf_counter()
+    for batch in _batches(rows, batch_size):
+        write(db, table, batch)
+        count += len(batch)
+    return count, time.perf_counter() - started
+
+
+def rate(count, seconds):
+    return f"{count} rows in {seconds:.2f}s ({count / seconds if seconds else 0:,.0f} rows/s)"
@@ -0,0 +1,106 @@
+"""
+Refreshing the OSM POIs without emptying the pois table.
+
+A fetch is bulk-loaded into pois_staging first. It is then diffed
+against pois on (type, osm_type, osm_id) and applied in one short
+transaction:
+
+- rows missing from the fetch are deleted (POIs without an OSM id too,
+  as the wholesale reload this replaces did)
+- rows whose fields changed are updated in place, keeping their id
+- new elements are inserted
+
+Unchanged rows are not written. Readers see the old table or the new
+one, never an empty or partly loaded layer. Rows of `keep_types`, e.g.
+types whose Overpass query failed, are left as they are.
+"""
+from sqlalchemy import and_, delete, exists, insert, or_, select, text, update
+
+import models
+from utils import poi_loader
+
+POI = models.POI.__table__
+STAGING = models.POIStaging.__table__
+KEY = ("type", "osm_type", "osm_id")
+FIELDS = ("name", "latitude", "longitude", "address", "tags", "name_normalized")
+
+POSTGRES_DDL = [
+    "ALTER TABLE pois ADD COLUMN IF NOT EXISTS osm_type VARCHAR",
+    "ALTER TABLE pois ADD COLUMN IF NOT EXISTS osm_id BIGINT",
+]
+
+
+def ensure_osm_columns(engine):
+    """Add pois.osm_type/osm_id and pois_staging to databases created before them"""
+    with engine.begin() as connection:
+        if connection.dialect.name == "sqlite":
+            columns = {row[1] for row in connection.execute(text("PRAGMA table_info(pois)"))}
+            for column, sql_type in (("osm_type", "VARCHAR"), ("osm_id", "BIGINT")):
+                if column not in columns:
+                    connection.execute(text(f"ALTER TABLE pois ADD COLUMN {column} {sql_type}"))
+        elif connection.dialect.name == "postgresql":
+            for statement in POSTGRES_DDL:
+                connection.execute(text(statement))
+    for index in POI.indexes:
+        index.create(bind=engine, checkfirst=True)
+    STAGING.create(bind=engine, checkfirst=True)
+
+
+def _same_key(table):
+    return and_(*(STAGING.c[column] == table.c[column] for column in KEY))
+
+
+def _changed():
+    return or_(*(STAGING.c[column].is_distinct_from(POI.c[column]) for column in FIELDS))
+
+
+def _stale(keep_types):
+    """pois rows the fetch does not have"""
+    condition = ~exists().where(_same_key(POI)).correlate(POI)
+    return and_(condition, POI.c.type.notin_(keep_types)) if keep_types else condition
+
+
+def _new():
+    """pois_staging rows pois does not have yet"""
+    return ~exists().where(_same_key(POI)).correlate(STAGING)
+
+
+def _types(db, query):
+    return {poi_type for (poi_type,) in db.execute(query)}
+
+
+def stage(db, rows):
+    """Replace pois_staging with rows (poi_loader tuples) and commit; returns (count, seconds)"""
+    db.execute(delete(STAGING))
+    loaded = poi_loader.load(db, rows, table=STAGING)
+    db.commit()
+    return loaded
+
+
+def apply(db, keep_types=()):
+    """
+    Diff pois_staging into pois in one transaction. Returns
+    ({"deleted", "updated", "inserted"}: row counts, the set of types
+    that changed).
+    """
+    keep_types = list(keep_types)
+    stale = _stale(keep_types)
+    changed = and_(_same_key(POI), _changed())
+    types = (
+        _types(db, select(POI.c.type).where(stale).distinct())
+        | _types(db, select(STAGING.c.type).where(exists().where(changed).correlate(STAGING)).distinct())
+        | _types(db, select(STAGING.c.type).where(_new()).distinct())
+    )
+    counts = {
+        "deleted": db.execute(delete(POI).where(stale)).rowcount,
+        "updated": db.execute(
+            update(POI).where(changed).values({column: STAGING.c[column] for column in FIELDS})
+        ).rowcount,
+        "inserted": db.execute(
+            insert(POI).from_select(KEY + FIELDS, select(*(STAGING.c[column] for column in KEY + FIELDS)).where(_new()))
+        ).rowcount,
+    }
+    db.commit()
+    db.execute(delete(STAGING))
+    db.commit()
+    return counts, types
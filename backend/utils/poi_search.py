@@ -0,0 +1,238 @@
+"""
+Ranked POI name search for /search over pois.name_normalized
+(utils.hebrew.normalize of the name, kept up to date by models.POI).
+
+PostgreSQL: pg_trgm with a GIN index on the normalized column, ranked by
+similarity(). SQLite: an in-process trigram inverted index with the same
+matching and ranking, updated in place by the POI endpoints and rebuilt
+in the background when the pois version moves without them. Both match
+names that are similar to the query (similarity >= SIMILARITY_THRESHOLD,
+pg_trgm's default) or contain it.
+"""
+import heapq
+
+import numpy as np
+from sqlalchemy import bindparam, func, or_, text
+
+import models
+from utils.versioned_index import VersionedIndex
+from utils.hebrew import normalize, trigrams
+
+SIMILARITY_THRESHOLD = 0.3
+BACKFILL_BATCH = 5000
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE pois ADD COLUMN IF NOT EXISTS name_normalized VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_pois_name_trgm ON pois USING GIN (name_normalized gin_trgm_ops)",
+]
+
+# Set once pg_trgm and its index exist; until then PostgreSQL falls back
+# to a LIKE scan of the normalized column
+trgm_ready = False
+
+
+def backfill(connection):
+    """Fill name_normalized for rows written without the ORM (bulk inserts, older databases)"""
+    POI = models.POI.__table__
+    while True:
+        rows = connection.execute(
+            POI.select().with_only_columns(POI.c.id, POI.c.name)
+            .where(POI.c.name_normalized.is_(None)).limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return
+        connection.execute(
+            POI.update().where(POI.c.id == bindparam("poi_id")).values(name_normalized=bindparam("normalized")),
+            [{"poi_id": poi_id, "normalized": normalize(name)} for poi_id, name in rows],
+        )
+
+
+def ensure_search_index(engine):
+    global trgm_ready
+    with engine.begin() as connection:
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            columns = {row[1] for row in connection.execute(text("PRAGMA table_info(pois)"))}
+            if "name_normalized" not in columns:
+                connection.execute(text("ALTER TABLE pois ADD COLUMN name_normalized VARCHAR"))
+        elif dialect == "postgresql":
+            try:
+                with connection.begin_nested():
+                    for statement in POSTGRES_DDL:
+                        connection.execute(text(statement))
+                trgm_ready = True
+            except Exception as e:
+                print(f"pg_trgm search index not installed, POI search will scan: {e}")
+                connection.execute(text(POSTGRES_DDL[1]))
+        backfill(connection)
+
+
+class NGramIndex:
+    """
+    Trigram inverted index over (id, normalized name) rows. Postings hold
+    distinct names, not POIs: OSM names repeat a lot (bus stops, branches
+    of a chain, "... ללא שם"), so a query touches far fewer entries. POIs
+    can be added and removed in place.
+    """
+
+    def __init__(self, rows):
+        self.names = []     # slot -> normalized name
+        self.slots = {}     # normalized name -> slot
+        self.ids = []       # slot -> ids of the POIs with that name
+        self.slot_of = {}   # POI id -> slot
+        self._sizes = np.zeros(0, dtype=np.int32)  # slot -> number of trigrams
+        self._live = np.zeros(0, dtype=np.int32)   # slot -> number of POIs
+        self._postings = {}  # trigram -> sorted slots
+        self._pending = {}   # trigram -> slots added since, merged on the next read
+
+        for poi_id, name in rows:
+            self._add(poi_id, name)
+        self._postings = {gram: np.array(slots, dtype=np.int32) for gram, slots in self._pending.items()}
+        self._pending = {}
+
+    @classmethod
+    def from_db(cls, db):
+        P = models.POI
+        rows = db.query(P.id, P.name_normalized, P.name).all()
+        return cls([(poi_id, normalized if normalized is not None else normalize(name))
+                    for poi_id, normalized, name in rows])
+
+    def _grow(self, size):
+        if size > len(self._sizes):
+            capacity = max(size, 2 * len(self._sizes), 1024)
+            self._sizes = np.concatenate((self._sizes, np.zeros(capacity - len(self._sizes), dtype=np.int32)))
+            self._live = np.concatenate((self._live, np.zeros(capacity - len(self._live), dtype=np.int32)))
+
+    def _add(self, poi_id, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+            self.ids.append([])
+            self._grow(slot + 1)
+            grams = trigrams(name)
+            self._sizes[slot] = len(grams)
+            for gram in grams:
+                self._pending.setdefault(gram, []).append(slot)
+        self.ids[slot].append(poi_id)
+        self.slot_of[poi_id] = slot
+        self._live[slot] += 1
+
+    def add(self, poi_id, name):
+        """Index a new or renamed POI"""
+        self.remove(poi_id)
+        self._add(poi_id, name)
+
+    def remove(self, poi_id):
+        slot = self.slot_of.pop(poi_id, None)
+        if slot is not None:
+            self.ids[slot].remove(poi_id)
+            self._live[slot] -= 1
+
+    def _slots(self, gram):
+        postings = self._postings.get(gram)
+        pending = self._pending.pop(gram, None)
+        if pending:
+            # New slots are numbered after every existing one, so this stays sorted
+            added = np.array(pending, dtype=np.int32)
+            postings = added if postings is None else np.concatenate((postings, added))
+            self._postings[gram] = postings
+        return postings
+
+    def _counts(self, grams):
+        lists = [postings for postings in map(self._slots, grams) if postings is not None]
+        if not lists:
+            return None
+        return np.bincount(np.concatenate(lists), minlength=len(self.names))
+
+    def search(self, query, limit):
+        """[(id, similarity)] best first, ties by id"""
+        query_grams = trigrams(query)
+        counts = self._counts(query_grams)
+        if counts is None:
+            return []
+        docs = np.flatnonzero(counts)
+        docs = docs[self._live[docs] > 0]
+        shared = counts[docs]
+        similarity = shared / (len(query_grams) + self._sizes[docs] - shared)
+        keep = similarity >= SIMILARITY_THRESHOLD
+
+        # Substring matches: the unpadded trigrams of the query must all be
+        # in the name, then the few names that pass are checked directly
+        inner = {word[i:i + 3] for word in query.split() for i in range(len(word) - 2)}
+        if inner:
+            inner_counts = self._counts(inner)
+            if inner_counts is not None:
+                candidates = np.flatnonzero(~keep & (inner_counts[docs] == len(inner)))
+                for i in candidates:
+                    keep[i] = query in self.names[docs[i]]
+
+        docs, similarity = docs[keep], similarity[keep]
+        # Names best first; each brings its POIs, and names tied with the
+        # last one needed may still have smaller ids
+        ranked, cutoff = [], None
+        for i in np.argsort(-similarity, kind="stable"):
+            if cutoff is not None and similarity[i] < cutoff:
+                break
+            ranked.extend((poi_id, float(similarity[i])) for poi_id in heapq.nsmallest(limit, self.ids[docs[i]]))
+            if cutoff is None and len(ranked) >= limit:
+                cutoff = similarity[i]
+        ranked.sort(key=lambda hit: (-hit[1], hit[0]))
+        return ranked[:limit]
+
+
+_index = VersionedIndex("poi_search", ("pois",), NGramIndex.from_db)
+
+
+def get_index(db):
+    """The SQLite index; see utils.versioned_index for when it is rebuilt"""
+    return _index.get(db)
+
+
+def poi_saved(db, poi):
+    """Apply a created or updated POI, right after the pois version was bumped"""
+    name = poi.name_normalized if poi.name_normalized is not None else normalize(poi.name)
+    _index.apply(db, "pois", lambda index: index.add(poi.id, name))
+
+
+def poi_deleted(db, poi_id):
+    _index.apply(db, "pois", lambda index: index.remove(poi_id))
+
+
+def warm(bind):
+    """Build the SQLite index in the background, e.g. at startup"""
+    if bind.dialect.name == "sqlite":
+        _index.warm(bind)
+
+
+def search(db, q, limit):
+    """POIs whose name matches q, best match first, at most `limit`"""
+    query = normalize(q)
+    if not query:
+        return []
+    P = models.POI
+
+    if db.get_bind().dialect.name == "postgresql":
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        contains = P.name_normalized.like(pattern, escape="\\")
+        if trgm_ready:
+            similarity = func.similarity(P.name_normalized, query)
+            return (
+                db.query(P)
+                  .filter(or_(P.name_normalized.op("%")(query), contains))
+                  .order_by(similarity.desc(), P.id)
+                  .limit(limit)
+                  .all()
+            )
+        return db.query(P).filter(contains).order_by(P.id).limit(limit).all()
+
+    ranked = _index.read(db, lambda index: index.search(query, limit))
+    if not ranked:
+        return []
+    by_id = {poi.id: poi for poi in db.query(P).filter(P.id.in_([poi_id for poi_id, _ in ranked]))}
+    return [by_id[poi_id] for poi_id, _ in ranked if poi_id in by_id]
+
+
+def clear():
+    _index.clear()
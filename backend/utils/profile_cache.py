@@ -0,0 +1,52 @@
+import os
+
+import models
+from utils import versions
+from utils.batch_ranking import PreferenceProfile
+from utils.lru import LRUCache
+
+# email -> (user_preferences version, PreferenceProfile or None for users
+# without saved preferences). Entries of an older version are reloaded, so
+# a save handled by another worker or process is seen here too.
+profiles = LRUCache(maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "1024")))
+
+
+def get_profile(db, email):
+    """Compiled preferences for a session email, loaded from the DB only on a cache miss"""
+    (version,) = versions.current(db, "user_preferences")
+    entry = profiles.get(email)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    profile = load_profile(db, email)
+    profiles.put(email, (version, profile))
+    return profile
+
+
+def load_profile(db, email):
+    db_user = db.query(models.Users).filter(models.Users.email == email).first()
+    if not db_user:
+        return None
+    preferences = db.query(models.UserPreferences).filter(
+        models.UserPreferences.user_id == db_user.ID
+    ).first()
+    if not preferences:
+        return None
+    return compile_profile(preferences, db_user.ID)
+
+
+def compile_profile(preferences, user_id):
+    return PreferenceProfile.compile(preferences, user_id=user_id)
+
+
+def store(db, email, profile):
+    """Cache a profile just saved, after the user_preferences version was bumped"""
+    (version,) = versions.current(db, "user_preferences")
+    profiles.put(email, (version, profile))
+
+
+def invalidate(email):
+    profiles.pop(email)
+
+
+def clear():
+    profiles.clear()
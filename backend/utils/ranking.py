@@ -1,5 +1,25 @@
 import json
 
+# Questionnaire feature -> boolean column on models.Ad
+FEATURE_TO_AD_FIELD = {
+    "parking": "has_parking",
+    "elevator": "has_elevator",
+    "balcony": "has_balcony",
+    "garden": "has_garden",
+    "pets_allowed": "pets_allowed",
+    "accessibility": "accessibility"
+}
+
+def parse_rooms(rooms):
+    """Questionnaire rooms answer -> (min, max): "3" -> (3.0, 3.0), "5+" -> (5.0, inf)"""
+    if not rooms:
+        return None
+    text = str(rooms).strip()
+    if text.endswith("+"):
+        return float(text[:-1]), float("inf")
+    value = float(text)
+    return value, value
+
 def score_apartment(ad, preferences):
     score = 0
 
@@ -17,7 +37,8 @@ def score_apartment(ad, preferences):
     print(f"Budget Match: {preferences.budget_min} - {preferences.budget_max}, Price: {ad.price}, Score: {score}")
 
     # Match: rooms
-    if preferences.rooms and float(preferences.rooms) == float(ad.rooms):
+    rooms = parse_rooms(preferences.rooms)
+    if rooms and rooms[0] <= float(ad.rooms) <= rooms[1]:
         score += 10
     print(f"Rooms Match: {preferences.rooms}, Ad Rooms: {ad.rooms}, Score: {score}")
 
@@ -27,17 +48,8 @@ def score_apartment(ad, preferences):
     except json.JSONDecodeError:
             requested_features = []
 
-    feature_to_ad_field = {
-            "parking": "has_parking",
-            "elevator": "has_elevator",
-            "balcony": "has_balcony",
-            "garden": "has_garden",
-            "pets_allowed": "pets_allowed",
-            "accessibility": "accessibility"
-        }
-
     for feature in requested_features:
-        ad_field = feature_to_ad_field.get(feature)
+        ad_field = FEATURE_TO_AD_FIELD.get(feature)
         if ad_field:
             if getattr(ad, ad_field, False):
                 score += 5
@@ -0,0 +1,127 @@
+"""
+Materialized per-user scores (models.UserAdScore).
+
+Rows change only when their inputs do: one ad scored against every
+profile when it is created, one profile against every ad when it is
+saved, and rows purged with their ad or user. /ads reads them with a join.
+Rows are upserted, so requests scoring the same user at once don't
+collide on the (user_id, ad_id) constraint.
+"""
+import threading
+
+from sqlalchemy import and_, select
+
+import models
+from utils.batch_ranking import AdCatalog, PreferenceProfile, star_ratings
+from utils.ranking import calculate_star_rating
+from utils import poi_index, upsert, versions
+
+UserAdScore = models.UserAdScore
+
+# user_id -> (pois version, ads version) when the user's rows were last
+# checked against the ads table by this process
+_synced_users = {}
+_lock = threading.Lock()
+
+
+def _write(db, rows):
+    statement = upsert.insert(db, UserAdScore.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "ad_id"],
+        set_={"score": statement.excluded.score, "stars": statement.excluded.stars},
+    )
+    db.execute(statement, rows)
+
+
+def _insert_catalog_scores(db, profile, ads):
+    if not ads:
+        return
+    scores = AdCatalog(ads).score(profile, poi_index.get_index(db))
+    stars = star_ratings(scores)
+    _write(db, [
+        {"user_id": profile.user_id, "ad_id": ad.id, "score": int(scores[i]), "stars": stars[i]}
+        for i, ad in enumerate(ads)
+    ])
+
+
+def _versions(db):
+    return versions.current(db, "pois", "ads")
+
+
+def rescore_user(db, profile):
+    """Rewrite a user's rows after their preferences were saved"""
+    current = _versions(db)
+    _insert_catalog_scores(db, profile, db.query(models.Ad).all())
+    db.commit()
+    with _lock:
+        _synced_users[profile.user_id] = current
+
+
+def sync_user(db, profile):
+    """
+    Score the ads that have no row for this user yet: ads written by other
+    processes or outside the API, or preferences saved before the table
+    existed. Runs again only once the ads version has moved. Profiles with
+    important_layers are rescored in full instead, whenever the POIs may
+    have changed since their rows were written.
+    """
+    current = _versions(db)
+    synced = _synced_users.get(profile.user_id)
+    if synced == current:
+        return
+    if profile.important_layers and (synced is None or synced[0] != current[0]):
+        rescore_user(db, profile)
+        return
+    missing = (
+        db.query(models.Ad)
+          .outerjoin(UserAdScore, and_(UserAdScore.ad_id == models.Ad.id,
+                                       UserAdScore.user_id == profile.user_id))
+          .filter(UserAdScore.id.is_(None))
+          .all()
+    )
+    if missing:
+        _insert_catalog_scores(db, profile, missing)
+        db.commit()
+    with _lock:
+        _synced_users[profile.user_id] = current
+
+
+def score_new_ad(db, ad):
+    """Score one new ad against every saved preference profile"""
+    rows, seen = [], set()
+    index = poi_index.get_index(db)
+    for preferences in db.query(models.UserPreferences).all():
+        if preferences.user_id in seen:
+            continue
+        seen.add(preferences.user_id)
+        score = PreferenceProfile.compile(preferences).score_ad(ad, index)
+        rows.append({"user_id": preferences.user_id, "ad_id": ad.id,
+                     "score": score, "stars": calculate_star_rating(score)})
+    if rows:
+        _write(db, rows)
+    db.commit()
+
+
+def purge_ad(db, ad_id):
+    db.query(UserAdScore).filter(UserAdScore.ad_id == ad_id).delete(synchronize_session=False)
+
+
+def purge_user(db, user_id):
+    """Drop the user's own rows and every row of the ads they published"""
+    ad_ids = select(models.Ad.id).where(models.Ad.user_id == user_id)
+    db.query(UserAdScore).filter(UserAdScore.ad_id.in_(ad_ids)).delete(synchronize_session=False)
+    db.query(UserAdScore).filter(UserAdScore.user_id == user_id).delete(synchronize_session=False)
+    with _lock:
+        _synced_users.pop(user_id, None)
+
+
+def with_scores(query, user_id, inner=False):
+    """Add the user's (score, stars) columns to an Ad query"""
+    on = and_(UserAdScore.ad_id == models.Ad.id, UserAdScore.user_id == user_id)
+    query = query.join(UserAdScore, on) if inner else query.outerjoin(UserAdScore, on)
+    return query.add_columns(UserAdScore.score, UserAdScore.stars)
+
+
+def clear():
+    with _lock:
+        _synced_users.clear()
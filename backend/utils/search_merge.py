@@ -0,0 +1,39 @@
+"""
+Merging /search results from several sources.
+
+POI hits and geocoded addresses often describe the same place: the mall
+is both a POI "קניון הנגב" and the address "קניון הנגב, שדרות...". A
+result is dropped when an earlier one has the same name (compared up to
+the first comma, after Hebrew normalization) and lies within
+DEDUPE_DISTANCE_M of it, so the first source listed wins.
+"""
+import os
+
+import numpy as np
+
+from utils.hebrew import normalize
+from utils.poi_index import chord_to_meters, to_xyz
+
+DEDUPE_DISTANCE_M = float(os.getenv("SEARCH_DEDUPE_DISTANCE_M", "150"))
+
+
+def name_key(name):
+    return normalize((name or "").split(",")[0])
+
+
+def dedupe(results, distance_m=DEDUPE_DISTANCE_M):
+    """results (dicts with name, latitude, longitude) without near-duplicates, in order"""
+    if not results:
+        return []
+    points = to_xyz([r["latitude"] for r in results], [r["longitude"] for r in results])
+    keys = [name_key(r["name"]) for r in results]
+    kept = []
+    for i, key in enumerate(keys):
+        duplicate = any(
+            keys[j] == key
+            and chord_to_meters(np.linalg.norm(points[i] - points[j])) <= distance_m
+            for j in kept
+        )
+        if not duplicate:
+            kept.append(i)
+    return [results[i] for i in kept]
@@ -0,0 +1,109 @@
+"""
+Spatial index over ads.latitude / ads.longitude.
+
+PostgreSQL: a PostGIS geometry column kept in sync by a trigger, with a
+GiST index. SQLite: an R*Tree virtual table kept in sync by triggers.
+The DDL runs when the ads table is created and again from
+ensure_spatial_index() at startup, for databases created before it existed.
+"""
+from sqlalchemy import and_, column, event, func, literal_column, select, table, text
+
+import models
+
+RTREE_TABLE = "ads_rtree"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    f"DELETE FROM {RTREE_TABLE}",
+    f"INSERT INTO {RTREE_TABLE} SELECT id, latitude, latitude, longitude, longitude FROM ads",
+    f"""CREATE TRIGGER IF NOT EXISTS ads_rtree_insert AFTER INSERT ON ads BEGIN
+        INSERT INTO {RTREE_TABLE} VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ads_rtree_update AFTER UPDATE OF latitude, longitude ON ads BEGIN
+        UPDATE {RTREE_TABLE} SET min_lat = NEW.latitude, max_lat = NEW.latitude,
+            min_lon = NEW.longitude, max_lon = NEW.longitude WHERE id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ads_rtree_delete AFTER DELETE ON ads BEGIN
+        DELETE FROM {RTREE_TABLE} WHERE id = OLD.id;
+    END""",
+]
+
+POSTGIS_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    "ALTER TABLE ads ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)",
+    "UPDATE ads SET geom = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) WHERE geom IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_ads_geom ON ads USING GIST (geom)",
+    """CREATE OR REPLACE FUNCTION ads_set_geom() RETURNS trigger AS $$
+    BEGIN
+        NEW.geom := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS ads_set_geom ON ads",
+    """CREATE TRIGGER ads_set_geom BEFORE INSERT OR UPDATE OF latitude, longitude ON ads
+        FOR EACH ROW EXECUTE FUNCTION ads_set_geom()""",
+]
+
+# Set once the PostGIS column and index exist; until then PostgreSQL
+# falls back to the plain latitude/longitude comparison
+postgis_ready = False
+
+
+def install(connection):
+    global postgis_ready
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+    elif dialect == "postgresql":
+        try:
+            with connection.begin_nested():
+                for statement in POSTGIS_DDL:
+                    connection.execute(text(statement))
+            postgis_ready = True
+        except Exception as e:
+            print(f"PostGIS spatial index not installed, bbox queries will scan: {e}")
+
+
+def ensure_spatial_index(engine):
+    with engine.begin() as connection:
+        install(connection)
+
+
+def _after_create(target, connection, **kw):
+    install(connection)
+
+
+def _before_drop(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DROP TABLE IF EXISTS {RTREE_TABLE}"))
+
+
+event.listen(models.Ad.__table__, "after_create", _after_create)
+event.listen(models.Ad.__table__, "before_drop", _before_drop)
+
+
+def within_bbox(query, db, min_lat, min_lon, max_lat, max_lon):
+    """Restrict an Ad query to a bounding box, through the spatial index when there is one"""
+    exact = and_(
+        models.Ad.latitude.between(min_lat, max_lat),
+        models.Ad.longitude.between(min_lon, max_lon),
+    )
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql" and postgis_ready:
+        envelope = func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)
+        return query.filter(literal_column("ads.geom").op("&&")(envelope), exact)
+
+    if dialect == "sqlite":
+        # R*Tree boxes are stored as float32 rounded outwards, so the exact
+        # comparison stays on to drop the few false positives at the edges
+        rtree = table(RTREE_TABLE, column("id"), column("min_lat"), column("max_lat"),
+                      column("min_lon"), column("max_lon"))
+        hits = select(rtree.c.id).where(
+            rtree.c.max_lat >= min_lat, rtree.c.min_lat <= max_lat,
+            rtree.c.max_lon >= min_lon, rtree.c.min_lon <= max_lon,
+        )
+        return query.filter(models.Ad.id.in_(hits), exact)
+
+    return query.filter(exact)
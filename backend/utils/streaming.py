@@ -0,0 +1,40 @@
+"""
+Chunked JSON responses for the large list endpoints.
+
+Rows come from a server-side cursor (Query.yield_per) and are serialized
+with orjson a chunk at a time, so neither the ORM objects nor the encoded
+body of the whole result set are ever held in memory at once.
+"""
+import orjson
+from fastapi.responses import StreamingResponse
+
+CHUNK_SIZE = 1000
+
+
+def iter_json_array(rows, serialize, prefix=b"[", suffix=b"]", chunk_size=CHUNK_SIZE):
+    """Encode rows as the items of a JSON array, yielding one chunk of items at a time"""
+    yield prefix
+    separator = b""
+    chunk = []
+    for row in rows:
+        chunk.append(orjson.dumps(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield separator + b",".join(chunk)
+            separator, chunk = b",", []
+    if chunk:
+        yield separator + b",".join(chunk)
+    yield suffix
+
+
+def stream_query(db, query, serialize, prefix=b"[", suffix=b"]", chunk_size=CHUNK_SIZE, headers=None):
+    """
+    StreamingResponse for a query. The rows are fetched while the body is
+    sent, so the session is closed here once the last chunk is out.
+    """
+    def body():
+        try:
+            yield from iter_json_array(query.yield_per(chunk_size), serialize, prefix, suffix, chunk_size)
+        finally:
+            db.close()
+
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
@@ -0,0 +1,52 @@
+"""
+Web-mercator (z/x/y) tiles of POIs for /map/tiles.
+
+Each (layer, tile) is encoded once into a fragment of comma-joined GeoJSON
+features and kept in an LRU cache. The cache key carries the version of
+the layer (see utils/poi_layers.py), so a change makes the layer's stale
+entries unreachable and the LRU drops them.
+"""
+import math
+import os
+
+import orjson
+
+import models
+from utils.geojson import poi_to_feature
+from utils.lru import LRUCache
+
+MAX_ZOOM = 22
+
+# (layer, layer version, z, x, y) -> encoded features
+fragments = LRUCache(maxsize=int(os.getenv("TILE_CACHE_SIZE", "4096")))
+
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) in degrees"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360 - 180, lat(y), (x + 1) / n * 360 - 180
+
+
+def layer_fragment(db, layer, z, x, y, layer_version):
+    key = (layer, layer_version, z, x, y)
+    fragment = fragments.get(key)
+    if fragment is None:
+        south, west, north, east = tile_bounds(z, x, y)
+        POI = models.POI
+        # Half-open bounds, so a POI on a tile edge is served by one tile only
+        pois = db.query(POI).filter(
+            POI.type == layer,
+            POI.latitude > south, POI.latitude <= north,
+            POI.longitude >= west, POI.longitude < east,
+        )
+        fragment = b",".join(orjson.dumps(poi_to_feature(poi)) for poi in pois)
+        fragments.put(key, fragment)
+    return fragment
+
+
+def clear():
+    fragments.clear()
@@ -0,0 +1,15 @@
+"""
+INSERT ... ON CONFLICT DO UPDATE for the databases the app runs on, for
+rows that concurrent requests may write at the same time.
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def insert(db, table):
+    """An insert into `table` that supports .on_conflict_do_update() on db's dialect"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"No upsert for {dialect}")
@@ -0,0 +1,124 @@
+"""
+In-process indexes built from the database and kept at the versions of
+the tables they read (utils.versions), for poi_search and autocomplete.
+
+- The first get() builds the index; concurrent callers wait for that one
+  build instead of starting their own.
+- Changes the owner is told about are applied in place (apply()).
+- When a version moves without that (another worker, fetch_pois.py), the
+  previous index keeps being served while a single background thread
+  rebuilds it, and the new one is swapped in when it is done.
+
+Tests set INDEX_REBUILD_IN_BACKGROUND=0, which rebuilds stale indexes
+inside get() instead, so a request always sees the current tables.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from utils import versions
+
+REBUILD_IN_BACKGROUND = os.getenv("INDEX_REBUILD_IN_BACKGROUND", "1") == "1"
+
+
+class VersionedIndex:
+    def __init__(self, name, tables, build, background=None):
+        """build(db) returns a new index over `tables`"""
+        self.name = name
+        self.tables = tuple(tables)
+        self._build = build
+        self.background = REBUILD_IN_BACKGROUND if background is None else background
+        self.build_seconds = None
+        self._index = None
+        self._versions = None
+        self._rebuilding = False
+        # Guards _index/_versions, and the index itself while it is read or changed
+        self._lock = threading.Lock()
+        # One build at a time
+        self._build_lock = threading.Lock()
+
+    def _current(self, db):
+        return dict(zip(self.tables, versions.current(db, *self.tables)))
+
+    def get(self, db):
+        """The index; a stale one while its rebuild runs in the background"""
+        current = self._current(db)
+        with self._lock:
+            index, fresh = self._index, self._versions == current
+        if index is not None and (fresh or self.background):
+            if not fresh:
+                self.rebuild_in_background(db.get_bind())
+            return index
+        with self._build_lock:
+            with self._lock:
+                if self._index is not None and self._versions == current:
+                    return self._index
+            index = self._timed_build(db)
+            with self._lock:
+                self._index, self._versions = index, current
+            return index
+
+    def read(self, db, fn):
+        """fn(index), without changes being applied to it meanwhile"""
+        index = self.get(db)
+        with self._lock:
+            return fn(index)
+
+    def apply(self, db, table, change):
+        """Apply change(index) for a write to `table`, made right after its version was bumped"""
+        (version,) = versions.current(db, table)
+        with self._lock:
+            if self._index is None:
+                return
+            if self._versions[table] + 1 != version:
+                # Missed a change: get() notices the gap and rebuilds
+                return
+            self._versions[table] = version
+            change(self._index)
+
+    def update(self, change):
+        """Apply change(index) to the current index, for data no table version covers"""
+        with self._lock:
+            if self._index is not None:
+                change(self._index)
+
+    def warm(self, bind):
+        """Build in the background ahead of the first request, when rebuilds run there"""
+        if self.background:
+            self.rebuild_in_background(bind)
+
+    def rebuild_in_background(self, bind):
+        """Start a rebuild unless one is running"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, args=(bind,), name=f"{self.name}-rebuild", daemon=True).start()
+
+    def _rebuild(self, bind):
+        db = Session(bind=bind)
+        try:
+            with self._build_lock:
+                current = self._current(db)
+                index = self._timed_build(db)
+            with self._lock:
+                self._index, self._versions = index, current
+        except Exception as e:
+            print(f"{self.name}: index rebuild failed: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._rebuilding = False
+
+    def _timed_build(self, db):
+        started = time.perf_counter()
+        index = self._build(db)
+        self.build_seconds = time.perf_counter() - started
+        print(f"{self.name}: index built in {self.build_seconds:.1f}s")
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._index, self._versions = None, None
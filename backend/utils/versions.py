@@ -0,0 +1,68 @@
+"""
+Per-table version counters for conditional GETs.
+
+Write endpoints bump() the tables they changed; read endpoints build their
+ETags from current(). The counters are stored in table_versions so writers
+in other processes (fetch_pois.py) are seen as well, and mirrored in
+memory: current() reads the table again at most every
+VERSION_REFRESH_SECONDS, so a request answered with 304 normally does not
+touch the DB.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+import models
+
+TableVersion = models.TableVersion
+
+REFRESH_SECONDS = float(os.getenv("VERSION_REFRESH_SECONDS", "5"))
+
+_versions = {}
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def _load(db):
+    global _loaded_at
+    rows = db.query(TableVersion.name, TableVersion.version).all()
+    with _lock:
+        _versions.clear()
+        _versions.update(rows)
+        _loaded_at = time.monotonic()
+
+
+def bump(db, *names):
+    """Increment the counters of the given tables, after their changes were committed"""
+    for name in names:
+        updated = db.execute(
+            update(TableVersion).where(TableVersion.name == name).values(version=TableVersion.version + 1)
+        ).rowcount
+        if not updated:
+            try:
+                db.add(TableVersion(name=name, version=1))
+                db.flush()
+            except IntegrityError:
+                # Another writer created the row first
+                db.rollback()
+                db.execute(update(TableVersion).where(TableVersion.name == name)
+                           .values(version=TableVersion.version + 1))
+        db.commit()
+    _load(db)
+
+
+def current(db, *names):
+    """Version of each table; 0 for tables that were never written"""
+    if _loaded_at is None or time.monotonic() - _loaded_at > REFRESH_SECONDS:
+        _load(db)
+    return tuple(_versions.get(name, 0) for name in names)
+
+
+def clear():
+    global _loaded_at
+    with _lock:
+        _versions.clear()
+        _loaded_at = None